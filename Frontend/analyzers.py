@@ -1,7 +1,17 @@
 import cv2
 import numpy as np
 from PIL import Image
-import mediapipe as mp
+
+
+_eye_cascade = None
+
+
+def _get_eye_cascade():
+    """Loads the Haar eye cascade once instead of on every call."""
+    global _eye_cascade
+    if _eye_cascade is None:
+        _eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
+    return _eye_cascade
 
 
 # Age and Gender Prediction (Demo version)
@@ -31,8 +41,7 @@ def predict_fatigue(image):
     try:
         # Simple eye detection
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
-        eyes = eye_cascade.detectMultiScale(gray, 1.1, 4)
+        eyes = _get_eye_cascade().detectMultiScale(gray, 1.1, 4)
 
         # Simple heuristic based on number of eyes detected
         if len(eyes) >= 2:
@@ -75,6 +84,7 @@ def predict_skin_disease(image):
 def extract_cheek_region(image):
     """Extracts cheek region for skin analysis."""
     try:
+        import mediapipe as mp
         with mp.solutions.face_mesh.FaceMesh(static_image_mode=True) as face_mesh:
             results = face_mesh.process(image)
             if not results.multi_face_landmarks:
@@ -0,0 +1,85 @@
+import io
+import os
+
+import numpy as np
+import requests
+from PIL import Image
+
+
+# Backend URL, e.g. http://localhost:8000. When unset the app analyzes in-process.
+FACE_API_URL = os.getenv("FACE_API_URL")
+
+
+def _encode_image(image: np.ndarray) -> bytes:
+    """Encodes an RGB array as JPEG for upload."""
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+class BackendClient:
+    """Thin client for the FastAPI backend."""
+
+    def __init__(self, base_url: str, timeout: float = 60.0):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        self.timeout = timeout
+
+    def model_status(self) -> dict:
+        response = self.session.get(f"{self.base_url}/health", timeout=self.timeout)
+        if response.status_code == 503:
+            # Still loading models.
+            return {}
+        response.raise_for_status()
+        return response.json().get("models", {})
+
+    def analyze(self, face_image: np.ndarray, skin_image=None) -> dict:
+        """Runs the full backend analysis, including landmarks for drawing."""
+        files = {"face_image": ("face.jpg", _encode_image(face_image), "image/jpeg")}
+        if skin_image is not None:
+            files["skin_image"] = ("skin.jpg", _encode_image(skin_image), "image/jpeg")
+
+        response = self.session.post(
+            f"{self.base_url}/api/analyze",
+            params={"include_landmarks": "true"},
+            files=files,
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        result = response.json()
+
+        skin_condition = result.get("skin_condition")
+        return {
+            "age": result["age"],
+            "gender": result["gender"],
+            "symmetry": result["symmetry"],
+            "fatigue": result["fatigue"],
+            "disease": skin_condition if skin_condition else "Not analyzed",
+        }
+
+
+class LocalAnalyzer:
+    """Runs the demo analyzers in the Streamlit process."""
+
+    def model_status(self) -> dict:
+        return {name: "demo" for name in ("age_model", "gender_model", "fatigue_model", "skin_model")}
+
+    def analyze(self, face_image: np.ndarray, skin_image=None) -> dict:
+        from analyzers import predict_age_gender, predict_fatigue, predict_skin_disease
+        from facial_symmetry import analyze_symmetry
+
+        age, gender = predict_age_gender(face_image)
+        return {
+            "age": age,
+            "gender": gender,
+            "symmetry": analyze_symmetry(face_image),
+            "fatigue": predict_fatigue(face_image),
+            "disease": predict_skin_disease(skin_image) if skin_image is not None else "Not analyzed",
+        }
+
+
+def create_analyzer():
+    """Returns a BackendClient if FACE_API_URL is set, otherwise a LocalAnalyzer."""
+    if FACE_API_URL:
+        return BackendClient(FACE_API_URL)
+    return LocalAnalyzer()
@@ -1,10 +1,17 @@
 import cv2
 import numpy as np
-import mediapipe as mp
 
-# Initialize MediaPipe Face Mesh
-mp_face_mesh = mp.solutions.face_mesh
-face_mesh = mp_face_mesh.FaceMesh(static_image_mode=True, max_num_faces=1, refine_landmarks=True)
+# MediaPipe Face Mesh, built on first use so importing this module is cheap
+_face_mesh = None
+
+
+def _get_face_mesh():
+    """Builds the MediaPipe FaceMesh graph once, on first use."""
+    global _face_mesh
+    if _face_mesh is None:
+        import mediapipe as mp
+        _face_mesh = mp.solutions.face_mesh.FaceMesh(static_image_mode=True, max_num_faces=1, refine_landmarks=True)
+    return _face_mesh
 
 # Landmark indices for symmetry (sample key regions)
 LEFT_POINTS = [33, 159, 145, 61, 78, 95]    # e.g. left eye, cheek, mouth corner
@@ -18,13 +25,22 @@ def analyze_symmetry(image: np.ndarray) -> dict:
     """
     Analyze facial asymmetry and predict possible conditions.
     """
-    results = face_mesh.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    results = _get_face_mesh().process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
     if not results.multi_face_landmarks:
         return {"error": "No face detected."}
 
     landmarks = results.multi_face_landmarks[0].landmark
     h, w = image.shape[:2]
+    result = score_landmarks(landmarks, w, h)
+    # Normalized (x, y, z) per point, reused by draw_landmarks
+    result["landmarks"] = [[lm.x, lm.y, lm.z] for lm in landmarks]
+    return result
 
+
+def score_landmarks(landmarks, w: int, h: int) -> dict:
+    """
+    Asymmetry score and predicted condition from FaceMesh landmarks of a w x h image.
+    """
     # Calculate mirrored distances
     distances = []
     for lp, rp in zip(LEFT_POINTS, RIGHT_POINTS):
@@ -76,20 +92,23 @@ def predict_condition(landmarks, w, h) -> str:
         return "⚠️ Facial Asymmetry Detected "
 
 
-def draw_landmarks(image: np.ndarray) -> np.ndarray:
+def draw_landmarks(image: np.ndarray, landmarks=None) -> np.ndarray:
     """
     Optional utility: return image with face mesh landmarks drawn.
+    Pass the "landmarks" from analyze_symmetry to skip a second FaceMesh pass.
     """
-    results = face_mesh.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-    if results.multi_face_landmarks:
-        mp_drawing = mp.solutions.drawing_utils
-        annotated = image.copy()
-        mp_drawing.draw_landmarks(
-            annotated,
-            results.multi_face_landmarks[0],
-            mp_face_mesh.FACEMESH_TESSELATION,
-            landmark_drawing_spec=None,
-            connection_drawing_spec=mp_drawing.DrawingSpec(color=(0, 255, 0), thickness=1)
-        )
-        return annotated
-    return image
+    import mediapipe as mp
+
+    if landmarks is None:
+        results = _get_face_mesh().process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        if not results.multi_face_landmarks:
+            return image
+        landmarks = [[lm.x, lm.y, lm.z] for lm in results.multi_face_landmarks[0].landmark]
+
+    h, w = image.shape[:2]
+    points = [(int(x * w), int(y * h)) for x, y, _ in landmarks]
+    annotated = image.copy()
+    for start, end in mp.solutions.face_mesh.FACEMESH_TESSELATION:
+        if start < len(points) and end < len(points):
+            cv2.line(annotated, points[start], points[end], (0, 255, 0), 1)
+    return annotated
@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from analyzers import predict_fatigue
+from facial_symmetry import score_landmarks, draw_landmarks
+
+
+class RateMeter:
+    """Events per second over a sliding time window."""
+
+    def __init__(self, window: float = 5.0):
+        self.window = window
+        self._events = deque()
+        self._lock = threading.Lock()
+
+    def mark(self):
+        with self._lock:
+            self._events.append(time.monotonic())
+
+    def rate(self) -> float:
+        now = time.monotonic()
+        with self._lock:
+            while self._events and now - self._events[0] > self.window:
+                self._events.popleft()
+            return len(self._events) / self.window
+
+
+class LiveAnalyzer:
+    """
+    Analyzes webcam frames on a background thread so the video never waits on inference.
+    Only the newest submitted frame is kept; frames that arrive while the worker is busy
+    replace the pending one and are counted as dropped.
+    """
+
+    def __init__(self, fatigue_every: int = 5):
+        # Fatigue uses a Haar cascade and changes slowly, so it runs on every Nth analyzed frame.
+        self.fatigue_every = fatigue_every
+        self.processed = RateMeter()
+        self.dropped = RateMeter()
+        self._pending = None
+        self._result = None
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="live-analysis", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame: np.ndarray):
+        """Hands a BGR frame to the worker, replacing any frame it has not started on."""
+        with self._condition:
+            if self._pending is not None:
+                self.dropped.mark()
+            self._pending = frame
+            self._condition.notify()
+
+    def latest(self):
+        """Most recent result: landmarks, asymmetry score, condition and fatigue, or None."""
+        return self._result
+
+    def stats(self) -> dict:
+        return {
+            "processed_fps": round(self.processed.rate(), 1),
+            "dropped_fps": round(self.dropped.rate(), 1),
+        }
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def _run(self):
+        # Tracking mode: FaceMesh reuses the previous frame's face location instead of
+        # re-running detection on every frame.
+        import mediapipe as mp
+        face_mesh = mp.solutions.face_mesh.FaceMesh(
+            static_image_mode=False, max_num_faces=1, refine_landmarks=True
+        )
+        fatigue = "Unknown"
+        count = 0
+        try:
+            while True:
+                with self._condition:
+                    while self._pending is None and not self._stopped:
+                        self._condition.wait()
+                    if self._stopped:
+                        return
+                    frame, self._pending = self._pending, None
+
+                results = face_mesh.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                if count % self.fatigue_every == 0:
+                    fatigue = predict_fatigue(frame)
+                count += 1
+
+                if results.multi_face_landmarks:
+                    landmarks = results.multi_face_landmarks[0].landmark
+                    h, w = frame.shape[:2]
+                    result = score_landmarks(landmarks, w, h)
+                    result["landmarks"] = [[lm.x, lm.y, lm.z] for lm in landmarks]
+                else:
+                    result = {"asymmetry_score": None, "predicted_condition": "No face", "landmarks": None}
+                result["fatigue"] = fatigue
+                self._result = result
+                self.processed.mark()
+        finally:
+            face_mesh.close()
+
+    def overlay(self, frame: np.ndarray) -> np.ndarray:
+        """Draws the latest result and frame rates onto a BGR frame."""
+        result = self._result
+        annotated = frame
+        lines = []
+        if result is not None:
+            if result["landmarks"] is not None:
+                annotated = draw_landmarks(frame, result["landmarks"])
+            if result["asymmetry_score"] is not None:
+                lines.append(f"Asymmetry: {result['asymmetry_score']:.4f}")
+            lines.append(f"Fatigue: {result['fatigue']}")
+
+        stats = self.stats()
+        lines.append(f"Analyzed: {stats['processed_fps']} fps | Dropped: {stats['dropped_fps']} fps")
+
+        if annotated is frame:
+            annotated = frame.copy()
+        for i, text in enumerate(lines):
+            cv2.putText(annotated, text, (10, 25 + i * 22), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+        return annotated
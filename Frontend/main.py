@@ -6,37 +6,65 @@ from PIL import Image
 import numpy as np
 import cv2
 import os
+import hashlib
 
 # --- Internal imports ---
-from facial_symmetry import analyze_symmetry, draw_landmarks
-from analyzers import predict_age_gender, predict_fatigue, predict_skin_disease
+from facial_symmetry import draw_landmarks
+from client import create_analyzer
+from live_analysis import LiveAnalyzer
 
 # --- Page Config ---
 st.set_page_config(page_title="🧠 Face Health Analyzer", layout="centered")
 st.title("🧠 Face Health Analyzer")
 st.caption("📷 Upload or capture your face to generate a personalized health report.")
 
+# --- Cached resources ---
+@st.cache_resource
+def get_analyzer():
+    """Backend client or in-process analyzer, created once per server."""
+    return create_analyzer()
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_model_status():
+    try:
+        return get_analyzer().model_status()
+    except Exception as e:
+        print(f"Model status error: {e}")
+        return {}
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def run_analysis(face_key, skin_key, _face_image, _skin_image):
+    """Analysis result keyed by image digests; arrays are not hashed."""
+    return get_analyzer().analyze(_face_image, _skin_image)
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def annotate_landmarks(face_key, _face_image, _landmarks):
+    return draw_landmarks(_face_image, _landmarks)
+
+
+def image_key(image):
+    return hashlib.sha1(np.ascontiguousarray(image).tobytes()).hexdigest()
+
+
 # --- Session state ---
 if "captured_image" not in st.session_state:
     st.session_state["captured_image"] = None
+    st.session_state["captured_key"] = None
 if "skin_image" not in st.session_state:
     st.session_state["skin_image"] = None
+    st.session_state["skin_key"] = None
 if "last_report" not in st.session_state:
     st.session_state["last_report"] = None
 
 # --- Model status ---
 st.sidebar.header("Model Status")
-from analyzers import age_model, gender_model, fatigue_model, skin_model
-
-model_status = {
-    "Age Model": "✅ Loaded" if age_model else "❌ Not Loaded",
-    "Gender Model": "✅ Loaded" if gender_model else "❌ Not Loaded",
-    "Fatigue Model": "✅ Loaded" if fatigue_model else "❌ Not Loaded",
-    "Skin Model": "✅ Loaded" if skin_model else "❌ Not Loaded"
-}
-
-for model, status in model_status.items():
-    st.sidebar.write(f"{model}: {status}")
+for model, status in get_model_status().items():
+    label = model.replace("_", " ").title()
+    icon = "✅" if status in ("loaded", "available", "demo") else "❌"
+    st.sidebar.write(f"{label}: {icon} {status.replace('_', ' ').title()}")
 
 # --- Upload face image ---
 st.subheader("🖼️ Upload a face image")
@@ -44,21 +72,38 @@ uploaded_file = st.file_uploader("Upload a frontal face image", type=["jpg", "jp
 if uploaded_file:
     image = Image.open(uploaded_file).convert("RGB")
     st.image(image, caption="Uploaded Image", use_container_width=True)
-    st.session_state["captured_image"] = np.array(image)
+    if st.session_state.get("uploaded_file_id") != uploaded_file.file_id:
+        st.session_state["uploaded_file_id"] = uploaded_file.file_id
+        st.session_state["captured_image"] = np.array(image)
+        st.session_state["captured_key"] = image_key(st.session_state["captured_image"])
 
 # --- Webcam capture ---
 st.markdown("---")
 st.subheader("📷 Or capture from webcam")
+live_mode = st.checkbox("🎥 Live analysis overlay", help="Show landmarks, asymmetry and fatigue on the video")
 
 
 class CaptureProcessor(VideoProcessorBase):
     def __init__(self):
         self.frame = None
+        self.live = False
+        self.analyzer = None
 
     def recv(self, frame: av.VideoFrame) -> av.VideoFrame:
         img = frame.to_ndarray(format="bgr24")
         self.frame = img
-        return frame
+        if not self.live:
+            return frame
+
+        if self.analyzer is None:
+            self.analyzer = LiveAnalyzer()
+        self.analyzer.submit(img)
+        return av.VideoFrame.from_ndarray(self.analyzer.overlay(img), format="bgr24")
+
+    def on_ended(self):
+        if self.analyzer is not None:
+            self.analyzer.stop()
+            self.analyzer = None
 
 
 ctx = webrtc_streamer(
@@ -68,11 +113,18 @@ ctx = webrtc_streamer(
     video_processor_factory=CaptureProcessor,
 )
 
+if ctx.video_processor:
+    ctx.video_processor.live = live_mode
+    if live_mode and ctx.video_processor.analyzer is not None:
+        stats = ctx.video_processor.analyzer.stats()
+        st.caption(f"Analyzed {stats['processed_fps']} fps · dropped {stats['dropped_fps']} fps")
+
 if ctx.video_processor and st.button("📸 Capture Frame"):
     frame = ctx.video_processor.frame
     if frame is not None:
         st.image(frame, caption="Captured Frame", use_container_width=True)
         st.session_state["captured_image"] = frame
+        st.session_state["captured_key"] = image_key(frame)
 
 # --- Upload skin image ---
 st.markdown("---")
@@ -81,63 +133,66 @@ skin_file = st.file_uploader("Upload zoomed-in skin image (optional)", type=["jp
 if skin_file:
     skin_img = Image.open(skin_file).convert("RGB")
     st.image(skin_img, caption="Uploaded Skin Area", use_container_width=True)
-    st.session_state["skin_image"] = np.array(skin_img)
+    if st.session_state.get("skin_file_id") != skin_file.file_id:
+        st.session_state["skin_file_id"] = skin_file.file_id
+        st.session_state["skin_image"] = np.array(skin_img)
+        st.session_state["skin_key"] = image_key(st.session_state["skin_image"])
 
 # --- Generate Report ---
+# Inference only runs on the button click (and is cached per image); every other
+# rerun renders the stored report.
 st.markdown("---")
 if st.session_state["captured_image"] is not None:
     if st.button("🧾 Generate Report"):
-        face_image = st.session_state["captured_image"]
-
-        st.subheader("📊 Analysis Report")
-
-        # Age & Gender
-        with st.spinner("Predicting age and gender..."):
-            age, gender = predict_age_gender(face_image)
-        st.success(f"👤 **Predicted Age:** {age} years | **Gender:** {gender}")
-
-        # Symmetry
-        with st.spinner("Analyzing facial symmetry..."):
-            symmetry = analyze_symmetry(face_image)
-        if "error" in symmetry:
-            st.error(symmetry["error"])
-        else:
-            st.info(f"🔄 **Asymmetry Score:** {symmetry['asymmetry_score']}")
-            st.write(f"🧾 **Condition:** {symmetry['predicted_condition']}")
-
-            # Show landmark visualization
-            st.subheader("Facial Landmarks")
-            annotated_image = draw_landmarks(face_image)
-            st.image(annotated_image, caption="Facial Landmarks Detection", use_container_width=True)
-
-        # Fatigue
-        with st.spinner("Predicting fatigue..."):
-            fatigue = predict_fatigue(face_image)
-        if "Fatigued" in fatigue:
-            st.error(f"😴 **Fatigue Status:** {fatigue}")
-        else:
-            st.success(f"⚡ **Fatigue Status:** {fatigue}")
-
-        # Skin analysis
-        skin_input = st.session_state["skin_image"]
-        if skin_input is not None:
-            with st.spinner("Running skin disease classifier..."):
-                disease = predict_skin_disease(skin_input)
-            if "Normal" in disease or "Uncertain" in disease:
-                st.success(f"✨ **Skin Condition:** {disease}")
-            else:
-                st.warning(f"⚠️ **Detected Skin Condition:** {disease}")
-        else:
-            st.info("No skin image provided. Skin analysis skipped.")
-
-        # Save report to session
-        st.session_state["last_report"] = {
-            "age": age,
-            "gender": gender,
-            "symmetry": symmetry,
-            "fatigue": fatigue,
-            "disease": disease if skin_input is not None else "Not analyzed",
-        }
+        with st.spinner("Analyzing face..."):
+            try:
+                report = run_analysis(
+                    st.session_state["captured_key"],
+                    st.session_state["skin_key"],
+                    st.session_state["captured_image"],
+                    st.session_state["skin_image"],
+                )
+                st.session_state["last_report"] = {**report, "face_key": st.session_state["captured_key"]}
+            except Exception as e:
+                st.error(f"Analysis failed: {e}")
+
+report_data = st.session_state["last_report"]
+if report_data is not None and report_data["face_key"] == st.session_state["captured_key"]:
+    face_image = st.session_state["captured_image"]
+
+    st.subheader("📊 Analysis Report")
+
+    # Age & Gender
+    st.success(f"👤 **Predicted Age:** {report_data['age']} years | **Gender:** {report_data['gender']}")
+
+    # Symmetry
+    symmetry = report_data["symmetry"]
+    if "error" in symmetry:
+        st.error(symmetry["error"])
+    else:
+        st.info(f"🔄 **Asymmetry Score:** {symmetry['asymmetry_score']}")
+        st.write(f"🧾 **Condition:** {symmetry['predicted_condition']}")
+
+        # Show landmark visualization
+        st.subheader("Facial Landmarks")
+        annotated_image = annotate_landmarks(report_data["face_key"], face_image, symmetry.get("landmarks"))
+        st.image(annotated_image, caption="Facial Landmarks Detection", use_container_width=True)
+
+    # Fatigue
+    fatigue = report_data["fatigue"]
+    if "Fatigued" in fatigue:
+        st.error(f"😴 **Fatigue Status:** {fatigue}")
+    else:
+        st.success(f"⚡ **Fatigue Status:** {fatigue}")
+
+    # Skin analysis
+    disease = report_data["disease"]
+    if disease == "Not analyzed":
+        st.info("No skin image provided. Skin analysis skipped.")
+    elif "Normal" in disease or "Uncertain" in disease:
+        st.success(f"✨ **Skin Condition:** {disease}")
+    else:
+        st.warning(f"⚠️ **Detected Skin Condition:** {disease}")
 
 # --- Download Report ---
 if st.session_state["last_report"] is not None:
@@ -1,43 +1,27 @@
 # skin_model_fixer.py
-import cv2
 import numpy as np
-import tensorflow as tf
-from tensorflow.keras.models import Model
-from tensorflow.keras.layers import Input, Lambda
 
 
-def safe_skin_predict(model, img_expanded):
+def skin_input_count(model):
     """
-    Try multiple input formats for the skin disease model until one works.
-    This handles:
-      - Single-input models
-      - Two-input models (same image twice)
-      - Two-input models (original + flipped)
-    If all fail, returns a fallback "normal"-like prediction.
+    Number of image inputs the skin model expects, read once from its signature.
+    Two-input models receive the same image on both inputs.
     """
-    # Try different input formats
-    input_formats = [
-        # Format 1: Single input (most common)
-        lambda: model.predict(img_expanded, verbose=0),
-        # Format 2: Duplicate input
-        lambda: model.predict([img_expanded, img_expanded], verbose=0),
-        # Format 3: Original + flipped
-        lambda: model.predict([img_expanded, np.flip(img_expanded, axis=2)], verbose=0),
-        # Format 4: Try with training=False for batch norm layers
-        lambda: model.predict(img_expanded, verbose=0, steps=1),
-    ]
+    count = len(model.inputs)
+    for model_input in model.inputs:
+        if tuple(model_input.shape[1:]) != tuple(model.inputs[0].shape[1:]):
+            raise ValueError(f"Skin model inputs have mismatched shapes: {[i.shape for i in model.inputs]}")
+    return count
 
-    for i, predict_func in enumerate(input_formats):
-        try:
-            result = predict_func()
-            print(f"✅ Skin prediction successful with format {i + 1}")
-            return result
-        except Exception as e:
-            print(f"❌ Skin prediction format {i + 1} failed: {e}")
-            continue
 
-    # If all formats fail, return a fallback prediction
-    print("⚠️ All skin prediction formats failed, using fallback")
-    fallback = np.zeros((1, 10))
-    fallback[0, -1] = 1.0  # Set "Normal" as the prediction
-    return fallback
\ No newline at end of file
+def safe_skin_predict(model, img_expanded, input_count=None):
+    """
+    Predict with the skin disease model in the input format its signature declares.
+    Pass `input_count` (from `skin_input_count`) to skip re-reading the signature.
+    Errors are raised rather than replaced with a fallback "Normal" prediction.
+    """
+    if input_count is None:
+        input_count = skin_input_count(model)
+
+    inputs = img_expanded if input_count == 1 else [img_expanded] * input_count
+    return model.predict(inputs, verbose=0)
@@ -0,0 +1,208 @@
+"""CPU runtime autotuner.
+
+Runs the /api/analyze analysis graph (decode included) over a grid of
+TensorFlow, OpenCV, executor and worker settings, and writes the best
+one to runtime_config.json, which main.py and inference_server.py read at
+startup. Trials use the face photos in --images, or the face-like synthetic
+images of loadtest.py. Settings are only comparable when the trials detect
+faces (otherwise the age, gender and emotion models never run), so the
+tuner stops if no face is found and reports the face rate of every trial.
+
+    python autotune.py --images samples/ --intra 1,2,4 --inter 1,2 --cv2 0,1 --executor 0,4 --workers 1,2
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Any, List
+
+from runtime_config import DEFAULT_PATH
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def load_images(directory: str) -> List[bytes]:
+    paths = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith((".jpg", ".jpeg", ".png"))
+    )
+    if not paths:
+        raise SystemExit(f"No .jpg or .png images in {directory}")
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    return images
+
+
+def run_trial(settings: Dict[str, Any]):
+    """Runs inside a fresh process so TensorFlow picks up the thread settings."""
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(settings["tf_intra_op_threads"])
+    os.environ["TF_NUM_INTEROP_THREADS"] = str(settings["tf_inter_op_threads"])
+    os.environ["ANALYSIS_THREADS"] = str(settings["analysis_threads"])
+
+    import io
+    import cv2
+    import numpy as np
+    from PIL import Image
+    cv2.setNumThreads(settings["cv2_threads"])
+
+    from loadtest import synthetic_images
+
+    from models.model_loader import ModelLoader
+    from services.face_analysis import FaceAnalysisService
+    from services.health_index import HealthIndexCalculator
+    from services.analysis_graph import build_analysis_graph
+
+    model_loader = ModelLoader()
+    face_service = FaceAnalysisService(model_loader)
+    # The graph /api/analyze runs, with main.py's decode, so trials measure
+    # what the API serves.
+    graph = build_analysis_graph(
+        face_service, HealthIndexCalculator(),
+        lambda data: np.array(Image.open(io.BytesIO(data)).convert("RGB"))
+    )
+
+    if settings["images"]:
+        encoded = load_images(settings["images"])
+    else:
+        encoded = synthetic_images(8, settings["image_size"], settings["seed"])
+
+    def analyze(i: int) -> Dict[str, Any]:
+        start = time.perf_counter()
+        with model_loader.acquire():
+            result, _ = graph.run({"face_data": encoded[i % len(encoded)], "skin_data": None,
+                                   "include_landmarks": False, "deadline": None, "report_id": None})
+        # A detected face is what makes the age, gender and emotion models run.
+        return {"latency": time.perf_counter() - start, "face": result["confidence_scores"].get("age", 0) > 0}
+
+    for i in range(settings["warmup"]):
+        analyze(i)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=settings["concurrency"]) as pool:
+        runs = list(pool.map(analyze, range(settings["requests"])))
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        "latencies": [run["latency"] for run in runs],
+        "faces": sum(run["face"] for run in runs),
+        "elapsed": elapsed
+    }))
+
+
+def measure(settings: Dict[str, Any]) -> Dict[str, Any]:
+    """Starts one trial process per simulated uvicorn worker and combines their results."""
+    trial = {k: v for k, v in settings.items() if k != "uvicorn_workers"}
+    processes = [
+        subprocess.Popen(
+            [sys.executable, __file__, "--trial", json.dumps({**trial, "seed": worker})],
+            stdout=subprocess.PIPE,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        for worker in range(settings["uvicorn_workers"])
+    ]
+
+    latencies, faces, elapsed = [], 0, 0.0
+    for process in processes:
+        output, _ = process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"Trial failed for {settings}")
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        latencies.extend(result["latencies"])
+        faces += result["faces"]
+        elapsed = max(elapsed, result["elapsed"])
+
+    return {
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+        "face_rate": round(faces / len(latencies), 2),
+    }
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Autotune CPU runtime settings for the analysis pipeline")
+    parser.add_argument("--intra", type=_int_list, default=sorted({1, max(1, cpus // 2), cpus}),
+                        help="TensorFlow intra-op thread counts")
+    parser.add_argument("--inter", type=_int_list, default=[1, 2], help="TensorFlow inter-op thread counts")
+    parser.add_argument("--cv2", type=_int_list, default=[0, 1], help="cv2.setNumThreads values")
+    parser.add_argument("--executor", type=_int_list, default=[0, 4], help="ANALYSIS_THREADS values")
+    parser.add_argument("--workers", type=_int_list, default=sorted({1, max(1, cpus // 2)}),
+                        help="uvicorn worker counts")
+    parser.add_argument("--requests", type=int, default=40, help="Timed requests per worker and trial")
+    parser.add_argument("--concurrency", type=int, default=2, help="Requests in flight per worker")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--images", help="Directory of face photos to analyze (default: synthetic faces)")
+    parser.add_argument("--image-size", type=int, default=480, help="Size of the synthetic images")
+    parser.add_argument("--max-p99-ms", type=float, default=None,
+                        help="Only recommend settings whose p99 latency is within this budget")
+    parser.add_argument("--output", default=str(DEFAULT_PATH))
+    parser.add_argument("--trial", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.trial:
+        run_trial(json.loads(args.trial))
+        return
+
+    results = []
+    grid = list(itertools.product(args.intra, args.inter, args.cv2, args.executor, args.workers))
+    for index, (intra, inter, cv2_threads, executor, workers) in enumerate(grid, 1):
+        settings = {
+            "tf_intra_op_threads": intra,
+            "tf_inter_op_threads": inter,
+            "cv2_threads": cv2_threads,
+            "analysis_threads": executor,
+            "uvicorn_workers": workers,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "image_size": args.image_size,
+            "images": os.path.abspath(args.images) if args.images else None,
+        }
+        metrics = measure(settings)
+        if metrics["face_rate"] == 0:
+            raise SystemExit("No face was detected in any trial image, so the age, gender and emotion models "
+                             "never ran and the timings say nothing about real requests. "
+                             "Pass --images with a directory of face photos.")
+        config = {k: settings[k] for k in ("tf_intra_op_threads", "tf_inter_op_threads", "cv2_threads",
+                                           "analysis_threads", "uvicorn_workers")}
+        results.append({"config": config, **metrics})
+        print(f"[{index}/{len(grid)}] {config} -> {metrics['throughput_rps']} req/s, p99 {metrics['p99_ms']} ms, "
+              f"faces {metrics['face_rate']:.0%}")
+
+    eligible = [r for r in results if args.max_p99_ms is None or r["p99_ms"] <= args.max_p99_ms]
+    if not eligible:
+        print(f"No settings met the p99 budget of {args.max_p99_ms} ms; recommending the lowest p99")
+        eligible = [min(results, key=lambda r: r["p99_ms"])]
+    best = max(eligible, key=lambda r: (r["throughput_rps"], -r["p99_ms"]))
+
+    report = {
+        "recommended": best["config"],
+        "measured": {"throughput_rps": best["throughput_rps"], "p50_ms": best["p50_ms"], "p99_ms": best["p99_ms"],
+                     "face_rate": best["face_rate"]},
+        "cpu_count": cpus,
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "trials": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Recommended {best['config']} written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""Offline bulk analysis.
+
+Analyzes every image under a directory (or listed in a manifest) with the same
+FaceAnalysisService and HealthIndexCalculator as the API, across worker
+processes with one batched model call per model and chunk. Results are written
+incrementally to JSONL or Parquet, and a checkpoint file of finished images
+lets an interrupted run resume where it stopped.
+
+    python bulk_analyze.py /data/archive --output results.jsonl
+    python bulk_analyze.py --manifest images.txt --output results.parquet --workers 8
+"""
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, Iterable, Iterator, List
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger("bulk_analyze")
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+# Columns follow the analysis_reports table, plus the source path and any error.
+COLUMNS = [
+    "path", "age", "gender", "fatigue", "emotion", "symmetry_score", "symmetry_condition",
+    "skin_condition", "health_index_score", "health_index_rating", "recommendations",
+    "confidence_scores", "model_version", "error"
+]
+
+
+def iter_directory(root: Path) -> Iterator[str]:
+    for dirpath, _, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            if Path(filename).suffix.lower() in IMAGE_EXTENSIONS:
+                yield str(Path(dirpath) / filename)
+
+
+def iter_manifest(manifest: Path) -> Iterator[str]:
+    """One path per line, or a CSV with a ``path`` column. Relative paths are relative to the manifest."""
+    with open(manifest, newline="") as f:
+        if manifest.suffix.lower() == ".csv":
+            rows = (row["path"] for row in csv.DictReader(f))
+        else:
+            rows = (line.strip() for line in f)
+        for path in rows:
+            if path:
+                yield str((manifest.parent / path) if not os.path.isabs(path) else Path(path))
+
+
+def chunked(items: Iterable[str], size: int) -> Iterator[List[str]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# --- worker process ---
+
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(reader_threads: int):
+    # Stages of one image run sequentially; parallelism comes from the processes.
+    os.environ["ANALYSIS_THREADS"] = "0"
+    from runtime_config import load_runtime_config, apply_runtime_config
+    apply_runtime_config(load_runtime_config())
+
+    from models.model_loader import ModelLoader
+    from services.face_analysis import FaceAnalysisService
+    from services.health_index import HealthIndexCalculator
+
+    model_loader = ModelLoader()
+    _worker["model_loader"] = model_loader
+    _worker["face_service"] = FaceAnalysisService(model_loader)
+    _worker["health_calculator"] = HealthIndexCalculator()
+    _worker["readers"] = ThreadPoolExecutor(max_workers=reader_threads)
+
+
+def _decode(path: str) -> np.ndarray:
+    with Image.open(path) as img:
+        return np.array(img.convert("RGB"))
+
+
+def _to_row(path: str, result: Dict[str, Any], version: str) -> Dict[str, Any]:
+    health_calculator = _worker["health_calculator"]
+    health_index = health_calculator.calculate_health_index(result)
+    symmetry = result.get("symmetry", {})
+    return {
+        "path": path,
+        "age": int(result["age"]),
+        "gender": result["gender"],
+        "fatigue": result["fatigue"],
+        "emotion": result["emotion"],
+        "symmetry_score": float(symmetry.get("asymmetry_score", 0.0)),
+        "symmetry_condition": symmetry.get("predicted_condition", "Unknown"),
+        "skin_condition": result.get("skin_condition"),
+        "health_index_score": float(health_index["overall_score"]),
+        "health_index_rating": health_index["rating"],
+        "recommendations": json.dumps(health_calculator.generate_recommendations(result)),
+        "confidence_scores": json.dumps({k: float(v) for k, v in result["confidence_scores"].items()}),
+        "model_version": version,
+        "error": None
+    }
+
+
+def _error_row(path: str, error: Exception) -> Dict[str, Any]:
+    row = {column: None for column in COLUMNS}
+    row.update(path=path, error=f"{type(error).__name__}: {error}")
+    return row
+
+
+def analyze_chunk(paths: List[str]) -> List[Dict[str, Any]]:
+    face_service = _worker["face_service"]
+    decoded = list(_worker["readers"].map(_safe_decode, paths))
+
+    rows = {}
+    images, image_paths = [], []
+    for path, image in zip(paths, decoded):
+        if isinstance(image, Exception):
+            rows[path] = _error_row(path, image)
+        else:
+            images.append(image)
+            image_paths.append(path)
+
+    with _worker["model_loader"].acquire() as models:
+        try:
+            results = face_service.analyze_batch(images) if images else []
+        except Exception as e:
+            # Isolate the image that broke the batch.
+            logger.warning(f"Batch failed ({e}), analyzing {len(images)} images one at a time")
+            results = []
+            for image in images:
+                try:
+                    results.append(face_service.analyze_complete(image))
+                except Exception as image_error:
+                    results.append(image_error)
+
+        for path, result in zip(image_paths, results):
+            if isinstance(result, Exception):
+                rows[path] = _error_row(path, result)
+            else:
+                rows[path] = _to_row(path, result, models.version)
+
+    return [rows[path] for path in paths]
+
+
+def _safe_decode(path: str):
+    try:
+        return _decode(path)
+    except Exception as e:
+        return e
+
+
+# --- output ---
+
+class JsonlWriter:
+    def __init__(self, path: Path):
+        self.file = open(path, "a")
+
+    def write(self, rows: List[Dict[str, Any]]):
+        for row in rows:
+            self.file.write(json.dumps(row) + "\n")
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """Writes part files into a directory; a resumed run adds new parts."""
+
+    def __init__(self, directory: Path, rows_per_file: int):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            sys.exit("Parquet output requires pyarrow (pip install pyarrow); use a .jsonl output instead")
+
+        self.pa, self.pq = pa, pq
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.rows_per_file = rows_per_file
+        self.schema = pa.schema([
+            ("path", pa.string()), ("age", pa.int32()), ("gender", pa.string()), ("fatigue", pa.string()),
+            ("emotion", pa.string()), ("symmetry_score", pa.float32()), ("symmetry_condition", pa.string()),
+            ("skin_condition", pa.string()), ("health_index_score", pa.float32()),
+            ("health_index_rating", pa.string()), ("recommendations", pa.string()),
+            ("confidence_scores", pa.string()), ("model_version", pa.string()), ("error", pa.string())
+        ])
+        self.run_id = time.strftime("%Y%m%d-%H%M%S")
+        self.part = 0
+        self.buffer: List[Dict[str, Any]] = []
+
+    def write(self, rows: List[Dict[str, Any]]):
+        self.buffer.extend(rows)
+
+    def should_flush(self) -> bool:
+        return len(self.buffer) >= self.rows_per_file
+
+    def flush(self):
+        if not self.buffer:
+            return
+        table = self.pa.Table.from_pylist(self.buffer, schema=self.schema)
+        path = self.directory / f"part-{self.run_id}-{self.part:05d}.parquet"
+        self.pq.write_table(table, str(path) + ".tmp")
+        os.replace(str(path) + ".tmp", path)
+        self.part += 1
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+
+class Checkpoint:
+    """Append-only list of finished paths, written only after their rows are flushed."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.done = set()
+        if path.exists():
+            with open(path) as f:
+                self.done = {line.rstrip("\n") for line in f if line.strip()}
+        self.file = open(path, "a")
+        self.pending: List[str] = []
+
+    def add(self, paths: List[str]):
+        self.pending.extend(paths)
+
+    def commit(self):
+        for path in self.pending:
+            self.file.write(path + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = []
+
+    def close(self):
+        self.file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk face analysis over an image archive")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("directory", nargs="?", type=Path, help="Directory to walk for images")
+    source.add_argument("--manifest", type=Path, help="Text file (one path per line) or CSV with a path column")
+    parser.add_argument("--output", type=Path, required=True,
+                        help="results.jsonl, or results.parquet (a directory of part files)")
+    parser.add_argument("--checkpoint", type=Path, help="Defaults to <output>.checkpoint")
+    # Every worker loads a full model set, so default to what autotune.py
+    # found for uvicorn workers (the same memory trade-off), else 2.
+    from runtime_config import load_runtime_config
+    parser.add_argument("--workers", type=int, default=int(load_runtime_config().get("uvicorn_workers", 2)),
+                        help="Worker processes, each with its own models (default: uvicorn_workers "
+                             "from runtime_config.json, else 2)")
+    parser.add_argument("--batch-size", type=int, default=16, help="Images per batched model call")
+    parser.add_argument("--reader-threads", type=int, default=4, help="Image decoding threads per worker")
+    parser.add_argument("--rows-per-file", type=int, default=10000, help="Rows per Parquet part file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    checkpoint = Checkpoint(args.checkpoint or Path(str(args.output) + ".checkpoint"))
+    if args.output.suffix.lower() == ".parquet":
+        writer = ParquetWriter(args.output, args.rows_per_file)
+    else:
+        writer = JsonlWriter(args.output)
+
+    paths = iter_manifest(args.manifest) if args.manifest else iter_directory(args.directory)
+    remaining = (path for path in paths if path not in checkpoint.done)
+    if checkpoint.done:
+        logger.info(f"Resuming, {len(checkpoint.done)} images already done")
+
+    processed = errors = 0
+    start = time.time()
+    # spawn: TensorFlow is not fork-safe.
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(args.workers, initializer=_init_worker, initargs=(args.reader_threads,)) as pool:
+        try:
+            for rows in pool.imap_unordered(analyze_chunk, chunked(remaining, args.batch_size)):
+                writer.write(rows)
+                checkpoint.add([row["path"] for row in rows])
+                if not isinstance(writer, ParquetWriter) or writer.should_flush():
+                    writer.flush()
+                    checkpoint.commit()
+
+                processed += len(rows)
+                errors += sum(1 for row in rows if row["error"])
+                if processed % (args.batch_size * 50) < len(rows):
+                    rate = processed / (time.time() - start)
+                    logger.info(f"{processed} images ({errors} errors), {rate:.1f} images/s")
+        finally:
+            writer.flush()
+            checkpoint.commit()
+            writer.close()
+            checkpoint.close()
+
+    logger.info(f"Done: {processed} images ({errors} errors) in {time.time() - start:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Import-time budget check.
+
+Imports each lightweight module in a fresh interpreter and fails if it pulls
+in TensorFlow, Keras or MediaPipe, or takes longer than its time budget.
+These dependencies must only be imported by the components that use them
+(ModelSet.load, FaceAnalysisService.face_mesh, ...), so the API, CLIs and
+tools start quickly. Run it in CI or before committing:
+
+    python check_import_budget.py
+    python check_import_budget.py --budget 1.5 --verbose
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from typing import Dict, Any, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+FRONTEND_DIR = os.path.join(os.path.dirname(BACKEND_DIR), "Frontend")
+
+HEAVY_MODULES = ("tensorflow", "keras", "mediapipe")
+
+# (directory on sys.path, module) pairs that must stay light.
+LIGHT_MODULES: List[Tuple[str, str]] = [
+    (BACKEND_DIR, "runtime_config"),
+    (BACKEND_DIR, "startup"),
+    (BACKEND_DIR, "models.inference_protocol"),
+    (BACKEND_DIR, "models.residency"),
+    (BACKEND_DIR, "models.model_loader"),
+    (BACKEND_DIR, "models.remote_loader"),
+    (BACKEND_DIR, "services.health_index"),
+    (BACKEND_DIR, "services.admission"),
+    (BACKEND_DIR, "services.report_stats"),
+    (BACKEND_DIR, "services.embedding_index"),
+    (BACKEND_DIR, "services.landmark_archive"),
+    (BACKEND_DIR, "services.job_queue"),
+    (BACKEND_DIR, "services.face_analysis"),
+    (BACKEND_DIR, "services.analysis_graph"),
+    (BACKEND_DIR, "main"),
+    (BACKEND_DIR, "router"),
+    (FRONTEND_DIR, "facial_symmetry"),
+    (FRONTEND_DIR, "analyzers"),
+    (FRONTEND_DIR, "client"),
+]
+
+PROBE = """
+import sys, json, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": sorted(m for m in {heavy!r} if m in sys.modules)}}))
+"""
+
+
+def measure(directory: str, module: str) -> Dict[str, Any]:
+    env = dict(os.environ, PYTHONPATH=directory)
+    # Never let a missing model directory or inference socket slow the import.
+    env.pop("INFERENCE_SOCKET", None)
+    process = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=directory, env=env, capture_output=True, text=True
+    )
+    if process.returncode != 0:
+        error = process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "unknown error"
+        return {"error": error}
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def _missing_light_dependency(error: str) -> bool:
+    """True when the import failed only because an unrelated dependency is not installed here
+    (e.g. the Frontend requirements in a backend-only environment)."""
+    if not error.startswith("ModuleNotFoundError"):
+        return False
+    return not any(f"'{heavy}" in error for heavy in HEAVY_MODULES)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if lightweight modules import heavy dependencies")
+    parser.add_argument("--budget", type=float, default=2.0, help="Maximum import time per module in seconds")
+    parser.add_argument("--verbose", action="store_true", help="Print the import time of every module")
+    args = parser.parse_args()
+
+    failures = []
+    checked = 0
+    for directory, module in LIGHT_MODULES:
+        name = f"{os.path.basename(directory)}/{module}"
+        result = measure(directory, module)
+        if "error" in result:
+            if _missing_light_dependency(result["error"]):
+                print(f"{name}: skipped ({result['error']})")
+            else:
+                failures.append(f"{name}: import failed ({result['error']})")
+            continue
+        checked += 1
+        if result["heavy"]:
+            failures.append(f"{name}: imports {', '.join(result['heavy'])}")
+        if result["seconds"] > args.budget:
+            failures.append(f"{name}: took {result['seconds']:.2f}s, budget is {args.budget:.2f}s")
+        if args.verbose:
+            print(f"{name:<40} {result['seconds'] * 1000:8.1f} ms")
+
+    if failures:
+        print("Import budget exceeded:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print(f"All {checked} checked modules within the import budget")
+
+
+if __name__ == "__main__":
+    main()
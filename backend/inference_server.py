@@ -0,0 +1,238 @@
+"""Shared local inference server.
+
+Owns the only copy of the models on a host and serves every API worker over a
+Unix socket, batching concurrent ``predict`` calls per model. A client pins
+the model version for one request with an ``acquire`` call and sends the
+returned lease with each ``predict``, so a request never mixes versions
+across a reload. Start it before
+the API workers and point them at it with ``INFERENCE_SOCKET``:
+
+    python inference_server.py --socket /tmp/face-analysis-inference.sock
+    INFERENCE_SOCKET=/tmp/face-analysis-inference.sock gunicorn main:app -w 4 -k uvicorn.workers.UvicornWorker
+"""
+import os
+import time
+import uuid
+import stat
+import asyncio
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+from runtime_config import load_runtime_config, apply_runtime_config
+from models.model_loader import ModelLoader, ModelSet
+from models.inference_protocol import encode_message, read_message
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = "/tmp/face-analysis-inference.sock"
+
+
+class ModelBatcher:
+    """Collects predict requests for one model and runs them as a single batch."""
+
+    def __init__(self, model_loader: ModelLoader, name: str, executor: ThreadPoolExecutor,
+                 max_batch: int, max_wait: float):
+        self.model_loader = model_loader
+        self.name = name
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def submit(self, batch: np.ndarray, model_set: Optional[ModelSet] = None):
+        """Predictions for ``batch`` from ``model_set`` (the active version if None)."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((batch, model_set, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            rows = len(items[0][0])
+            deadline = loop.time() + self.max_wait
+            while rows < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                rows += len(item[0])
+
+            # Requests pinned to different versions (around a reload) are
+            # batched separately.
+            groups: Dict[int, list] = {}
+            for item in items:
+                groups.setdefault(id(item[1]), []).append(item)
+            for group in groups.values():
+                await self._run_group(group)
+
+    async def _run_group(self, items):
+        loop = asyncio.get_running_loop()
+        try:
+            combined = np.concatenate([batch for batch, _, _ in items])
+            predictions, version = await loop.run_in_executor(self.executor, self._predict, combined, items[0][1])
+        except Exception as e:
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for batch, _, future in items:
+            if not future.done():
+                future.set_result((predictions[offset:offset + len(batch)], version))
+            offset += len(batch)
+
+    def _predict(self, batch: np.ndarray, model_set: Optional[ModelSet]):
+        if model_set is not None:
+            return np.asarray(model_set.predict(self.name, batch)), model_set.version
+        with self.model_loader.acquire() as models:
+            return np.asarray(models.predict(self.name, batch)), models.version
+
+
+class InferenceServer:
+    """Serves the models to API workers.
+
+    ``acquire`` pins the active version under a lease that ``predict`` and
+    ``embed`` calls name and ``release`` ends. Leases not used for
+    ``lease_ttl`` seconds (their worker died, say) are released, so a
+    retired version is still freed.
+    """
+
+    def __init__(self, model_loader: ModelLoader, max_batch: int = 32, max_wait_ms: float = 5.0,
+                 lease_ttl: float = 300.0):
+        self.model_loader = model_loader
+        self.lease_ttl = lease_ttl
+        self.leases: Dict[str, Tuple[ModelSet, float]] = {}
+        self.executor = ThreadPoolExecutor(max_workers=len(model_loader.current().specs) or 1)
+        self.batchers: Dict[str, ModelBatcher] = {
+            name: ModelBatcher(model_loader, name, self.executor, max_batch, max_wait_ms / 1000.0)
+            for name in model_loader.current().specs
+        }
+
+    def describe(self, models: Optional[ModelSet] = None):
+        models = models or self.model_loader.current()
+        return {
+            "ok": True,
+            "version": models.version,
+            "loaded": [name for name in models.specs if models.is_loaded(name)],
+            "residency": models.get_residency_stats(),
+            "specs": {name: spec.to_dict() for name, spec in models.specs.items()},
+            "reload": self.model_loader.reload_status
+        }
+
+    def _embed(self, batch: np.ndarray, model_set: Optional[ModelSet]):
+        if model_set is not None:
+            return model_set.embed(batch), model_set.version
+        with self.model_loader.acquire() as models:
+            return models.embed(batch), models.version
+
+    def _acquire(self):
+        self._expire_leases()
+        model_set = self.model_loader.pin()
+        lease = uuid.uuid4().hex
+        self.leases[lease] = (model_set, time.monotonic())
+        return dict(self.describe(model_set), lease=lease)
+
+    def _leased(self, header) -> Optional[ModelSet]:
+        """The version pinned by the request's lease; None for calls without one."""
+        lease = header.get("lease")
+        if lease is None:
+            return None
+        if lease not in self.leases:
+            raise KeyError(f"Unknown or expired model lease {lease}")
+        model_set, _ = self.leases[lease]
+        self.leases[lease] = (model_set, time.monotonic())
+        return model_set
+
+    def _release(self, lease: str):
+        entry = self.leases.pop(lease, None)
+        if entry is not None:
+            entry[0].release()
+
+    def _expire_leases(self):
+        cutoff = time.monotonic() - self.lease_ttl
+        for lease, (_, last_used) in list(self.leases.items()):
+            if last_used < cutoff:
+                logger.warning(f"Releasing model lease {lease} unused for {self.lease_ttl:.0f}s")
+                self._release(lease)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    header, array = await read_message(reader)
+                except asyncio.IncompleteReadError:
+                    break
+
+                result = None
+                try:
+                    op = header.get("op")
+                    if op == "predict":
+                        result, version = await self.batchers[header["model"]].submit(array, self._leased(header))
+                        response = {"ok": True, "version": version}
+                    elif op == "embed":
+                        loop = asyncio.get_running_loop()
+                        result, version = await loop.run_in_executor(
+                            self.executor, self._embed, array, self._leased(header)
+                        )
+                        response = {"ok": True, "version": version}
+                    elif op == "acquire":
+                        loop = asyncio.get_running_loop()
+                        response = await loop.run_in_executor(self.executor, self._acquire)
+                    elif op == "release":
+                        self._release(header["lease"])
+                        response = {"ok": True}
+                    elif op == "describe":
+                        response = self.describe()
+                    elif op == "reload":
+                        response = {"ok": True, "started": self.model_loader.reload(header.get("version"))}
+                    else:
+                        response = {"ok": False, "error": f"Unknown operation {op!r}"}
+                except Exception as e:
+                    logger.error(f"Inference request failed: {e}")
+                    response = {"ok": False, "error": str(e)}
+
+                writer.write(encode_message(response, result))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path: str):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+        for batcher in self.batchers.values():
+            asyncio.create_task(batcher.run())
+
+        server = await asyncio.start_unix_server(self.handle, path=socket_path)
+        os.chmod(socket_path, stat.S_IRUSR | stat.S_IWUSR)
+        logger.info(f"Inference server listening on {socket_path} (model version {self.model_loader.version})")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared local inference server for the Face Health Analyzer API")
+    parser.add_argument("--socket", default=os.getenv("INFERENCE_SOCKET", DEFAULT_SOCKET))
+    parser.add_argument("--max-batch", type=int, default=32, help="Maximum rows per model call")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="How long to wait for a batch to fill")
+    parser.add_argument("--lease-ttl", type=float, default=300.0,
+                        help="Seconds after which an unused model version lease is released")
+    args = parser.parse_args()
+
+    apply_runtime_config(load_runtime_config())
+    server = InferenceServer(ModelLoader(), args.max_batch, args.max_wait_ms, args.lease_ttl)
+    asyncio.run(server.serve(args.socket))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""End-to-end HTTP load test.
+
+Starts the API with uvicorn (or targets --url), replays a weighted mix of
+/api/analyze, /api/analyze/base64 and single-analyzer requests with synthetic
+images at increasing concurrency, and writes a JSON report with throughput,
+latency percentiles, error rates and peak server RSS per level. Reports from
+two commits can be compared with --compare.
+
+    python loadtest.py --concurrency 1,2,4,8,16 --duration 20 --output load-$(git rev-parse --short HEAD).json
+    python loadtest.py --compare load-old.json load-new.json
+"""
+import io
+import os
+import json
+import time
+import uuid
+import base64
+import random
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+from local_server import start_server, stop_server
+
+SINGLE_ENDPOINTS = ["age-gender", "fatigue", "symmetry", "skin", "emotion"]
+DEFAULT_MIX = "analyze=6,base64=2,age-gender=1,fatigue=1,symmetry=1,skin=1,emotion=1"
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ("analyze", "base64", *SINGLE_ENDPOINTS):
+            raise argparse.ArgumentTypeError(f"Unknown request type {name!r}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def synthetic_images(count: int, size: int, seed: int) -> List[bytes]:
+    """JPEGs with a skin-toned ellipse and two darker eyes on a noisy background."""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        image = rng.integers(0, 80, (size, size, 3), dtype=np.uint8)
+        yy, xx = np.mgrid[:size, :size]
+        cx, cy = size / 2 + rng.normal(0, size * 0.03), size / 2 + rng.normal(0, size * 0.03)
+        face = ((xx - cx) / (size * 0.28)) ** 2 + ((yy - cy) / (size * 0.36)) ** 2 <= 1
+        image[face] = (rng.integers(150, 230), rng.integers(110, 180), rng.integers(90, 150))
+        for dx in (-0.11, 0.11):
+            eye = ((xx - cx - dx * size) / (size * 0.05)) ** 2 + ((yy - cy + 0.08 * size) / (size * 0.025)) ** 2 <= 1
+            image[eye] = 40
+
+        buffer = io.BytesIO()
+        Image.fromarray(image).save(buffer, format="JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def _multipart(fields: List[Tuple[str, bytes]]) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, data in fields:
+        body.write(f"--{boundary}\r\n".encode())
+        body.write(f'Content-Disposition: form-data; name="{name}"; filename="{name}.jpg"\r\n'.encode())
+        body.write(b"Content-Type: image/jpeg\r\n\r\n")
+        body.write(data)
+        body.write(b"\r\n")
+    body.write(f"--{boundary}--\r\n".encode())
+    return body.getvalue(), f"multipart/form-data; boundary={boundary}"
+
+
+def build_request(kind: str, image: bytes, skin: Optional[bytes]) -> Tuple[str, bytes, str]:
+    """(path, body, content type) for one request of the given kind."""
+    if kind == "analyze":
+        fields = [("face_image", image)] + ([("skin_image", skin)] if skin else [])
+        body, content_type = _multipart(fields)
+        return "/api/analyze", body, content_type
+    if kind == "base64":
+        payload = {"image": "data:image/jpeg;base64," + base64.b64encode(image).decode()}
+        if skin:
+            payload["skin_image"] = base64.b64encode(skin).decode()
+        return "/api/analyze/base64", json.dumps(payload).encode(), "application/json"
+    body, content_type = _multipart([("image", image)])
+    return f"/api/analyze/{kind}", body, content_type
+
+
+class Client:
+    """One keep-alive connection per worker thread."""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.host, self.port, self.timeout = host, port, timeout
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def send(self, path: str, body: bytes, content_type: str) -> int:
+        connection = self._connection()
+        try:
+            connection.request("POST", path, body=body, headers={"Content-Type": content_type})
+            response = connection.getresponse()
+            response.read()
+            if response.getheader("Connection", "").lower() == "close":
+                self.reset()
+            return response.status
+        except Exception:
+            self.reset()
+            raise
+
+    def reset(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+        self._local.connection = None
+
+
+# --- server process ---
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _process_tree(pid: int) -> List[int]:
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        try:
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def tree_rss_bytes(pid: int) -> Optional[int]:
+    """RSS of a process and its descendants (uvicorn workers), Linux only."""
+    total = 0
+    for current in _process_tree(pid):
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            if current == pid:
+                return None
+    return total
+
+
+class RssSampler:
+    def __init__(self, pid: Optional[int], interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = tree_rss_bytes(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if self.pid is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+# --- load ---
+
+def run_level(client: Client, concurrency: int, duration: float, mix: Dict[str, float],
+              images: List[bytes], skin_ratio: float, seed: int, server_pid: Optional[int]) -> Dict[str, Any]:
+    kinds, weights = list(mix), list(mix.values())
+    samples: List[Tuple[str, float, Optional[int]]] = []
+    samples_lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def worker(index: int):
+        rng = random.Random(seed * 1000 + index)
+        local = []
+        while time.perf_counter() < stop_at:
+            kind = rng.choices(kinds, weights)[0]
+            skin = rng.choice(images) if kind in ("analyze", "base64") and rng.random() < skin_ratio else None
+            path, body, content_type = build_request(kind, rng.choice(images), skin)
+            start = time.perf_counter()
+            try:
+                status = client.send(path, body, content_type)
+            except Exception:
+                status = None
+            local.append((kind, time.perf_counter() - start, status))
+        with samples_lock:
+            samples.extend(local)
+
+    start = time.perf_counter()
+    with RssSampler(server_pid) as sampler, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return summarize(concurrency, samples, elapsed, sampler.peak)
+
+
+def _latency_stats(latencies: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        f"p{q}_ms": round(_percentile(latencies, q) * 1000, 1) if latencies else None
+        for q in (50, 90, 99)
+    }
+
+
+def summarize(concurrency: int, samples: List[Tuple[str, float, Optional[int]]], elapsed: float,
+              peak_rss: Optional[int]) -> Dict[str, Any]:
+    ok = [latency for _, latency, status in samples if status == 200]
+    statuses: Dict[str, int] = {}
+    for _, _, status in samples:
+        key = str(status) if status is not None else "connection_error"
+        statuses[key] = statuses.get(key, 0) + 1
+
+    endpoints = {}
+    for kind in sorted({kind for kind, _, _ in samples}):
+        kind_samples = [(latency, status) for k, latency, status in samples if k == kind]
+        kind_ok = [latency for latency, status in kind_samples if status == 200]
+        endpoints[kind] = {
+            "requests": len(kind_samples),
+            "error_rate": round(1 - len(kind_ok) / len(kind_samples), 4),
+            **_latency_stats(kind_ok)
+        }
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "throughput_rps": round(len(ok) / elapsed, 2),
+        "error_rate": round(1 - len(ok) / len(samples), 4) if samples else None,
+        "rejected_503": statuses.get("503", 0),
+        "status_counts": statuses,
+        **_latency_stats(ok),
+        "peak_rss_mb": round(peak_rss / 1024 / 1024, 1) if peak_rss else None,
+        "endpoints": endpoints
+    }
+
+
+def saturation(levels: List[Dict[str, Any]], max_error_rate: float) -> Dict[str, Any]:
+    """Peak throughput, and the first level where adding concurrency no longer adds 10% throughput."""
+    healthy = [level for level in levels if (level["error_rate"] or 0) <= max_error_rate]
+    if not healthy:
+        return {"max_throughput_rps": None, "at_concurrency": None, "knee_concurrency": None}
+
+    best = max(healthy, key=lambda level: level["throughput_rps"])
+    knee = healthy[-1]["concurrency"]
+    for previous, level in zip(healthy, healthy[1:]):
+        if level["throughput_rps"] < previous["throughput_rps"] * 1.1:
+            knee = previous["concurrency"]
+            break
+    return {
+        "max_throughput_rps": best["throughput_rps"],
+        "at_concurrency": best["concurrency"],
+        "knee_concurrency": knee
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _cell(value) -> str:
+    # Levels with no successful responses have no latency percentiles.
+    return "-" if value is None else str(value)
+
+
+def compare(old_path: str, new_path: str):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    print(f"old: {old.get('commit')}  new: {new.get('commit')}")
+    print(f"{'conc':>5} {'rps old':>9} {'rps new':>9} {'p99 old':>9} {'p99 new':>9} {'err old':>8} {'err new':>8}")
+    old_levels = {level["concurrency"]: level for level in old["levels"]}
+    for level in new["levels"]:
+        before = old_levels.get(level["concurrency"], {})
+        print(f"{level['concurrency']:>5} {_cell(before.get('throughput_rps')):>9} {_cell(level['throughput_rps']):>9} "
+              f"{_cell(before.get('p99_ms')):>9} {_cell(level['p99_ms']):>9} "
+              f"{_cell(before.get('error_rate')):>8} {_cell(level['error_rate']):>8}")
+    print(f"max throughput: {old['saturation']['max_throughput_rps']} -> {new['saturation']['max_throughput_rps']} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load test of the Face Health Analyzer API")
+    parser.add_argument("--url", help="Target a running server instead of starting one")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the started server")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 2, 4, 8, 16],
+                        help="Concurrency levels to ramp through")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per level")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds of load before the first level")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Weighted request mix (default {DEFAULT_MIX})")
+    parser.add_argument("--skin-ratio", type=float, default=0.25,
+                        help="Fraction of full analyses that also upload a skin image")
+    parser.add_argument("--image-size", type=int, default=640)
+    parser.add_argument("--images", type=int, default=8, help="Distinct synthetic images")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout")
+    parser.add_argument("--startup-timeout", type=float, default=180.0)
+    parser.add_argument("--max-error-rate", type=float, default=0.01,
+                        help="Levels with more errors are excluded from the saturation summary")
+    parser.add_argument("--output", default="loadtest.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two reports and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    images = synthetic_images(args.images, args.image_size, args.seed)
+    process = None
+    if args.url:
+        parsed = urllib.parse.urlparse(args.url)
+        host, port = parsed.hostname, parsed.port or 80
+    else:
+        host, port = "127.0.0.1", _free_port()
+        print(f"Starting server on port {port} with {args.workers} worker(s)")
+        process = start_server(port, args.workers, args.startup_timeout)
+
+    try:
+        client = Client(host, port, args.timeout)
+        if args.warmup > 0:
+            run_level(client, 1, args.warmup, args.mix, images, args.skin_ratio, args.seed, None)
+
+        levels = []
+        for concurrency in args.concurrency:
+            level = run_level(client, concurrency, args.duration, args.mix, images, args.skin_ratio,
+                              args.seed, process.pid if process else None)
+            levels.append(level)
+            print(f"concurrency {concurrency}: {level['throughput_rps']} req/s, p50 {level['p50_ms']} ms, "
+                  f"p99 {level['p99_ms']} ms, errors {level['error_rate']:.1%}, peak RSS {level['peak_rss_mb']} MB")
+    finally:
+        if process is not None:
+            stop_server(process)
+
+    report = {
+        "commit": _git_commit(),
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "url": args.url,
+            "workers": args.workers if not args.url else None,
+            "duration": args.duration,
+            "mix": args.mix,
+            "skin_ratio": args.skin_ratio,
+            "image_size": args.image_size,
+            "images": args.images,
+            "seed": args.seed
+        },
+        "saturation": saturation(levels, args.max_error_rate),
+        "levels": levels
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
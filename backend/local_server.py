@@ -0,0 +1,46 @@
+"""Starts and stops local uvicorn processes serving main:app.
+
+Used by loadtest.py and by router.py --spawn.
+"""
+import os
+import sys
+import time
+import signal
+import subprocess
+import http.client
+
+
+def start_server(port: int, workers: int, startup_timeout: float) -> subprocess.Popen:
+    """Starts uvicorn on ``port`` and waits until ``/health`` answers 200."""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        start_new_session=True
+    )
+    deadline = time.time() + startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode} during startup")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.5)
+    stop_server(process)
+    raise RuntimeError(f"Server did not become healthy within {startup_timeout}s")
+
+
+def stop_server(process: subprocess.Popen):
+    """Stops the server and its worker processes."""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=15)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
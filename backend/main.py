@@ -1,24 +1,58 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Header, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import Optional, List
+from urllib.parse import urlparse
+from datetime import date
+from uuid import UUID
 import numpy as np
 import cv2
 from PIL import Image
 import io
+import os
 import base64
 import logging
+import threading
 
-from models.model_loader import ModelLoader
+from startup import StartupTimer
+from runtime_config import load_runtime_config, apply_runtime_config
+from models.model_loader import ModelLoader, ModelsUnavailable
+from models.remote_loader import RemoteModelLoader
 from services.face_analysis import FaceAnalysisService
 from services.health_index import HealthIndexCalculator
+from services.analysis_graph import build_analysis_graph
+from services.report_stats import ReportStatsStore, ReportStatsError
+from services.job_queue import JobQueue, JobQueueFull
+from services.admission import AdmissionController, AdmissionMiddleware, DeadlineExceeded, check_deadline
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# TensorFlow, Keras and MediaPipe are imported by the components that use
+# them, so importing this module stays fast; models are loaded after the
+# server starts (see _load_models). check_import_budget.py guards this.
+startup = StartupTimer(_import_started)
+startup.record("imports", time.perf_counter() - _import_started)
+
+# Thread settings from autotune.py; must run before models are loaded.
+with startup.phase("runtime_config"):
+    runtime_config = load_runtime_config()
+    apply_runtime_config(runtime_config)
+
 app = FastAPI(title="Face Health Analyzer API", version="2.0.0")
 
+# Rejects overload with a 503 before the upload is read or decoded. Added
+# before CORSMiddleware so it runs inside it: its 503s carry CORS headers
+# and preflight requests never reach it.
+admission = AdmissionController.from_env()
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -27,14 +61,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-model_loader = ModelLoader()
-face_service = FaceAnalysisService(model_loader)
-health_calculator = HealthIndexCalculator()
+# With INFERENCE_SOCKET set, models live in a shared inference_server.py
+# process instead of in every worker.
+INFERENCE_SOCKET = os.getenv("INFERENCE_SOCKET")
+with startup.phase("services"):
+    model_loader = RemoteModelLoader(INFERENCE_SOCKET) if INFERENCE_SOCKET else ModelLoader(load=False)
+    face_service = FaceAnalysisService(model_loader)
+    health_calculator = HealthIndexCalculator()
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Dashboard statistics from the analysis_reports rollup tables in Supabase.
+report_stats = ReportStatsStore.from_env()
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))
+# Hosts that job callbacks may be sent to; callbacks are refused when unset,
+# so clients cannot make the server POST to internal addresses.
+JOB_CALLBACK_HOSTS = {host.strip().lower() for host in os.getenv("JOB_CALLBACK_HOSTS", "").split(",") if host.strip()}
+
+
+# For responses returned without a response model; NumPy values left in
+# analyzer results are not JSON serializable otherwise.
+NUMPY_ENCODERS = {np.generic: lambda value: value.item(), np.ndarray: lambda value: value.tolist()}
 
 
 class Base64ImageRequest(BaseModel):
     image: str
     skin_image: Optional[str] = None
+    report_id: Optional[UUID] = None
+
+
+class ModelReloadRequest(BaseModel):
+    version: Optional[str] = None
 
 
 class AnalysisResponse(BaseModel):
@@ -47,6 +109,52 @@ class AnalysisResponse(BaseModel):
     health_index: dict
     confidence_scores: dict
     recommendations: List[str]
+    model_version: Optional[str] = None
+    embedding_match: Optional[dict] = None
+    report_id: Optional[str] = None
+    skin_regions: Optional[dict] = None
+    pipeline: Optional[dict] = None
+
+
+def _load_models():
+    with startup.phase("models"):
+        try:
+            model_loader.ensure_loaded()
+        except Exception:
+            # Logged by the loader; /health reports "failed" and analysis
+            # requests get a 503 until a reload succeeds.
+            return
+    with startup.phase("face_mesh"):
+        face_service.warm_up()
+    startup.finish()
+
+
+@app.on_event("startup")
+async def start_loading_models():
+    # Analysis requests that arrive before loading finishes wait for it;
+    # / and /health answer immediately.
+    threading.Thread(target=_load_models, name="model-startup", daemon=True).start()
+
+    # Jobs run the same pipeline as /api/analyze, without a request deadline.
+    global job_queue
+    with startup.phase("job_queue"):
+        job_queue = JobQueue(
+            JOB_DB_PATH,
+            lambda face_data, skin_data, include_landmarks: _run_complete(face_data, skin_data, include_landmarks, None),
+            workers=JOB_WORKERS,
+            max_attempts=JOB_MAX_ATTEMPTS,
+            result_ttl=JOB_RESULT_TTL,
+            max_queued=JOB_MAX_QUEUED
+        )
+    # Job workers block in model_loader.acquire() until the models are ready.
+    if JOB_WORKERS > 0:
+        job_queue.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    if job_queue is not None:
+        job_queue.stop()
 
 
 @app.get("/")
@@ -56,142 +164,291 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    # 503 until the models are loaded, so load balancers, the router and
+    # the load test only send traffic to a ready server; "failed" if the
+    # configured version could not be loaded.
+    if not model_loader.ready:
+        return JSONResponse(status_code=503, content={
+            "status": "failed" if model_loader.load_error else "starting",
+            "error": model_loader.load_error,
+            "startup": startup.report(),
+            "model_reload": model_loader.reload_status,
+            "admission": admission.get_stats()
+        })
+
     model_status = model_loader.get_model_status()
     return {
         "status": "healthy",
-        "models": model_status
+        "startup": startup.report(),
+        "models": model_status,
+        "model_version": model_loader.version,
+        "model_reload": model_loader.reload_status,
+        "model_residency": model_loader.get_residency_stats(),
+        "admission": admission.get_stats(),
+        "embedding_index": face_service.get_embedding_index_stats(),
+        "landmark_archive": face_service.get_landmark_archive_stats(),
+        "jobs": job_queue.get_stats()
     }
 
 
-@app.post("/api/analyze", response_model=AnalysisResponse)
-async def analyze_face(
-    face_image: UploadFile = File(...),
-    skin_image: Optional[UploadFile] = File(None)
-):
-    try:
-        face_img_data = await face_image.read()
-        face_img = Image.open(io.BytesIO(face_img_data)).convert("RGB")
-        face_array = np.array(face_img)
+@app.post("/admin/models/reload", status_code=202)
+async def reload_models(request: ModelReloadRequest, x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Model reload is not permitted")
 
-        skin_array = None
-        if skin_image:
-            skin_img_data = await skin_image.read()
-            skin_img = Image.open(io.BytesIO(skin_img_data)).convert("RGB")
-            skin_array = np.array(skin_img)
+    if not model_loader.reload(request.version):
+        raise HTTPException(status_code=409, detail="A model reload is already in progress")
 
-        result = face_service.analyze_complete(face_array, skin_array)
+    return {
+        "status": "reloading",
+        "active_version": model_loader.version if model_loader.ready else None,
+        "target_version": model_loader.reload_status.get("target_version")
+    }
 
-        health_index = health_calculator.calculate_health_index(result)
-        result["health_index"] = health_index
 
-        recommendations = health_calculator.generate_recommendations(result)
-        result["recommendations"] = recommendations
+def _decode_image(data: bytes) -> np.ndarray:
+    img = Image.open(io.BytesIO(data)).convert("RGB")
+    return np.array(img)
 
-        return result
 
-    except Exception as e:
-        logger.error(f"Analysis error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+def _decode_base64(data: str) -> bytes:
+    return base64.b64decode(data.split(',')[1] if ',' in data else data)
 
 
-@app.post("/api/analyze/base64", response_model=AnalysisResponse)
-async def analyze_face_base64(request: Base64ImageRequest):
-    try:
-        face_img_data = base64.b64decode(request.image.split(',')[1] if ',' in request.image else request.image)
-        face_img = Image.open(io.BytesIO(face_img_data)).convert("RGB")
-        face_array = np.array(face_img)
+# The /api/analyze pipeline as a dependency graph (decode, detect,
+# landmarks, each analyzer, health index, recommendations), so a request
+# for some fields only runs the nodes those fields need.
+analysis_graph = build_analysis_graph(face_service, health_calculator, _decode_image)
+
+
+def _run_complete(face_data: bytes, skin_data: Optional[bytes], include_landmarks: bool,
+                  deadline: Optional[float], fields: Optional[List[str]] = None, trace: bool = False,
+                  report_id: Optional[UUID] = None) -> dict:
+    check_deadline(deadline)
+    with model_loader.acquire() as models:
+        # The graph checks the deadline again after decoding.
+        result, pipeline = analysis_graph.run(
+            {"face_data": face_data, "skin_data": skin_data, "include_landmarks": include_landmarks,
+             "deadline": deadline, "report_id": str(report_id) if report_id else None},
+            fields
+        )
+        result["model_version"] = models.version
+
+    if trace:
+        result["pipeline"] = pipeline
+    return result
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in analysis_graph.fields]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(analysis_graph.fields)}"
+        )
+    return requested
+
 
-        skin_array = None
-        if request.skin_image:
-            skin_img_data = base64.b64decode(request.skin_image.split(',')[1] if ',' in request.skin_image else request.skin_image)
-            skin_img = Image.open(io.BytesIO(skin_img_data)).convert("RGB")
-            skin_array = np.array(skin_img)
+# Created at startup (start_loading_models), so importing this module does
+# not create or migrate the job database.
+job_queue: Optional[JobQueue] = None
 
-        result = face_service.analyze_complete(face_array, skin_array)
 
-        health_index = health_calculator.calculate_health_index(result)
-        result["health_index"] = health_index
+def _run_single(analyzer: str, img_data: bytes, deadline: Optional[float], **kwargs) -> dict:
+    img_array = _decode_image(img_data)
 
-        recommendations = health_calculator.generate_recommendations(result)
-        result["recommendations"] = recommendations
+    check_deadline(deadline)
+    with model_loader.acquire() as models:
+        result = getattr(face_service, analyzer)(img_array, **kwargs)
+        result["model_version"] = models.version
+    return result
 
-        return result
 
+def _deadline_response(e: DeadlineExceeded) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(admission.retry_after)}
+    )
+
+
+def _unavailable_response(e: ModelsUnavailable) -> HTTPException:
+    logger.error(f"Analysis error: {str(e)}")
+    return HTTPException(status_code=503, detail=str(e))
+
+
+@app.post("/api/analyze", response_model=AnalysisResponse)
+async def analyze_face(
+    request: Request,
+    face_image: UploadFile = File(...),
+    skin_image: Optional[UploadFile] = File(None),
+    include_landmarks: bool = Query(False),
+    fields: Optional[str] = Query(None),
+    trace: bool = Query(False),
+    report_id: Optional[UUID] = Query(None)
+):
+    requested = _parse_fields(fields)
+    try:
+        face_img_data = await face_image.read()
+        skin_img_data = await skin_image.read() if skin_image else None
+
+        result = await run_in_threadpool(
+            _run_complete, face_img_data, skin_img_data, include_landmarks,
+            getattr(request.state, "deadline", None), requested, trace, report_id
+        )
+        # A partial result does not fit AnalysisResponse; return it as is.
+        return JSONResponse(jsonable_encoder(result, custom_encoder=NUMPY_ENCODERS)) if requested else result
+
+    except DeadlineExceeded as e:
+        raise _deadline_response(e)
+    except ModelsUnavailable as e:
+        raise _unavailable_response(e)
     except Exception as e:
         logger.error(f"Analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
 
-@app.post("/api/analyze/age-gender")
-async def analyze_age_gender(image: UploadFile = File(...)):
-    try:
-        img_data = await image.read()
-        img = Image.open(io.BytesIO(img_data)).convert("RGB")
-        img_array = np.array(img)
+@app.get("/api/analyze/graph")
+async def analysis_graph_info():
+    return analysis_graph.describe()
 
-        result = face_service.analyze_age_gender(img_array)
-        return result
 
+@app.post("/api/analyze/base64", response_model=AnalysisResponse)
+async def analyze_face_base64(request: Base64ImageRequest, http_request: Request):
+    try:
+        face_img_data = _decode_base64(request.image)
+        skin_img_data = _decode_base64(request.skin_image) if request.skin_image else None
+
+        return await run_in_threadpool(
+            _run_complete, face_img_data, skin_img_data, False,
+            getattr(http_request.state, "deadline", None), None, False, request.report_id
+        )
+
+    except DeadlineExceeded as e:
+        raise _deadline_response(e)
+    except ModelsUnavailable as e:
+        raise _unavailable_response(e)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.error(f"Analysis error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
 
-@app.post("/api/analyze/fatigue")
-async def analyze_fatigue(image: UploadFile = File(...)):
+async def _analyze_single(analyzer: str, request: Request, image: UploadFile, **kwargs) -> dict:
     try:
         img_data = await image.read()
-        img = Image.open(io.BytesIO(img_data)).convert("RGB")
-        img_array = np.array(img)
-
-        result = face_service.analyze_fatigue(img_array)
-        return result
-
+        return await run_in_threadpool(
+            _run_single, analyzer, img_data, getattr(request.state, "deadline", None), **kwargs
+        )
+
+    except DeadlineExceeded as e:
+        raise _deadline_response(e)
+    except ModelsUnavailable as e:
+        raise _unavailable_response(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/analyze/symmetry")
-async def analyze_symmetry(image: UploadFile = File(...)):
-    try:
-        img_data = await image.read()
-        img = Image.open(io.BytesIO(img_data)).convert("RGB")
-        img_array = np.array(img)
+@app.post("/api/analyze/age-gender")
+async def analyze_age_gender(request: Request, image: UploadFile = File(...)):
+    return await _analyze_single("analyze_age_gender", request, image)
 
-        result = face_service.analyze_symmetry(img_array)
-        return result
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+@app.post("/api/analyze/fatigue")
+async def analyze_fatigue(request: Request, image: UploadFile = File(...)):
+    return await _analyze_single("analyze_fatigue", request, image)
+
+
+@app.post("/api/analyze/symmetry")
+async def analyze_symmetry(request: Request, image: UploadFile = File(...), include_landmarks: bool = Query(False)):
+    return await _analyze_single("analyze_symmetry", request, image, include_landmarks=include_landmarks)
 
 
 @app.post("/api/analyze/skin")
-async def analyze_skin(image: UploadFile = File(...)):
+async def analyze_skin(request: Request, image: UploadFile = File(...), tiled: Optional[bool] = Query(None)):
+    return await _analyze_single("analyze_skin", request, image, tiled=tiled)
+
+
+@app.post("/api/analyze/emotion")
+async def analyze_emotion(request: Request, image: UploadFile = File(...)):
+    return await _analyze_single("analyze_emotion", request, image)
+
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(
+    face_image: UploadFile = File(...),
+    skin_image: Optional[UploadFile] = File(None),
+    include_landmarks: bool = Query(False),
+    callback_url: Optional[str] = Form(None)
+):
+    if callback_url:
+        url = urlparse(callback_url)
+        if url.scheme not in ("http", "https"):
+            raise HTTPException(status_code=400, detail="callback_url must be an http or https URL")
+        if (url.hostname or "").lower() not in JOB_CALLBACK_HOSTS:
+            raise HTTPException(status_code=400, detail="callback_url host is not in JOB_CALLBACK_HOSTS")
+
+    face_img_data = await face_image.read()
+    skin_img_data = await skin_image.read() if skin_image else None
     try:
-        img_data = await image.read()
-        img = Image.open(io.BytesIO(img_data)).convert("RGB")
-        img_array = np.array(img)
+        return await run_in_threadpool(
+            job_queue.submit, face_img_data, skin_img_data, include_landmarks, callback_url
+        )
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(admission.retry_after)})
 
-        result = face_service.analyze_skin(img_array)
-        return result
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await run_in_threadpool(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
 
 
-@app.post("/api/analyze/emotion")
-async def analyze_emotion(image: UploadFile = File(...)):
+async def _report_stats(method: str, start: Optional[date], end: Optional[date], user_id: Optional[UUID] = None):
+    if report_stats is None:
+        raise HTTPException(status_code=503, detail="Report statistics are not configured")
     try:
-        img_data = await image.read()
-        img = Image.open(io.BytesIO(img_data)).convert("RGB")
-        img_array = np.array(img)
+        start, end = report_stats.date_range(start, end)
+        result = await run_in_threadpool(
+            getattr(report_stats, method), start, end, str(user_id) if user_id else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ReportStatsError as e:
+        logger.error(f"Report statistics error: {str(e)}")
+        raise HTTPException(status_code=502, detail="Report statistics are unavailable")
+    return {"start": start, "end": end, "data": result}
 
-        result = face_service.analyze_emotion(img_array)
-        return result
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+@app.get("/api/stats/trend")
+async def stats_trend(start: Optional[date] = Query(None), end: Optional[date] = Query(None)):
+    return await _report_stats("trend", start, end)
+
+
+@app.get("/api/stats/distribution")
+async def stats_distribution(start: Optional[date] = Query(None), end: Optional[date] = Query(None)):
+    return await _report_stats("distribution", start, end)
+
+
+@app.get("/api/stats/users/{user_id}/trend")
+async def stats_user_trend(user_id: UUID, start: Optional[date] = Query(None), end: Optional[date] = Query(None)):
+    return await _report_stats("trend", start, end, user_id)
+
+
+@app.get("/api/stats/users/{user_id}/distribution")
+async def stats_user_distribution(user_id: UUID, start: Optional[date] = Query(None),
+                                  end: Optional[date] = Query(None)):
+    return await _report_stats("distribution", start, end, user_id)
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    workers = int(os.getenv("WEB_CONCURRENCY", runtime_config.get("uvicorn_workers", 1)))
+    if workers > 1:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,3 +1,5 @@
-from .model_loader import ModelLoader
+from .model_loader import ModelLoader, ModelSet, ModelSpec, ModelSignatureError
+from .remote_loader import RemoteModelLoader
+from .residency import ResidencyManager
 
-__all__ = ['ModelLoader']
+__all__ = ['ModelLoader', 'ModelSet', 'ModelSpec', 'ModelSignatureError', 'RemoteModelLoader', 'ResidencyManager']
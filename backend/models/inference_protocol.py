@@ -0,0 +1,55 @@
+import json
+import struct
+import asyncio
+import socket
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+
+# Each message is a 4-byte big-endian header length, a JSON header and an
+# optional raw array payload whose dtype and shape are given in the header.
+_LENGTH = struct.Struct(">I")
+
+
+def encode_message(header: Dict[str, Any], array: Optional[np.ndarray] = None) -> bytes:
+    header = dict(header)
+    payload = b""
+    if array is not None:
+        array = np.ascontiguousarray(array)
+        header["dtype"] = str(array.dtype)
+        header["shape"] = list(array.shape)
+        payload = array.tobytes()
+        header["payload_bytes"] = len(payload)
+
+    encoded = json.dumps(header).encode()
+    return _LENGTH.pack(len(encoded)) + encoded + payload
+
+
+def _decode_array(header: Dict[str, Any], payload: bytes) -> Optional[np.ndarray]:
+    if "dtype" not in header:
+        return None
+    return np.frombuffer(payload, dtype=header["dtype"]).reshape(header["shape"])
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Inference server closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_message(sock: socket.socket) -> Tuple[Dict[str, Any], Optional[np.ndarray]]:
+    (length,) = _LENGTH.unpack(_recv_exactly(sock, _LENGTH.size))
+    header = json.loads(_recv_exactly(sock, length))
+    payload = _recv_exactly(sock, header.get("payload_bytes", 0))
+    return header, _decode_array(header, payload)
+
+
+async def read_message(reader: asyncio.StreamReader) -> Tuple[Dict[str, Any], Optional[np.ndarray]]:
+    (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    header = json.loads(await reader.readexactly(length))
+    payload = await reader.readexactly(header.get("payload_bytes", 0))
+    return header, _decode_array(header, payload)
@@ -1,67 +1,583 @@
 import os
+import gc
+import json
 import logging
+import threading
+import contextvars
+from contextlib import contextmanager
 from pathlib import Path
-import tensorflow as tf
-from tensorflow import keras
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+import cv2
+import numpy as np
+
+from .residency import ResidencyManager
 
 logger = logging.getLogger(__name__)
 
 
-class ModelLoader:
-    def __init__(self):
-        self.models_dir = Path(__file__).parent.parent.parent / "saved_models"
-        self.age_model = None
-        self.gender_model = None
-        self.fatigue_model = None
-        self.skin_model = None
+class ModelSignatureError(RuntimeError):
+    """Raised at load time when a model does not match its declared spec."""
 
-        self.load_all_models()
 
-    def load_all_models(self):
-        try:
-            age_path = self.models_dir / "age_model.keras"
-            if age_path.exists():
-                self.age_model = keras.models.load_model(str(age_path))
-                logger.info("Age model loaded successfully")
-            else:
-                logger.warning(f"Age model not found at {age_path}")
-        except Exception as e:
-            logger.error(f"Failed to load age model: {e}")
+class ModelsUnavailable(RuntimeError):
+    """Raised by requests when the configured model version failed to load."""
+
+
+@dataclass
+class ModelSpec:
+    name: str
+    filename: str
+    input_size: Tuple[int, int]
+    channels: int = 3
+    scale: float = 255.0
+    output_units: int = 1
+    labels: List[str] = field(default_factory=list)
+    # Multi-input models (e.g. the two-branch skin MobileNet) receive the same
+    # preprocessed image on every input when this is set.
+    replicate_input: bool = False
+
+    @property
+    def input_shape(self) -> Tuple[int, int, int]:
+        return (self.input_size[1], self.input_size[0], self.channels)
+
+    def preprocess(self, image: np.ndarray) -> np.ndarray:
+        """Resize and scale an RGB image into a single model input (no batch axis)."""
+        if self.channels == 1 and image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+        resized = cv2.resize(image, self.input_size).astype('float32') / self.scale
+        if self.channels == 1:
+            resized = np.expand_dims(resized, axis=-1)
+        return resized
+
+    @property
+    def metadata_filename(self) -> str:
+        return Path(self.filename).stem + ".json"
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ModelSpec":
+        data = dict(data)
+        data["input_size"] = tuple(data["input_size"])
+        return cls(**data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "filename": self.filename,
+            "input_size": list(self.input_size),
+            "channels": self.channels,
+            "scale": self.scale,
+            "output_units": self.output_units,
+            "labels": list(self.labels),
+            "replicate_input": self.replicate_input
+        }
+
+
+# Used when a model has no metadata file next to it.
+DEFAULT_SPECS = {
+    "age": ModelSpec(
+        name="age",
+        filename="age_model.keras",
+        input_size=(224, 224)
+    ),
+    "gender": ModelSpec(
+        name="gender",
+        filename="gender_model.keras",
+        input_size=(224, 224),
+        labels=["Female", "Male"]
+    ),
+    "fatigue": ModelSpec(
+        name="fatigue",
+        filename="best_fatigue_model.keras",
+        input_size=(100, 100),
+        channels=1,
+        labels=["Not Fatigued", "Fatigued"]
+    ),
+    "skin": ModelSpec(
+        name="skin",
+        filename="mobilenet_skin.keras",
+        input_size=(224, 224),
+        output_units=10,
+        labels=[
+            "Acne",
+            "Actinic Keratosis",
+            "Basal Cell Carcinoma",
+            "Dermatofibroma",
+            "Melanocytic Nevi",
+            "Melanoma",
+            "Seborrheic Keratoses",
+            "Squamous Cell Carcinoma",
+            "Vascular Lesion",
+            "Normal"
+        ],
+        replicate_input=True
+    )
+}
+
+
+class ModelSet:
+    """One version of every model, loaded from a single directory.
+
+    Each model's input and output signature is inspected when it is loaded and
+    checked against its spec (read from ``<model>.json`` next to the ``.keras``
+    file, or ``DEFAULT_SPECS``). ``predict`` then calls the model in the one
+    format it accepts instead of probing formats per request.
+
+    ``load()`` loads and validates every model. With a memory budget
+    (``MODEL_MEMORY_BUDGET_MB``) only pinned models (``MODEL_PIN``) stay
+    resident; the rest are dropped again after the check, loaded on first
+    use, and the least recently used are evicted when the budget is exceeded.
+    """
+
+    def __init__(self, version: str, directory: Path, residency: Optional[ResidencyManager] = None):
+        self.version = version
+        self.directory = directory
+        self.models: Dict[str, Any] = {}
+        self.specs: Dict[str, ModelSpec] = {}
+        self.residency = residency or ResidencyManager.from_env()
+        self._available: List[str] = []
+        self._input_counts: Dict[str, int] = {}
+        self._load_locks = {name: threading.Lock() for name in DEFAULT_SPECS}
+        self._embedder = None
+        self._refs = 0
+        self._retired = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        for name, default_spec in DEFAULT_SPECS.items():
+            spec = self._load_spec(default_spec)
+            self.specs[name] = spec
+
+            path = self.directory / spec.filename
+            if not path.exists():
+                logger.warning(f"{name.capitalize()} model not found at {path}")
+                continue
+            self._available.append(name)
+
+        checked = False
+        for name in list(self._available):
+            try:
+                if self.residency.limited and not self.residency.is_pinned(name):
+                    # Checked here, one at a time, so a signature mismatch
+                    # fails the load instead of a request; not kept resident.
+                    self._load_model(name)
+                    checked = True
+                else:
+                    self._model(name)
+            except ImportError:
+                # No TensorFlow (already logged); the analyzers fall back to
+                # their heuristics, as they do for missing model files.
+                pass
+        if checked:
+            gc.collect()
 
+    def _unavailable(self, name: str):
+        # Callers may retry a load that already failed and removed it.
+        if name in self._available:
+            self._available.remove(name)
+
+    def _load_model(self, name: str):
+        spec = self.specs[name]
+        path = self.directory / spec.filename
         try:
-            gender_path = self.models_dir / "gender_model.keras"
-            if gender_path.exists():
-                self.gender_model = keras.models.load_model(str(gender_path))
-                logger.info("Gender model loaded successfully")
-            else:
-                logger.warning(f"Gender model not found at {gender_path}")
+            # Imported here so processes that only talk to a shared inference
+            # server (see remote_loader) never load TensorFlow.
+            from tensorflow import keras
+            model = keras.models.load_model(str(path))
         except Exception as e:
-            logger.error(f"Failed to load gender model: {e}")
+            logger.error(f"Failed to load {name} model: {e}")
+            self._unavailable(name)
+            raise
 
         try:
-            fatigue_path = self.models_dir / "best_fatigue_model.keras"
-            if fatigue_path.exists():
-                self.fatigue_model = keras.models.load_model(str(fatigue_path))
-                logger.info("Fatigue model loaded successfully")
-            else:
-                logger.warning(f"Fatigue model not found at {fatigue_path}")
-        except Exception as e:
-            logger.error(f"Failed to load fatigue model: {e}")
+            self._input_counts[name] = self._check_signature(model, spec)
+        except ModelSignatureError:
+            self._unavailable(name)
+            raise
+        logger.info(f"{name.capitalize()} model loaded successfully (version {self.version})")
+        return model
 
+    @staticmethod
+    def _model_bytes(model, path: Path) -> int:
         try:
-            skin_path = self.models_dir / "mobilenet_skin.keras"
-            if skin_path.exists():
-                self.skin_model = keras.models.load_model(str(skin_path))
-                logger.info("Skin model loaded successfully")
-            else:
-                logger.warning(f"Skin model not found at {skin_path}")
-        except Exception as e:
-            logger.error(f"Failed to load skin model: {e}")
+            return int(model.count_params()) * 4
+        except Exception:
+            return path.stat().st_size
+
+    def _model(self, name: str):
+        """The resident model, loading it (and evicting others) if needed."""
+        with self._lock:
+            model = self.models.get(name)
+        if model is not None:
+            self.residency.touch(name)
+            return model
+
+        with self._load_locks[name]:
+            with self._lock:
+                model = self.models.get(name)
+            if model is not None:
+                self.residency.touch(name)
+                return model
+
+            model = self._load_model(name)
+            size = self._model_bytes(model, self.directory / self.specs[name].filename)
+            with self._lock:
+                self.models[name] = model
+                evicted = self.residency.admit(name, size)
+                for victim in evicted:
+                    self.models.pop(victim, None)
+                    if victim == "age":
+                        self._embedder = None
+            if evicted:
+                # Requests already predicting with an evicted model keep it
+                # alive until they finish.
+                gc.collect()
+                logger.info(f"Evicted {', '.join(evicted)} model(s) to stay within the memory budget")
+            return model
+
+    def warm_up(self):
+        for name in list(self.models):
+            spec = self.specs[name]
+            self.predict(name, np.zeros((1,) + spec.input_shape, dtype='float32'))
+
+    def _load_spec(self, default_spec: ModelSpec) -> ModelSpec:
+        metadata_path = self.directory / default_spec.metadata_filename
+        if not metadata_path.exists():
+            return default_spec
+
+        with open(metadata_path) as f:
+            spec = ModelSpec.from_dict(json.load(f))
+        if spec.name != default_spec.name:
+            raise ModelSignatureError(
+                f"{metadata_path} describes model '{spec.name}', expected '{default_spec.name}'"
+            )
+        return spec
+
+    def _check_signature(self, model, spec: ModelSpec) -> int:
+        inputs = model.inputs
+        expected_shape = spec.input_shape
+
+        if len(inputs) > 1 and not spec.replicate_input:
+            raise ModelSignatureError(
+                f"{spec.name} model has {len(inputs)} inputs but its spec expects one"
+            )
+
+        for model_input in inputs:
+            shape = tuple(model_input.shape[1:])
+            if shape != expected_shape:
+                raise ModelSignatureError(
+                    f"{spec.name} model input shape {shape} does not match spec {expected_shape}"
+                )
+
+        if len(model.outputs) != 1:
+            raise ModelSignatureError(
+                f"{spec.name} model has {len(model.outputs)} outputs, expected 1"
+            )
+
+        units = model.outputs[0].shape[-1]
+        if units != spec.output_units:
+            raise ModelSignatureError(
+                f"{spec.name} model outputs {units} units but its spec expects {spec.output_units}"
+            )
+        if spec.labels and spec.output_units > 1 and len(spec.labels) != units:
+            raise ModelSignatureError(
+                f"{spec.name} model has {units} classes but {len(spec.labels)} labels"
+            )
+
+        return len(inputs)
+
+    def is_loaded(self, name: str) -> bool:
+        """Whether the model can be used; it is loaded on demand if not resident."""
+        return name in self._available
+
+    def labels(self, name: str) -> List[str]:
+        return self.specs[name].labels
+
+    def preprocess(self, name: str, image: np.ndarray) -> np.ndarray:
+        return self.specs[name].preprocess(image)
+
+    def predict(self, name: str, batch: np.ndarray) -> np.ndarray:
+        model = self._model(name)
+        count = self._input_counts[name]
+        inputs = batch if count == 1 else [batch] * count
+        return model.predict(inputs, verbose=0)
+
+    def embed(self, batch: np.ndarray) -> np.ndarray:
+        """Face embeddings for a batch of preprocessed age-model inputs.
+
+        Taken from the age model's penultimate layer, or from the layer named by
+        ``EMBEDDING_LAYER``; the sub-model is built on first use.
+        """
+        model = self._model("age")
+        with self._lock:
+            if self._embedder is None:
+                from tensorflow import keras
+                layer_name = os.getenv("EMBEDDING_LAYER")
+                layer = model.get_layer(layer_name) if layer_name else model.layers[-2]
+                self._embedder = keras.Model(inputs=model.inputs, outputs=layer.output)
+            embedder = self._embedder
+
+        embeddings = np.asarray(embedder.predict(batch, verbose=0))
+        return embeddings.reshape(len(embeddings), -1)
+
+    def acquire(self):
+        with self._lock:
+            self._refs += 1
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            free = self._retired and self._refs == 0
+        if free:
+            self._free()
+
+    def retire(self):
+        with self._lock:
+            self._retired = True
+            free = self._refs == 0
+        if free:
+            self._free()
+
+    def _free(self):
+        with self._lock:
+            for name in list(self.models):
+                self.residency.forget(name)
+            self.models.clear()
+            self._embedder = None
+        gc.collect()
+        logger.info(f"Released model version {self.version}")
 
     def get_model_status(self):
+        """``loaded`` (resident), ``available`` (loaded on first use) or ``not_loaded``."""
         return {
-            "age_model": "loaded" if self.age_model else "not_loaded",
-            "gender_model": "loaded" if self.gender_model else "not_loaded",
-            "fatigue_model": "loaded" if self.fatigue_model else "not_loaded",
-            "skin_model": "loaded" if self.skin_model else "not_loaded"
+            f"{name}_model": (
+                "loaded" if name in self.models else "available" if name in self._available else "not_loaded"
+            )
+            for name in DEFAULT_SPECS
         }
+
+    def get_residency_stats(self) -> Dict[str, Any]:
+        return self.residency.get_stats(self._available)
+
+
+_pinned_models: contextvars.ContextVar[Optional[ModelSet]] = contextvars.ContextVar(
+    "pinned_models", default=None
+)
+
+
+class ModelLoader:
+    """Serves the active ``ModelSet`` and swaps in new versions without downtime.
+
+    ``MODELS_PATH`` either holds the ``.keras`` files directly (version
+    ``"default"``) or one sub-directory per version plus a ``CURRENT`` file
+    naming the active one. A new version is loaded and warmed in a background
+    thread, then swapped in atomically. Requests pin a version with
+    ``acquire()`` and finish on it; an old version is freed once its last
+    request releases it.
+    """
+
+    CURRENT_FILE = "CURRENT"
+
+    def __init__(self, models_dir: Optional[Path] = None, watch_interval: Optional[float] = None,
+                 load: bool = True):
+        default_dir = Path(__file__).parent.parent.parent / "saved_models"
+        self.models_dir = Path(models_dir or os.getenv("MODELS_PATH") or default_dir)
+        self.watch_interval = float(
+            watch_interval if watch_interval is not None else os.getenv("MODEL_WATCH_INTERVAL", "0")
+        )
+        self._active: Optional[ModelSet] = None
+        self._swap_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._ready = threading.Event()
+        self.load_error: Optional[str] = None
+        self._stop_watching = threading.Event()
+        self.reload_status: Dict[str, Any] = {"state": "idle"}
+
+        # With load=False the models are loaded by ensure_loaded(), typically
+        # from a background thread so the API can start serving first.
+        if load:
+            self.load_all_models()
+        if self.watch_interval > 0:
+            threading.Thread(target=self._watch, name="model-watcher", daemon=True).start()
+
+    @property
+    def version(self) -> str:
+        return self.current().version
+
+    @property
+    def age_model(self):
+        return self.current().models.get("age")
+
+    @property
+    def gender_model(self):
+        return self.current().models.get("gender")
+
+    @property
+    def fatigue_model(self):
+        return self.current().models.get("fatigue")
+
+    @property
+    def skin_model(self):
+        return self.current().models.get("skin")
+
+    def load_all_models(self):
+        version = self._configured_version()
+        model_set = ModelSet(version, self._version_dir(version))
+        model_set.load()
+        self._swap(model_set)
+
+    def ensure_loaded(self):
+        """Loads the configured version unless models are already loaded.
+
+        Missing model files or a missing TensorFlow leave those models to the
+        analyzers' heuristics, as in the constructor. Any other failure (such
+        as a ``ModelSignatureError``) is recorded in ``load_error`` and
+        re-raised; requests then fail with ``ModelsUnavailable`` instead of
+        waiting, until a reload succeeds.
+        """
+        with self._load_lock:
+            if self._ready.is_set():
+                return
+            version = self._configured_version()
+            try:
+                self.load_all_models()
+            except Exception as e:
+                logger.error(f"Loading model version {version} failed: {e}")
+                self.reload_status = {"state": "failed", "target_version": version, "error": str(e)}
+                self.load_error = str(e)
+                self._ready.set()
+                raise
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set() and self._active is not None
+
+    def _configured_version(self) -> str:
+        current_file = self.models_dir / self.CURRENT_FILE
+        if current_file.exists():
+            return current_file.read_text().strip()
+        return "default"
+
+    def _version_dir(self, version: str) -> Path:
+        if version == "default":
+            return self.models_dir
+        return self.models_dir / version
+
+    def _swap(self, model_set: ModelSet):
+        with self._swap_lock:
+            previous, self._active = self._active, model_set
+            self.load_error = None
+        self._ready.set()
+        if previous is not None:
+            previous.retire()
+
+    def current(self) -> ModelSet:
+        pinned = _pinned_models.get()
+        if pinned is not None:
+            return pinned
+        self._wait_ready()
+        return self._active
+
+    def _wait_ready(self):
+        self._ready.wait()
+        if self._active is None:
+            raise ModelsUnavailable(f"Model version failed to load: {self.load_error}")
+
+    def pin(self) -> ModelSet:
+        """The active model set, kept loaded until ``release()`` is called on it.
+
+        For callers that cannot use ``acquire()``, such as the inference
+        server holding a version for a client across several calls.
+        """
+        self._wait_ready()
+        with self._swap_lock:
+            model_set = self._active
+            model_set.acquire()
+        return model_set
+
+    @contextmanager
+    def acquire(self):
+        """Pin the active model version for the duration of a request."""
+        pinned = _pinned_models.get()
+        if pinned is not None:
+            yield pinned
+            return
+
+        model_set = self.pin()
+        token = _pinned_models.set(model_set)
+        try:
+            yield model_set
+        finally:
+            _pinned_models.reset(token)
+            model_set.release()
+
+    def reload(self, version: Optional[str] = None) -> bool:
+        """Start loading ``version`` (default: the one named in ``CURRENT``) in the background.
+
+        Returns False if a reload is already in progress.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+
+        target = version or self._configured_version()
+        self.reload_status = {"state": "loading", "target_version": target}
+        threading.Thread(target=self._reload, args=(target,), name="model-reload", daemon=True).start()
+        return True
+
+    def _reload(self, version: str):
+        try:
+            directory = self._version_dir(version)
+            if not directory.is_dir():
+                raise FileNotFoundError(f"Model version directory {directory} does not exist")
+
+            model_set = ModelSet(version, directory)
+            model_set.load()
+            model_set.warm_up()
+            self._swap(model_set)
+            self.reload_status = {"state": "idle", "last_reload": version}
+            logger.info(f"Switched to model version {version}")
+        except Exception as e:
+            self.reload_status = {"state": "failed", "target_version": version, "error": str(e)}
+            logger.error(f"Model reload to version {version} failed: {e}")
+        finally:
+            self._reload_lock.release()
+
+    def _watch(self):
+        while not self._stop_watching.wait(self.watch_interval):
+            try:
+                configured = self._configured_version()
+            except OSError as e:
+                logger.error(f"Could not read model version: {e}")
+                continue
+            if self._active is None and self.load_error is None:
+                continue
+            active = self._active.version if self._active is not None else None
+            if configured != active and self.reload_status.get("target_version") != configured:
+                logger.info(f"Model version changed to {configured}, reloading")
+                self.reload(configured)
+
+    def stop(self):
+        self._stop_watching.set()
+
+    def is_loaded(self, name: str) -> bool:
+        return self.current().is_loaded(name)
+
+    def labels(self, name: str) -> List[str]:
+        return self.current().labels(name)
+
+    def preprocess(self, name: str, image: np.ndarray) -> np.ndarray:
+        return self.current().preprocess(name, image)
+
+    def predict(self, name: str, batch: np.ndarray) -> np.ndarray:
+        return self.current().predict(name, batch)
+
+    def embed(self, batch: np.ndarray) -> np.ndarray:
+        return self.current().embed(batch)
+
+    def get_model_status(self):
+        return self.current().get_model_status()
+
+    def get_residency_stats(self) -> Dict[str, Any]:
+        return self.current().get_residency_stats()
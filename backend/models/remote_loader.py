@@ -0,0 +1,296 @@
+import time
+import socket
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+
+from .model_loader import ModelLoader, ModelSpec
+from .inference_protocol import encode_message, recv_message
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteModelVersion:
+    """A model version pinned on the inference server for one request."""
+
+    def __init__(self, version: str, specs: Optional[Dict[str, ModelSpec]] = None,
+                 loaded: Optional[List[str]] = None, lease: Optional[str] = None):
+        self.version = version
+        self.specs = specs or {}
+        self.loaded = loaded or []
+        self.lease = lease
+
+
+# The version a request runs on: a RemoteModelVersion, or the in-process
+# fallback's model set when the server was down at acquire() time.
+_pinned: contextvars.ContextVar[Optional[Any]] = contextvars.ContextVar("remote_pinned_models", default=None)
+
+
+class RemoteModelLoader:
+    """Model registry client for a shared local inference server.
+
+    Exposes the same interface as ``ModelLoader`` but sends ``predict`` calls
+    over a Unix socket to ``inference_server.py``, which owns the models and
+    batches requests from all API workers. ``acquire()`` pins the server's
+    active version under a lease that every call of the request sends, so
+    the request finishes on one version even if the server reloads, and
+    preprocessing uses that version's specs. If the server cannot be reached
+    the loader falls back to an in-process ``ModelLoader`` and retries the
+    server after ``retry_interval`` seconds. A call that times out (the server
+    is busy) fails on its own and does not count as the server being down.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        fallback_factory: Callable[[], Any] = ModelLoader,
+        timeout: float = 30.0,
+        retry_interval: float = 30.0
+    ):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self._fallback_factory = fallback_factory
+        self._fallback = None
+        self._fallback_lock = threading.Lock()
+        self._idle: List[socket.socket] = []
+        self._pool_lock = threading.Lock()
+        self._down_until = 0.0
+
+        # The server's active version as of the last describe or acquire.
+        self._latest: Optional[RemoteModelVersion] = None
+        self._residency: Dict[str, Any] = {}
+        self.reload_status: Dict[str, Any] = {"state": "idle"}
+        # Set when the in-process fallback failed to load at startup.
+        self.load_error: Optional[str] = None
+
+        self._refresh()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _call(self, header: Dict[str, Any], array: Optional[np.ndarray] = None):
+        with self._pool_lock:
+            sock = self._idle.pop() if self._idle else None
+        if sock is None:
+            sock = self._connect()
+
+        try:
+            sock.sendall(encode_message(header, array))
+            response, result = recv_message(sock)
+        except Exception:
+            sock.close()
+            raise
+
+        with self._pool_lock:
+            self._idle.append(sock)
+
+        if not response.get("ok"):
+            raise RuntimeError(f"Inference server error: {response.get('error')}")
+        return response, result
+
+    def _remote_available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _mark_down(self, error: Exception):
+        logger.warning(f"Inference server at {self.socket_path} unavailable ({error}), using in-process models")
+        self._down_until = time.monotonic() + self.retry_interval
+        with self._pool_lock:
+            for sock in self._idle:
+                sock.close()
+            self._idle.clear()
+
+    @staticmethod
+    def _models_from(response: Dict[str, Any]) -> RemoteModelVersion:
+        return RemoteModelVersion(
+            response["version"],
+            {name: ModelSpec.from_dict(spec) for name, spec in response["specs"].items()},
+            response["loaded"],
+            response.get("lease")
+        )
+
+    def _update(self, response: Dict[str, Any], models: RemoteModelVersion):
+        self._latest = RemoteModelVersion(models.version, models.specs, models.loaded)
+        self._residency = response.get("residency", {})
+        self.reload_status = response["reload"]
+
+    def _refresh(self) -> bool:
+        try:
+            response, _ = self._call({"op": "describe"})
+        except TimeoutError as e:
+            logger.warning(f"Inference server at {self.socket_path} did not answer in time: {e}")
+            return False
+        except (OSError, ConnectionError) as e:
+            self._mark_down(e)
+            return False
+
+        self._update(response, self._models_from(response))
+        self.load_error = None
+        return True
+
+    def _get_fallback(self):
+        with self._fallback_lock:
+            if self._fallback is None:
+                self._fallback = self._fallback_factory()
+                self.load_error = None
+            return self._fallback
+
+    def _use_fallback(self) -> bool:
+        pinned = _pinned.get()
+        if pinned is not None:
+            return not isinstance(pinned, RemoteModelVersion)
+        if not self._remote_available():
+            return True
+        return self._latest is None and not self._refresh() and not self._remote_available()
+
+    def _models(self) -> RemoteModelVersion:
+        """The version pinned by this request, else the server's latest one."""
+        pinned = _pinned.get()
+        if isinstance(pinned, RemoteModelVersion):
+            return pinned
+        if self._latest is None and not self._refresh():
+            raise RuntimeError(f"Inference server at {self.socket_path} did not describe its models")
+        return self._latest
+
+    @property
+    def ready(self) -> bool:
+        return self.load_error is None
+
+    def ensure_loaded(self):
+        """Loads the in-process fallback models if the server could not be reached."""
+        if self._use_fallback():
+            try:
+                self._get_fallback()
+            except Exception as e:
+                self.load_error = str(e)
+                raise
+
+    @property
+    def version(self) -> str:
+        if self._use_fallback():
+            return self._get_fallback().version
+        return self._models().version
+
+    @contextmanager
+    def acquire(self):
+        """Pins a model version for the duration of a request.
+
+        On the server this is a lease that every call of the request sends;
+        when the server is down, the in-process fallback's version.
+        """
+        if _pinned.get() is not None:
+            yield _pinned.get()
+            return
+
+        models = None
+        if not self._use_fallback():
+            try:
+                response, _ = self._call({"op": "acquire"})
+                models = self._models_from(response)
+                self._update(response, models)
+            except TimeoutError:
+                raise
+            except (OSError, ConnectionError) as e:
+                self._mark_down(e)
+
+        if models is None:
+            with self._get_fallback().acquire() as fallback_models:
+                token = _pinned.set(fallback_models)
+                try:
+                    yield fallback_models
+                finally:
+                    _pinned.reset(token)
+            return
+
+        token = _pinned.set(models)
+        try:
+            yield models
+        finally:
+            _pinned.reset(token)
+            try:
+                self._call({"op": "release", "lease": models.lease})
+            except Exception as e:
+                # The server releases leases that go unused.
+                logger.warning(f"Could not release model lease {models.lease}: {e}")
+
+    def is_loaded(self, name: str) -> bool:
+        if self._use_fallback():
+            return self._get_fallback().is_loaded(name)
+        return name in self._models().loaded
+
+    def labels(self, name: str) -> List[str]:
+        if self._use_fallback():
+            return self._get_fallback().labels(name)
+        return self._models().specs[name].labels
+
+    def preprocess(self, name: str, image: np.ndarray) -> np.ndarray:
+        if self._use_fallback():
+            return self._get_fallback().preprocess(name, image)
+        return self._models().specs[name].preprocess(image)
+
+    def _remote(self, header: Dict[str, Any], batch: np.ndarray) -> Optional[np.ndarray]:
+        """The server's result, or None if the server is down and the fallback may be used."""
+        pinned = _pinned.get()
+        if isinstance(pinned, RemoteModelVersion):
+            header = dict(header, lease=pinned.lease)
+        try:
+            _, result = self._call(header, batch)
+            return result
+        except TimeoutError:
+            raise
+        except (OSError, ConnectionError) as e:
+            self._mark_down(e)
+            if pinned is not None:
+                # Finishing on in-process models would mix versions.
+                raise
+        return None
+
+    def predict(self, name: str, batch: np.ndarray) -> np.ndarray:
+        if not self._use_fallback():
+            predictions = self._remote({"op": "predict", "model": name}, batch)
+            if predictions is not None:
+                return predictions
+        return self._get_fallback().predict(name, batch)
+
+    def embed(self, batch: np.ndarray) -> np.ndarray:
+        if not self._use_fallback():
+            embeddings = self._remote({"op": "embed"}, batch)
+            if embeddings is not None:
+                return embeddings
+        return self._get_fallback().embed(batch)
+
+    def reload(self, version: Optional[str] = None) -> bool:
+        if self._use_fallback():
+            return self._get_fallback().reload(version)
+        response, _ = self._call({"op": "reload", "version": version})
+        self._refresh()
+        return response["started"]
+
+    def _describe(self) -> Optional[RemoteModelVersion]:
+        """The server's latest version, or None if it is down and the fallback answers."""
+        if self._remote_available():
+            self._refresh()
+        if not self._remote_available():
+            return None
+        return self._latest or RemoteModelVersion("unknown")
+
+    def get_model_status(self):
+        models = self._describe()
+        if models is None:
+            return self._get_fallback().get_model_status()
+        return {f"{name}_model": "loaded" if name in models.loaded else "not_loaded" for name in models.specs}
+
+    def get_residency_stats(self) -> Dict[str, Any]:
+        if self._describe() is None:
+            return self._get_fallback().get_residency_stats()
+        return self._residency
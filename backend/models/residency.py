@@ -0,0 +1,95 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, List, Optional
+
+
+class ResidencyManager:
+    """Tracks which models are resident and picks LRU victims under a memory budget.
+
+    The manager only does the bookkeeping; the owner loads and drops models
+    and tells it about them with ``admit`` and ``touch``. Pinned models are
+    never chosen for eviction. A budget of 0 means no limit.
+    """
+
+    def __init__(self, budget_bytes: int = 0, pinned: Iterable[str] = ()):
+        self.budget_bytes = budget_bytes
+        self.pinned = set(pinned)
+        self._resident: "OrderedDict[str, int]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        self._loads: Dict[str, int] = {}
+        self._evictions: Dict[str, int] = {}
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ResidencyManager":
+        budget_mb = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+        pinned = [name.strip() for name in os.getenv("MODEL_PIN", "").split(",") if name.strip()]
+        return cls(int(budget_mb * 1024 * 1024), pinned)
+
+    @property
+    def limited(self) -> bool:
+        return self.budget_bytes > 0
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(self._resident.values())
+
+    def is_pinned(self, name: str) -> bool:
+        return name in self.pinned
+
+    def touch(self, name: str):
+        with self._lock:
+            if name in self._resident:
+                self._resident.move_to_end(name)
+                self._last_used[name] = time.time()
+
+    def admit(self, name: str, size: int) -> List[str]:
+        """Records ``name`` as resident and returns the models to evict to get back under budget.
+
+        The model just admitted is never evicted, so a single model larger
+        than the budget still runs (alone).
+        """
+        with self._lock:
+            self._resident[name] = size
+            self._resident.move_to_end(name)
+            self._sizes[name] = size
+            self._last_used[name] = time.time()
+            self._loads[name] = self._loads.get(name, 0) + 1
+
+            evicted = []
+            if self.limited:
+                for candidate in list(self._resident):
+                    if self.resident_bytes <= self.budget_bytes:
+                        break
+                    if candidate == name or candidate in self.pinned:
+                        continue
+                    del self._resident[candidate]
+                    self._evictions[candidate] = self._evictions.get(candidate, 0) + 1
+                    evicted.append(candidate)
+            return evicted
+
+    def forget(self, name: str):
+        with self._lock:
+            self._resident.pop(name, None)
+
+    def get_stats(self, names: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        with self._lock:
+            names = list(names) if names is not None else list(self._sizes)
+            return {
+                "budget_mb": round(self.budget_bytes / 1024 / 1024, 1) if self.limited else None,
+                "resident_mb": round(self.resident_bytes / 1024 / 1024, 1),
+                "models": {
+                    name: {
+                        "resident": name in self._resident,
+                        "pinned": name in self.pinned,
+                        "memory_mb": round(self._sizes[name] / 1024 / 1024, 1) if name in self._sizes else None,
+                        "loads": self._loads.get(name, 0),
+                        "evictions": self._evictions.get(name, 0),
+                        "last_used": self._last_used.get(name)
+                    }
+                    for name in names
+                }
+            }
@@ -0,0 +1,39 @@
+"""Rebuilds the analysis_reports rollup tables.
+
+The rollups are normally kept up to date by a trigger on analysis_reports;
+run this after bulk imports made with the trigger disabled, or to repair
+drift. Needs SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY.
+
+    python rebuild_rollups.py
+"""
+import sys
+import time
+import argparse
+import logging
+
+from services.report_stats import ReportStatsStore, ReportStatsError
+
+logger = logging.getLogger("rebuild_rollups")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the daily and per-user analysis rollups")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Seconds to wait for the rebuild")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    store = ReportStatsStore.from_env()
+    if store is None:
+        sys.exit("Set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY")
+
+    start = time.time()
+    try:
+        reports = store.rebuild(args.timeout)
+    except ReportStatsError as e:
+        sys.exit(f"Rebuild failed: {e}")
+    logger.info(f"Rebuilt rollups from {reports} reports in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Recomputes symmetry results from the landmark archive.
+
+After ASYMMETRY_THRESHOLD or the condition rules in FaceAnalysisService
+change, this re-runs symmetry scoring over every face stored under
+LANDMARK_ARCHIVE_PATH without the images or FaceMesh. Scoring is vectorized
+over each archive chunk. Rows are written as JSONL or CSV (by extension) with
+the analysis_reports columns, keyed by report ID (analysis_reports.id when
+clients save reports under the report_id used for the archive), along with
+the score and condition given at analysis time.
+
+    python rescore_symmetry.py --output rescored.jsonl
+    python rescore_symmetry.py /data/landmarks --output changed.csv --changed-only --since 2026-01-01
+"""
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import logging
+from datetime import date, datetime, timezone
+from typing import Dict, Any, Iterator, Optional
+import numpy as np
+
+from services.face_analysis import FaceAnalysisService
+from services.landmark_archive import LandmarkArchive
+
+logger = logging.getLogger("rescore_symmetry")
+
+COLUMNS = [
+    "report_id", "analyzed_at", "symmetry_score", "symmetry_condition",
+    "previous_symmetry_score", "previous_symmetry_condition"
+]
+
+
+def rescore(archive: LandmarkArchive, service: FaceAnalysisService, since: Optional[float] = None,
+            changed_only: bool = False) -> Iterator[Dict[str, Any]]:
+    for landmarks, records in archive.iter_chunks():
+        keep = np.ones(len(records), dtype=bool)
+        if since is not None:
+            keep &= records["timestamp"] >= since
+        if not keep.any():
+            continue
+        landmarks, records = landmarks[keep], records[keep]
+
+        scores = service.symmetry_scores(landmarks, records["width"], records["height"])
+        conditions = service.symmetry_conditions(landmarks, scores, records["height"])
+        scores = np.round(scores, 4)
+
+        # Landmarks are stored as float16, so scores may differ from the
+        # originals in the last digit; only a different condition counts.
+        changed = conditions != records["predicted_condition"]
+        for i in (np.flatnonzero(changed) if changed_only else range(len(records))):
+            yield {
+                "report_id": str(records["report_id"][i]),
+                "analyzed_at": datetime.fromtimestamp(records["timestamp"][i], timezone.utc).isoformat(),
+                "symmetry_score": float(scores[i]),
+                "symmetry_condition": str(conditions[i]),
+                "previous_symmetry_score": round(float(records["asymmetry_score"][i]), 4),
+                "previous_symmetry_condition": str(records["predicted_condition"][i])
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute symmetry results from archived landmarks")
+    parser.add_argument("archive", nargs="?", default=os.getenv("LANDMARK_ARCHIVE_PATH"),
+                        help="Landmark archive directory (default: LANDMARK_ARCHIVE_PATH)")
+    parser.add_argument("--output", required=True, help="Output .jsonl or .csv file")
+    parser.add_argument("--since", type=date.fromisoformat, help="Only faces analyzed on or after this date (UTC)")
+    parser.add_argument("--changed-only", action="store_true",
+                        help="Only write reports whose condition changed")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if not args.archive or not os.path.isdir(args.archive):
+        sys.exit("Pass the landmark archive directory or set LANDMARK_ARCHIVE_PATH")
+
+    archive = LandmarkArchive(args.archive)
+    # Only the symmetry rules are used; no models or FaceMesh are loaded.
+    service = FaceAnalysisService(None)
+    since = datetime.combine(args.since, datetime.min.time(), timezone.utc).timestamp() if args.since else None
+
+    start = time.time()
+    written = 0
+    with open(args.output, "w", newline="") as f:
+        if args.output.endswith(".csv"):
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            write = lambda row: f.write(json.dumps(row) + "\n")
+
+        for row in rescore(archive, service, since, args.changed_only):
+            write(row)
+            written += 1
+
+    elapsed = time.time() - start
+    logger.info(f"Rescored {archive.count} archived faces in {elapsed:.1f}s, wrote {written} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
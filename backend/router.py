@@ -0,0 +1,441 @@
+"""Cache-affinity routing front for several API replicas.
+
+Hashes the uploaded image(s) of each analysis request and sends it to the
+replica that owns the hash on a consistent-hash ring, so repeats of an image
+always reach the same replica and its per-host state (embedding index, job
+queue, resident models). Replicas can be added and removed at runtime; only
+the keys owned by that replica move. Replicas that fail their health check
+leave the ring until they pass again. Per-replica load is reported at
+``GET /router/status``.
+
+    python router.py --replica http://10.0.0.2:8000 --replica http://10.0.0.3:8000
+    python router.py --spawn 3          # local test: starts 3 uvicorn replicas on ports 8001-8003
+"""
+import os
+import sys
+import json
+import time
+import base64
+import bisect
+import asyncio
+import hashlib
+import logging
+import argparse
+import threading
+import http.client
+import urllib.parse
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Not forwarded in either direction.
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailers",
+    "transfer-encoding", "upgrade", "host", "content-length"
+}
+
+IMAGE_FIELDS = ("face_image", "skin_image", "image")
+
+
+class HashRing:
+    """Consistent hash ring with ``vnodes`` points per replica.
+
+    Adding or removing a replica only moves the keys between its points and
+    their neighbours, roughly 1/n of all keys.
+    """
+
+    def __init__(self, vnodes: int = 160):
+        self.vnodes = vnodes
+        self._points: List[int] = []
+        self._owners: List[str] = []
+
+    @staticmethod
+    def _hash(data: bytes) -> int:
+        return int.from_bytes(hashlib.sha1(data).digest()[:8], "big")
+
+    def add(self, name: str):
+        if name in self._owners:
+            return
+        for index in range(self.vnodes):
+            point = self._hash(f"{name}#{index}".encode())
+            position = bisect.bisect(self._points, point)
+            self._points.insert(position, point)
+            self._owners.insert(position, name)
+
+    def remove(self, name: str):
+        kept = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != name]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def get(self, key: bytes) -> Optional[str]:
+        if not self._points:
+            return None
+        position = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[position]
+
+    def shares(self) -> Dict[str, float]:
+        """Fraction of the key space owned by each replica."""
+        if not self._points:
+            return {}
+        size = 1 << 64
+        shares: Dict[str, int] = {}
+        for i, owner in enumerate(self._owners):
+            previous = self._points[i - 1] if i else self._points[-1] - size
+            shares[owner] = shares.get(owner, 0) + self._points[i] - previous
+        return {owner: round(share / size, 4) for owner, share in shares.items()}
+
+
+class Replica:
+    """One backend replica with a pool of keep-alive connections and load counters."""
+
+    def __init__(self, url: str, timeout: float):
+        parsed = urllib.parse.urlparse(url)
+        if parsed.scheme != "http" or not parsed.hostname:
+            raise ValueError(f"Replica URL must be http://host:port, got {url!r}")
+        self.url = url.rstrip("/")
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self.healthy = True
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self.last_error: Optional[str] = None
+        self._idle: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    def _connection(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """A pooled keep-alive connection (and True), or a new one."""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+
+    def _send(self, method: str, path: str, body: bytes,
+              headers: Dict[str, str]) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        while True:
+            connection, reused = self._connection()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                content = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                connection.close()
+                # The replica closed an idle keep-alive connection; try a new one.
+                if reused:
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+
+            if response.getheader("Connection", "").lower() == "close":
+                connection.close()
+            else:
+                with self._lock:
+                    self._idle.append(connection)
+            return response.status, response.getheaders(), content
+
+    def request(self, method: str, path: str, body: bytes,
+                headers: Dict[str, str]) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+        start = time.perf_counter()
+        try:
+            status, response_headers, content = self._send(method, path, body, headers)
+            if status >= 500:
+                with self._lock:
+                    self.errors += 1
+            return status, response_headers, content
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+                self.last_error = str(e)
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.latency_total += time.perf_counter() - start
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "healthy": self.healthy,
+                "in_flight": self.in_flight,
+                "requests": self.requests,
+                "errors": self.errors,
+                "avg_latency_ms": round(self.latency_total / self.requests * 1000, 1) if self.requests else None,
+                "last_error": self.last_error
+            }
+
+
+class Router:
+    def __init__(self, urls: List[str], vnodes: int = 160, timeout: float = 120.0,
+                 health_interval: float = 5.0, max_tracked_jobs: int = 100000):
+        self.ring = HashRing(vnodes)
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.replicas: Dict[str, Replica] = {}
+        # Async jobs are polled without the image, so remember who owns each job.
+        self.job_owners: "OrderedDict[str, str]" = OrderedDict()
+        self.max_tracked_jobs = max_tracked_jobs
+        self.affinity_requests = 0
+        self.other_requests = 0
+        self._lock = threading.Lock()
+        for url in urls:
+            self.add(url)
+
+    def add(self, url: str) -> Replica:
+        replica = Replica(url, self.timeout)
+        with self._lock:
+            if replica.url in self.replicas:
+                return self.replicas[replica.url]
+            self.replicas[replica.url] = replica
+            self.ring.add(replica.url)
+        logger.info(f"Replica {replica.url} joined")
+        return replica
+
+    def remove(self, url: str) -> bool:
+        with self._lock:
+            replica = self.replicas.pop(url.rstrip("/"), None)
+            if replica is None:
+                return False
+            self.ring.remove(replica.url)
+        replica.close()
+        logger.info(f"Replica {replica.url} left")
+        return True
+
+    def set_healthy(self, replica: Replica, healthy: bool):
+        with self._lock:
+            if replica.healthy == healthy or replica.url not in self.replicas:
+                return
+            replica.healthy = healthy
+            if healthy:
+                self.ring.add(replica.url)
+            else:
+                self.ring.remove(replica.url)
+        logger.warning(f"Replica {replica.url} is {'healthy again' if healthy else 'down, removed from the ring'}")
+
+    def pick(self, key: Optional[bytes]) -> Optional[Replica]:
+        """Owner of ``key`` on the ring, or the least busy healthy replica for requests without one."""
+        with self._lock:
+            if key is not None:
+                self.affinity_requests += 1
+                owner = self.ring.get(key)
+                return self.replicas.get(owner) if owner else None
+            self.other_requests += 1
+            healthy = [replica for replica in self.replicas.values() if replica.healthy]
+            return min(healthy, key=lambda replica: replica.in_flight) if healthy else None
+
+    def remember_job(self, job_id: str, replica: Replica):
+        with self._lock:
+            self.job_owners[job_id] = replica.url
+            self.job_owners.move_to_end(job_id)
+            while len(self.job_owners) > self.max_tracked_jobs:
+                self.job_owners.popitem(last=False)
+
+    def job_owner(self, job_id: str) -> Optional[Replica]:
+        with self._lock:
+            url = self.job_owners.get(job_id)
+            return self.replicas.get(url) if url else None
+
+    def check_health(self):
+        for replica in list(self.replicas.values()):
+            try:
+                connection = http.client.HTTPConnection(replica.host, replica.port, timeout=5)
+                connection.request("GET", "/health")
+                healthy = connection.getresponse().status == 200
+                connection.close()
+            except OSError as e:
+                replica.last_error = str(e)
+                healthy = False
+            self.set_healthy(replica, healthy)
+
+    async def watch(self):
+        while True:
+            await run_in_threadpool(self.check_health)
+            await asyncio.sleep(self.health_interval)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            shares = self.ring.shares()
+            replicas = {
+                url: dict(replica.get_stats(), ring_share=shares.get(url, 0.0))
+                for url, replica in self.replicas.items()
+            }
+            return {
+                "replicas": replicas,
+                "affinity_requests": self.affinity_requests,
+                "other_requests": self.other_requests,
+                "tracked_jobs": len(self.job_owners)
+            }
+
+
+def _decode_base64(data: str) -> bytes:
+    return base64.b64decode(data.split(',')[1] if ',' in data else data)
+
+
+async def routing_key(request: Request, body: bytes) -> Optional[bytes]:
+    """Hash of the uploaded image(s), the same whether sent as multipart or base64 JSON."""
+    content_type = request.headers.get("content-type", "")
+    images: Dict[str, bytes] = {}
+    try:
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            for field in IMAGE_FIELDS:
+                upload = form.get(field)
+                if upload is not None and hasattr(upload, "read"):
+                    images[field] = await upload.read()
+        elif content_type.startswith("application/json") and body:
+            payload = json.loads(body)
+            for field in IMAGE_FIELDS:
+                if isinstance(payload, dict) and isinstance(payload.get(field), str):
+                    images[field] = _decode_base64(payload[field])
+    except Exception as e:
+        logger.warning(f"Could not read images for routing: {e}")
+        return None
+
+    if not images:
+        return None
+    # The face image decides the replica, whichever field it was sent in.
+    face = images.get("face_image", images.get("image"))
+    digest = hashlib.sha256(face if face is not None else b"")
+    if "skin_image" in images:
+        digest.update(hashlib.sha256(images["skin_image"]).digest())
+    return digest.digest()
+
+
+class ReplicaRequest(BaseModel):
+    url: str
+
+
+def create_app(router: Router, admin_token: Optional[str] = None) -> FastAPI:
+    app = FastAPI(title="Face Health Analyzer Router")
+
+    def check_token(token: Optional[str]):
+        if not admin_token or token != admin_token:
+            raise HTTPException(status_code=403, detail="Changing replicas is not permitted")
+
+    @app.on_event("startup")
+    async def start_health_checks():
+        asyncio.create_task(router.watch())
+
+    @app.get("/router/status")
+    async def status():
+        return router.get_stats()
+
+    @app.post("/router/replicas", status_code=201)
+    async def add_replica(request: ReplicaRequest, x_admin_token: Optional[str] = Header(None)):
+        check_token(x_admin_token)
+        try:
+            replica = router.add(request.url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"url": replica.url, "replicas": list(router.replicas)}
+
+    @app.delete("/router/replicas")
+    async def remove_replica(url: str, x_admin_token: Optional[str] = Header(None)):
+        check_token(x_admin_token)
+        if not router.remove(url):
+            raise HTTPException(status_code=404, detail="Unknown replica")
+        return {"url": url, "replicas": list(router.replicas)}
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"])
+    async def proxy(path: str, request: Request):
+        body = await request.body()
+        replica = None
+        if path.startswith("api/jobs/") and request.method == "GET":
+            replica = router.job_owner(path[len("api/jobs/"):])
+        if replica is None:
+            key = await routing_key(request, body) if request.method == "POST" else None
+            replica = router.pick(key)
+        else:
+            key = None
+
+        target = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+        headers = {name: value for name, value in request.headers.items() if name.lower() not in HOP_BY_HOP_HEADERS}
+
+        # A replica that refuses the connection is taken out of the ring and
+        # the request goes to the next owner; nothing has been processed yet.
+        # A reset or disconnect after the request was sent is not retried:
+        # the replica may already have run a POST.
+        for _ in range(2):
+            if replica is None:
+                raise HTTPException(status_code=503, detail="No healthy replicas")
+            try:
+                status_code, response_headers, content = await run_in_threadpool(
+                    replica.request, request.method, target, body, headers
+                )
+                break
+            except ConnectionRefusedError as e:
+                logger.warning(f"Replica {replica.url} unreachable: {e}")
+                router.set_healthy(replica, False)
+                replica = router.pick(key)
+            except OSError as e:
+                raise HTTPException(status_code=502, detail=f"Replica {replica.url} failed: {e}")
+        else:
+            raise HTTPException(status_code=502, detail="Replicas unreachable")
+
+        if path == "api/jobs" and status_code == 202:
+            try:
+                router.remember_job(json.loads(content)["job_id"], replica)
+            except (ValueError, KeyError):
+                pass
+
+        headers = {name: value for name, value in response_headers if name.lower() not in HOP_BY_HOP_HEADERS}
+        headers["X-Replica"] = replica.url
+        return Response(content=content, status_code=status_code, headers=headers)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Route API requests to replicas by image hash")
+    parser.add_argument("--replica", action="append", default=[],
+                        help="Replica base URL, e.g. http://127.0.0.1:8001 (repeatable)")
+    parser.add_argument("--spawn", type=int, default=0,
+                        help="Start this many local uvicorn replicas on ports after --port, for testing")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--vnodes", type=int, default=160, help="Ring points per replica")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds to wait for a replica response")
+    parser.add_argument("--health-interval", type=float, default=5.0, help="Seconds between replica health checks")
+    args = parser.parse_args()
+
+    urls = list(args.replica) + [r for r in os.getenv("ROUTER_REPLICAS", "").split(",") if r.strip()]
+    processes = []
+    if args.spawn:
+        from local_server import start_server, stop_server
+        for index in range(args.spawn):
+            port = args.port + 1 + index
+            processes.append(start_server(port, 1, 300.0))
+            urls.append(f"http://127.0.0.1:{port}")
+    if not urls:
+        sys.exit("Pass at least one --replica (or set ROUTER_REPLICAS), or --spawn N")
+
+    import uvicorn
+    router = Router(urls, args.vnodes, args.timeout, args.health_interval)
+    try:
+        uvicorn.run(create_app(router, os.getenv("ADMIN_TOKEN")), host=args.host, port=args.port)
+    finally:
+        for process in processes:
+            stop_server(process)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import os
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = Path(__file__).parent / "runtime_config.json"
+
+# Config key -> environment variable it maps to. TensorFlow reads its thread
+# settings from the environment when its runtime starts, which is after this
+# module runs because TensorFlow is imported lazily by the model loader.
+ENV_SETTINGS = {
+    "tf_intra_op_threads": "TF_NUM_INTRAOP_THREADS",
+    "tf_inter_op_threads": "TF_NUM_INTEROP_THREADS",
+    "analysis_threads": "ANALYSIS_THREADS",
+}
+
+
+def load_runtime_config(path: Optional[str] = None) -> Dict[str, Any]:
+    """Reads the config written by autotune.py (RUNTIME_CONFIG or runtime_config.json)."""
+    config_path = Path(path or os.getenv("RUNTIME_CONFIG") or DEFAULT_PATH)
+    if not config_path.exists():
+        return {}
+
+    with open(config_path) as f:
+        config = json.load(f)
+    return config.get("recommended", config)
+
+
+def apply_runtime_config(config: Dict[str, Any]):
+    """Applies thread settings; variables already set in the environment win."""
+    for key, env_var in ENV_SETTINGS.items():
+        if key in config and env_var not in os.environ:
+            os.environ[env_var] = str(config[key])
+
+    cv2_threads = os.getenv("CV2_THREADS", config.get("cv2_threads"))
+    if cv2_threads is not None:
+        import cv2
+        cv2.setNumThreads(int(cv2_threads))
+
+    if config:
+        logger.info(f"Runtime config applied: {config}")
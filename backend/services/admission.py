@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EndpointPolicy:
+    # Capacity units one request holds while running; the full pipeline costs
+    # more than a single analyzer.
+    weight: int = 1
+    max_concurrent: int = 4
+    max_queue: int = 16
+
+
+DEFAULT_POLICIES = {
+    "/api/analyze": EndpointPolicy(weight=4, max_concurrent=2, max_queue=8),
+    "/api/analyze/base64": EndpointPolicy(weight=4, max_concurrent=2, max_queue=8),
+    "/api/analyze/age-gender": EndpointPolicy(weight=2),
+    "/api/analyze/fatigue": EndpointPolicy(weight=1),
+    "/api/analyze/symmetry": EndpointPolicy(weight=1),
+    "/api/analyze/skin": EndpointPolicy(weight=2),
+    "/api/analyze/emotion": EndpointPolicy(weight=1, max_concurrent=8, max_queue=32),
+}
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def check_deadline(deadline: Optional[float]):
+    """Raise DeadlineExceeded if a request's deadline (time.time()) has passed."""
+    if deadline is not None and time.time() >= deadline:
+        raise DeadlineExceeded("Request deadline passed before analysis started")
+
+
+class _EndpointState:
+    def __init__(self):
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+
+
+class _Waiter:
+    def __init__(self, policy: EndpointPolicy, state: _EndpointState):
+        self.policy = policy
+        self.state = state
+
+
+class AdmissionController:
+    """Per-worker admission control for the analysis endpoints.
+
+    Each endpoint has its own concurrency and queue-depth limits, and all
+    endpoints share ``capacity`` weighted units. Requests wait in one FIFO
+    queue until both allow them to run or their deadline passes; a request
+    only overtakes earlier ones that are held back by their own endpoint's
+    concurrency limit, so light requests cannot starve a heavy one waiting
+    for capacity. A request that finds its endpoint's queue full is rejected
+    immediately.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 8,
+        policies: Optional[Dict[str, EndpointPolicy]] = None,
+        default_timeout: float = 30.0,
+        retry_after: int = 2
+    ):
+        self.capacity = capacity
+        self.policies = policies if policies is not None else dict(DEFAULT_POLICIES)
+        self.default_timeout = default_timeout
+        self.retry_after = retry_after
+        self._in_use = 0
+        self._state = {path: _EndpointState() for path in self.policies}
+        self._queue: List[_Waiter] = []
+        self._condition: Optional[asyncio.Condition] = None
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        policies = dict(DEFAULT_POLICIES)
+        overrides = os.getenv("ADMISSION_POLICIES")
+        if overrides:
+            for path, values in json.loads(overrides).items():
+                policies[path] = EndpointPolicy(**values)
+
+        return cls(
+            capacity=int(os.getenv("ADMISSION_CAPACITY", "8")),
+            policies=policies,
+            default_timeout=float(os.getenv("REQUEST_TIMEOUT", "30")),
+            retry_after=int(os.getenv("ADMISSION_RETRY_AFTER", "2"))
+        )
+
+    def _can_run(self, policy: EndpointPolicy, state: _EndpointState) -> bool:
+        if state.running >= policy.max_concurrent:
+            return False
+        # A request heavier than the whole capacity may still run alone.
+        return self._in_use + policy.weight <= self.capacity or self._in_use == 0
+
+    def _first_in_line(self, waiter: Optional[_Waiter] = None) -> bool:
+        """Whether no request queued before ``waiter`` (or at all) is waiting for capacity."""
+        for queued in self._queue:
+            if queued is waiter:
+                return True
+            if queued.state.running < queued.policy.max_concurrent:
+                return False
+        return True
+
+    def _take(self, policy: EndpointPolicy, state: _EndpointState):
+        state.running += 1
+        state.admitted += 1
+        self._in_use += policy.weight
+
+    async def acquire(self, path: str, deadline: float):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+
+        policy = self.policies[path]
+        state = self._state[path]
+
+        if state.waiting == 0 and self._first_in_line() and self._can_run(policy, state):
+            self._take(policy, state)
+            return
+
+        if state.waiting >= policy.max_queue:
+            state.rejected += 1
+            raise AdmissionRejected("Server is overloaded, queue is full", self.retry_after)
+
+        waiter = _Waiter(policy, state)
+        state.waiting += 1
+        self._queue.append(waiter)
+        async with self._condition:
+            try:
+                while not (self._first_in_line(waiter) and self._can_run(policy, state)):
+                    timeout = deadline - time.time()
+                    if timeout <= 0:
+                        state.expired += 1
+                        raise AdmissionRejected("Request deadline passed while queued", self.retry_after)
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                self._take(policy, state)
+            finally:
+                state.waiting -= 1
+                self._queue.remove(waiter)
+                # Requests queued behind this one may be able to run now.
+                self._condition.notify_all()
+
+    async def release(self, path: str):
+        policy = self.policies[path]
+        state = self._state[path]
+        state.running -= 1
+        self._in_use -= policy.weight
+        async with self._condition:
+            self._condition.notify_all()
+
+    def deadline_from_headers(self, headers: Dict[bytes, bytes]) -> float:
+        """``X-Request-Deadline`` (unix seconds) or ``X-Request-Timeout`` (seconds from now)."""
+        now = time.time()
+        try:
+            if b"x-request-deadline" in headers:
+                return float(headers[b"x-request-deadline"])
+            if b"x-request-timeout" in headers:
+                return now + float(headers[b"x-request-timeout"])
+        except ValueError:
+            pass
+        return now + self.default_timeout
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "in_use": self._in_use,
+            "endpoints": {
+                path: {
+                    "running": state.running,
+                    "waiting": state.waiting,
+                    "admitted": state.admitted,
+                    "rejected": state.rejected,
+                    "expired": state.expired
+                }
+                for path, state in self._state.items()
+            }
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI middleware that admits or rejects requests before the body is read."""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path")
+        # Only the analysis POSTs are admitted; CORS preflights and other
+        # methods pass straight through.
+        if scope["type"] != "http" or scope["method"] != "POST" or path not in self.controller.policies:
+            await self.app(scope, receive, send)
+            return
+
+        deadline = self.controller.deadline_from_headers(dict(scope["headers"]))
+        try:
+            await self.controller.acquire(path, deadline)
+        except AdmissionRejected as e:
+            await self._reject(send, e)
+            return
+
+        scope.setdefault("state", {})["deadline"] = deadline
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            await self.controller.release(path)
+
+    async def _reject(self, send, error: AdmissionRejected):
+        body = json.dumps({"detail": error.reason}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(error.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
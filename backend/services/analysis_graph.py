@@ -0,0 +1,246 @@
+import time
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Any, Iterable, List, Optional, Set, Tuple
+
+import cv2
+
+from .admission import check_deadline
+from .face_analysis import FaceAnalysisService
+from .health_index import HealthIndexCalculator
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Node:
+    """One step of the analysis.
+
+    ``fn`` gets a dict with the request inputs and the values of ``deps`` and
+    returns this node's value. Nodes listing ``fields`` return a partial
+    response (as the analyzers do) that is merged into the result. Several
+    nodes may share a name as variants; the first whose ``when`` accepts the
+    inputs is used.
+    """
+    name: str
+    fn: Callable[[Dict[str, Any]], Any]
+    deps: Tuple[str, ...] = ()
+    fields: Tuple[str, ...] = ()
+    when: Optional[Callable[[Dict[str, Any]], bool]] = None
+    variant: str = ""
+
+
+class AnalysisGraph:
+    """Dependency graph of the analysis pipeline.
+
+    ``run`` computes only the nodes needed for the requested response fields,
+    each once, running nodes whose dependencies are done concurrently on
+    ``executor``. Per-node timings are returned with every run and
+    accumulated for ``describe``.
+    """
+
+    def __init__(self, nodes: List[Node], executor: Optional[ThreadPoolExecutor] = None):
+        self.executor = executor
+        self.nodes: Dict[str, List[Node]] = {}
+        for node in nodes:
+            self.nodes.setdefault(node.name, []).append(node)
+        self.fields: Dict[str, str] = {
+            field: node.name for node in nodes for field in node.fields
+        }
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _select(self, name: str, inputs: Dict[str, Any]) -> Optional[Node]:
+        for node in self.nodes[name]:
+            if node.when is None or node.when(inputs):
+                return node
+        return None
+
+    def plan(self, fields: Optional[Iterable[str]], inputs: Dict[str, Any]) -> Dict[str, Node]:
+        """The nodes needed for ``fields`` (all fields if None), in dependency order."""
+        fields = list(self.fields) if fields is None else list(fields)
+        unknown = [field for field in fields if field not in self.fields]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(self.fields)}")
+
+        planned: Dict[str, Node] = {}
+        visiting: Set[str] = set()
+
+        def visit(name: str):
+            if name in planned or name in inputs:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle at {name}")
+            node = self._select(name, inputs)
+            if node is None:
+                return
+            visiting.add(name)
+            for dep in node.deps:
+                visit(dep)
+            visiting.discard(name)
+            planned[name] = node
+
+        for field in fields:
+            visit(self.fields[field])
+        return planned
+
+    def run(self, inputs: Dict[str, Any], fields: Optional[Iterable[str]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Returns the merged response fields and a trace of the nodes that ran."""
+        planned = self.plan(fields, inputs)
+        values: Dict[str, Any] = dict(inputs)
+        timings: Dict[str, Dict[str, float]] = {}
+        start = time.perf_counter()
+
+        def call(node: Node):
+            node_start = time.perf_counter()
+            value = node.fn({name: values.get(name) for name in list(inputs) + list(node.deps)})
+            timings[node.name] = {
+                "start_ms": round((node_start - start) * 1000, 2),
+                "duration_ms": round((time.perf_counter() - node_start) * 1000, 2)
+            }
+            return value
+
+        pending = dict(planned)
+        if self.executor is None:
+            for name, node in pending.items():
+                values[name] = call(node)
+        else:
+            running = {}
+            try:
+                while pending or running:
+                    ready = [node for node in pending.values()
+                             if all(dep in values or dep not in planned for dep in node.deps)]
+                    for node in ready:
+                        del pending[node.name]
+                        # Copy the caller's context so the model version pinned by
+                        # model_loader.acquire() applies in the worker thread.
+                        future = self.executor.submit(contextvars.copy_context().run, call, node)
+                        running[future] = node.name
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        values[running.pop(future)] = future.result()
+            except BaseException:
+                # Nodes handle their own analysis errors, so this is a failed
+                # decode or a passed deadline. Don't leave nodes running on
+                # the executor after the request has failed.
+                for future in running:
+                    future.cancel()
+                wait(running)
+                raise
+
+        result: Dict[str, Any] = {"confidence_scores": {}}
+        requested = set(self.fields) if fields is None else set(fields)
+        for name, node in planned.items():
+            if node.fields and any(field in requested for field in node.fields):
+                FaceAnalysisService._merge(result, values[name])
+
+        self._record(timings)
+        trace = {
+            "total_ms": round((time.perf_counter() - start) * 1000, 2),
+            "nodes": {name: dict(timings[name], variant=planned[name].variant or None) for name in planned}
+        }
+        return result, trace
+
+    def _record(self, timings: Dict[str, Dict[str, float]]):
+        with self._lock:
+            for name, timing in timings.items():
+                stats = self._stats.setdefault(name, {"runs": 0, "total_ms": 0.0})
+                stats["runs"] += 1
+                stats["total_ms"] += timing["duration_ms"]
+
+    def describe(self) -> Dict[str, Any]:
+        """Nodes with their dependencies, variants, fields and average duration so far."""
+        with self._lock:
+            stats = {name: dict(values) for name, values in self._stats.items()}
+        nodes = {}
+        for name, variants in self.nodes.items():
+            runs = stats.get(name, {}).get("runs", 0)
+            nodes[name] = {
+                "variants": [
+                    {"variant": node.variant or None, "deps": list(node.deps), "conditional": node.when is not None}
+                    for node in variants
+                ],
+                "fields": sorted({field for node in variants for field in node.fields}),
+                "runs": runs,
+                "avg_ms": round(stats[name]["total_ms"] / runs, 2) if runs else None
+            }
+        return {"fields": self.fields, "nodes": nodes}
+
+
+def _merged(values: Dict[str, Any], names: Iterable[str]) -> Dict[str, Any]:
+    result: Dict[str, Any] = {"confidence_scores": {}}
+    for name in names:
+        FaceAnalysisService._merge(result, values[name])
+    return result
+
+
+def build_analysis_graph(face_service: FaceAnalysisService, health_calculator: HealthIndexCalculator,
+                         decode: Callable[[bytes], Any]) -> AnalysisGraph:
+    """The /api/analyze pipeline.
+
+    Inputs: ``face_data`` and ``skin_data`` (encoded images, skin optional;
+    anything ``decode`` accepts, so ``FaceAnalysisService.analyze_complete``
+    passes arrays with an identity decode), ``include_landmarks``, ``report_id`` (the id to archive landmarks under,
+    optional) and ``deadline``, which is checked after decoding so expired
+    requests never reach the models.
+    """
+    def has_skin(inputs):
+        return inputs.get("skin_data") is not None
+
+    def decoded(key):
+        def node(v):
+            image = decode(v[key])
+            check_deadline(v.get("deadline"))
+            return image
+        return node
+
+    def symmetry(v):
+        h, w = v["face"].shape[:2]
+        return {"symmetry": face_service.symmetry_from_landmarks(v["landmarks"], w, h, v["include_landmarks"])}
+
+    def archive(v):
+        if v["landmarks"] is None:
+            return {}
+        h, w = v["face"].shape[:2]
+        return {"report_id": face_service.archive_landmarks(
+            v["landmarks"], w, h, v["symmetry"]["symmetry"], v.get("report_id")
+        )}
+
+    def age_gender(v):
+        box = v["detect"]
+        crop = None
+        if box is not None:
+            x, y, w, h = box
+            crop = v["face"][y:y+h, x:x+w]
+        return face_service.age_gender_from_crop(crop)
+
+    scored = ("symmetry", "fatigue", "skin", "emotion")
+    nodes = [
+        Node("face", decoded("face_data"), ("face_data",)),
+        Node("skin_image", decoded("skin_data"), ("skin_data",), when=has_skin),
+        Node("gray", lambda v: cv2.cvtColor(v["face"], cv2.COLOR_RGB2GRAY), ("face",)),
+        Node("detect", lambda v: face_service.detect_face_box(v["gray"]), ("gray",)),
+        Node("landmarks", lambda v: face_service.detect_landmarks(v["face"]), ("face",)),
+        Node("age_gender", age_gender, ("face", "detect"), ("age", "gender", "embedding_match")),
+        Node("fatigue", lambda v: face_service.fatigue_from_gray(v["gray"]), ("gray",), ("fatigue",)),
+        Node("emotion", lambda v: face_service.emotion_from_face(v["gray"], v["detect"]), ("gray", "detect"),
+             ("emotion",)),
+        Node("symmetry", symmetry, ("face", "landmarks"), ("symmetry",)),
+        Node("archive", archive, ("face", "landmarks", "symmetry"), ("report_id",),
+             when=lambda inputs: bool(face_service.landmark_archive_path)),
+        Node("skin", lambda v: face_service.analyze_skin(v["skin_image"]), ("skin_image",),
+             ("skin_condition", "skin_regions"), when=has_skin, variant="close-up"),
+        Node("skin", lambda v: face_service.skin_from_face(v["face"], v["landmarks"]), ("face", "landmarks"),
+             ("skin_condition", "skin_regions"), variant="face patches"),
+        Node("health_index",
+             lambda v: {"health_index": health_calculator.calculate_health_index(_merged(v, scored))},
+             scored, ("health_index",)),
+        Node("recommendations",
+             lambda v: {"recommendations": health_calculator.generate_recommendations(
+                 _merged(v, ("age_gender",) + scored))},
+             ("age_gender",) + scored, ("recommendations",)),
+    ]
+    return AnalysisGraph(nodes, face_service.executor)
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import fcntl
+import logging
+import threading
+from pathlib import Path
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RECORD_DTYPE = np.dtype([
+    ("timestamp", "f8"),
+    ("age", "i4"),
+    ("gender", "U16"),
+    ("age_confidence", "f4"),
+    ("gender_confidence", "f4"),
+])
+
+
+class EmbeddingIndex:
+    """Approximate nearest-neighbour index of face embeddings on disk.
+
+    Embeddings and the age/gender predictions made for them are appended to
+    memory-mapped ``.npy`` files under ``path``, with the row count in
+    ``index.json``. Lookups use random-hyperplane LSH: each of ``n_tables``
+    tables hashes a vector to ``n_bits`` sign bits, the rows sharing a bucket
+    with the query in any table are candidates, and the best candidate is
+    picked by exact cosine similarity. Several worker processes can share one
+    directory; appends are serialized with a file lock and each process hashes
+    rows added by the others before it answers a query.
+
+    When the files are full they are rewritten without the faces older than
+    ``window_seconds`` (which queries ignore anyway) and with at most
+    ``max_faces`` rows, dropping the oldest faces beyond that. A rewrite
+    renumbers the rows, so it bumps ``generation`` in ``index.json`` and every
+    process rebuilds its buckets on its next sync.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dim: int,
+        threshold: float = 0.92,
+        window_seconds: float = 30 * 24 * 3600,
+        n_tables: int = 8,
+        n_bits: int = 12,
+        initial_capacity: int = 1024,
+        max_faces: int = 1_000_000
+    ):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.threshold = threshold
+        self.window_seconds = window_seconds
+        self.initial_capacity = initial_capacity
+        self.max_faces = max_faces
+        self._lock = threading.Lock()
+        self._lock_path = self.path / "index.lock"
+
+        with self._file_lock():
+            meta = self._read_meta()
+            if meta is None:
+                meta = {"dim": dim, "count": 0, "capacity": initial_capacity,
+                        "n_tables": n_tables, "n_bits": n_bits, "seed": int(time.time())}
+                np.lib.format.open_memmap(self.path / "vectors.npy", mode="w+", dtype="float32",
+                                          shape=(initial_capacity, dim)).flush()
+                np.lib.format.open_memmap(self.path / "records.npy", mode="w+", dtype=RECORD_DTYPE,
+                                          shape=(initial_capacity,)).flush()
+                self._write_meta(meta)
+            elif meta["dim"] != dim:
+                raise ValueError(f"Embedding index at {self.path} has dim {meta['dim']}, expected {dim}")
+
+        self.dim = meta["dim"]
+        self.n_tables = meta["n_tables"]
+        self.n_bits = meta["n_bits"]
+        self.seed = meta["seed"]
+        rng = np.random.default_rng(self.seed)
+        self.planes = rng.standard_normal((self.n_tables, self.n_bits, self.dim)).astype("float32")
+        self._powers = 1 << np.arange(self.n_bits)
+
+        self.count = 0
+        self.capacity = 0
+        self.generation: Optional[int] = None
+        self.buckets: List[Dict[int, List[int]]] = [defaultdict(list) for _ in range(self.n_tables)]
+        self._sync(meta)
+        logger.info(f"Embedding index at {self.path} opened with {self.count} faces")
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_meta(self) -> Optional[Dict[str, Any]]:
+        meta_path = self.path / "index.json"
+        if not meta_path.exists():
+            return None
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def _write_meta(self, meta: Dict[str, Any]):
+        tmp_path = self.path / "index.json.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.path / "index.json")
+
+    def _sync(self, meta: Dict[str, Any]):
+        """Picks up rows (and any rewrite) written since the last sync, possibly by another process."""
+        generation = meta.get("generation", 0)
+        if generation != self.generation:
+            # Rows were renumbered by _rebuild; hash them all again.
+            self.buckets = [defaultdict(list) for _ in range(self.n_tables)]
+            self.count = 0
+            self.capacity = 0
+            self.generation = generation
+
+        if meta["capacity"] != self.capacity:
+            self.vectors = np.load(self.path / "vectors.npy", mmap_mode="r+")
+            self.records = np.load(self.path / "records.npy", mmap_mode="r+")
+            self.capacity = meta["capacity"]
+
+        if meta["count"] > self.count:
+            new_rows = range(self.count, meta["count"])
+            keys = self._hash(self.vectors[self.count:meta["count"]])
+            for table in range(self.n_tables):
+                for row, key in zip(new_rows, keys[:, table]):
+                    self.buckets[table][int(key)].append(row)
+            self.count = meta["count"]
+
+    def _rebuild(self, meta: Dict[str, Any], now: float):
+        """Rewrites full files without expired faces, keeping at most ``max_faces`` with room to add more."""
+        timestamps = self.records["timestamp"][:meta["count"]]
+        keep = np.flatnonzero(timestamps >= now - self.window_seconds)
+        # Keep a quarter of max_faces free, so a full index is not rewritten
+        # on every add.
+        limit = self.max_faces * 3 // 4
+        if len(keep) > limit:
+            newest = np.argsort(timestamps[keep], kind="stable")[len(keep) - limit:]
+            keep = np.sort(keep[newest])
+        new_capacity = min(self.max_faces, max(2 * len(keep), self.initial_capacity))
+
+        for name, current, dtype, shape in (
+            ("vectors.npy", self.vectors, np.dtype("float32"), (new_capacity, self.dim)),
+            ("records.npy", self.records, RECORD_DTYPE, (new_capacity,)),
+        ):
+            tmp_path = self.path / (name + ".tmp")
+            rebuilt = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=shape)
+            rebuilt[:len(keep)] = current[keep]
+            rebuilt.flush()
+            del rebuilt
+            os.replace(tmp_path, self.path / name)
+
+        dropped = meta["count"] - len(keep)
+        meta["count"] = len(keep)
+        meta["capacity"] = new_capacity
+        meta["generation"] = meta.get("generation", 0) + 1
+        self._write_meta(meta)
+        if dropped:
+            logger.info(f"Embedding index at {self.path} dropped {dropped} old faces")
+
+    def _hash(self, vectors: np.ndarray) -> np.ndarray:
+        """Bucket key of every vector in every table, shape (n, n_tables)."""
+        bits = np.einsum("tbd,nd->ntb", self.planes, vectors) > 0
+        return bits.astype(np.int64) @ self._powers
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype="float32").reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def query(self, embedding: np.ndarray, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """The most similar face analyzed within the window, if it is at least ``threshold`` similar."""
+        vector = self._normalize(embedding)
+        now = now or time.time()
+        with self._lock:
+            self._sync(self._read_meta())
+
+            candidates = set()
+            for table, key in enumerate(self._hash(vector[np.newaxis])[0]):
+                candidates.update(self.buckets[table].get(int(key), ()))
+            if not candidates:
+                return None
+
+            rows = np.fromiter(candidates, dtype=np.int64)
+            rows = rows[self.records["timestamp"][rows] >= now - self.window_seconds]
+            if not len(rows):
+                return None
+
+            similarities = self.vectors[rows] @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+
+            record = self.records[rows[best]]
+            return {
+                "similarity": float(similarities[best]),
+                "age": int(record["age"]),
+                "gender": str(record["gender"]),
+                "age_confidence": float(record["age_confidence"]),
+                "gender_confidence": float(record["gender_confidence"]),
+                "analyzed_at": float(record["timestamp"]),
+            }
+
+    def add(self, embedding: np.ndarray, age: int, gender: str,
+            age_confidence: float, gender_confidence: float, now: Optional[float] = None):
+        vector = self._normalize(embedding)
+        now = now or time.time()
+        with self._lock, self._file_lock():
+            # Sync first: another process may have added rows or rewritten
+            # the files, and _rebuild copies from this process's mapping.
+            meta = self._read_meta()
+            self._sync(meta)
+            if meta["count"] >= meta["capacity"]:
+                self._rebuild(meta, now)
+                self._sync(meta)
+
+            row = meta["count"]
+            self.vectors[row] = vector
+            self.records[row] = (now, age, gender, age_confidence, gender_confidence)
+            self.vectors.flush()
+            self.records.flush()
+
+            meta["count"] += 1
+            self._write_meta(meta)
+            self._sync(meta)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"faces": self.count, "capacity": self.capacity, "max_faces": self.max_faces, "dim": self.dim}
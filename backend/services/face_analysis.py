@@ -1,116 +1,303 @@
+import os
 import cv2
+import uuid
 import numpy as np
-import mediapipe as mp
-from typing import Optional, Dict, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Iterator, List, Tuple
 import logging
 
+from .embedding_index import EmbeddingIndex
+from .landmark_archive import LandmarkArchive
+
 logger = logging.getLogger(__name__)
 
+# Marks a model call that raised, as opposed to a model that is not loaded.
+PREDICT_FAILED = object()
+
 
 class FaceAnalysisService:
-    def __init__(self, model_loader):
+    CASCADE_FILES = {
+        'face': 'haarcascade_frontalface_default.xml',
+        'eye': 'haarcascade_eye.xml'
+    }
+
+    def __init__(self, model_loader, executor: Optional[ThreadPoolExecutor] = None):
         self.model_loader = model_loader
-        self.mp_face_mesh = mp.solutions.face_mesh
-        self.face_mesh = self.mp_face_mesh.FaceMesh(
-            static_image_mode=True,
-            max_num_faces=1,
-            refine_landmarks=True
-        )
-        self.face_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        )
-        self.eye_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_eye.xml'
-        )
+        # Independent nodes of the analysis graph (see analyze_complete and
+        # analysis_graph) run concurrently on this executor; pass one in to
+        # share it, or set ANALYSIS_THREADS=0 to run them sequentially.
+        if executor is None:
+            threads = int(os.getenv("ANALYSIS_THREADS", "4"))
+            executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="analysis") if threads > 0 else None
+        self.executor = executor
+
+        # The FaceMesh graph is built on first use (see face_mesh) so importing
+        # and constructing the service stays cheap. It is not thread-safe;
+        # cascades are kept per thread.
+        self._face_mesh = None
+        self._mesh_lock = threading.Lock()
+        self._local = threading.local()
 
         self.LEFT_POINTS = [33, 159, 145, 61, 78, 95]
         self.RIGHT_POINTS = [263, 386, 374, 291, 308, 324]
         self.ASYMMETRY_THRESHOLD = 0.04
 
-        self.SKIN_CONDITIONS = [
-            'Acne',
-            'Actinic Keratosis',
-            'Basal Cell Carcinoma',
-            'Dermatofibroma',
-            'Melanocytic Nevi',
-            'Melanoma',
-            'Seborrheic Keratoses',
-            'Squamous Cell Carcinoma',
-            'Vascular Lesion',
-            'Normal'
-        ]
+        # Skin patches taken from the face image when no close-up is uploaded,
+        # centred on these FaceMesh landmarks and sized relative to the face
+        # width (distance between landmarks 234 and 454).
+        self.FACE_EDGE_POINTS = (234, 454)
+        self.SKIN_PATCH_POINTS = {
+            'left_cheek': 205,
+            'right_cheek': 425,
+            'forehead': 151
+        }
+        self.SKIN_PATCH_SCALE = 0.2
+
+        # Skin close-ups with a shorter side of at least SKIN_TILE_MIN_SIDE
+        # pixels (unset or 0: never, unless a request asks for it) are analyzed
+        # as overlapping tiles instead of being shrunk to the model input; tiles whose grey-level standard
+        # deviation is below SKIN_TILE_MIN_STD are treated as background.
+        self.SKIN_TILE_SIZE = 224
+        self.SKIN_TILE_OVERLAP = 0.25
+        self.skin_tile_min_side = int(os.getenv("SKIN_TILE_MIN_SIDE", "0"))
+        self.skin_tile_min_std = float(os.getenv("SKIN_TILE_MIN_STD", "6"))
+        self.skin_tile_batch = int(os.getenv("SKIN_TILE_BATCH", "32"))
 
         self.EMOTIONS = ['Angry', 'Happy', 'Neutral', 'Sad', 'Surprised']
 
-    def analyze_complete(self, face_image: np.ndarray, skin_image: Optional[np.ndarray] = None) -> Dict[str, Any]:
-        result = {}
-
-        age_gender = self.analyze_age_gender(face_image)
-        result.update(age_gender)
+        # Repeat users: with EMBEDDING_INDEX_PATH set, a face matching one
+        # analyzed within the window reuses its age and gender instead of
+        # running those models again. One index per model version, since
+        # embeddings from different versions are not comparable.
+        self.embedding_index_path = os.getenv("EMBEDDING_INDEX_PATH")
+        self.embedding_threshold = float(os.getenv("EMBEDDING_MATCH_THRESHOLD", "0.92"))
+        self.embedding_window = float(os.getenv("EMBEDDING_MATCH_WINDOW_DAYS", "30")) * 24 * 3600
+        self.embedding_max_faces = int(os.getenv("EMBEDDING_INDEX_MAX_FACES", "1000000"))
+        self._embedding_indexes: Dict[str, EmbeddingIndex] = {}
+        self._embedding_lock = threading.Lock()
+
+        # With LANDMARK_ARCHIVE_PATH set, analyze_complete keeps the FaceMesh
+        # landmarks of each face under a report_id so symmetry can be
+        # rescored later (rescore_symmetry.py) without the image.
+        self.landmark_archive_path = os.getenv("LANDMARK_ARCHIVE_PATH")
+        self._landmark_archive: Optional[LandmarkArchive] = None
+        self._archive_lock = threading.Lock()
+
+        self._analysis_graph = None
+
+    @property
+    def face_mesh(self):
+        if self._face_mesh is None:
+            self.warm_up()
+        return self._face_mesh
+
+    def warm_up(self):
+        """Builds the FaceMesh graph, ahead of the first request if called at startup."""
+        with self._mesh_lock:
+            if self._face_mesh is None:
+                import mediapipe as mp
+                self._face_mesh = mp.solutions.face_mesh.FaceMesh(
+                    static_image_mode=True,
+                    max_num_faces=1,
+                    refine_landmarks=True
+                )
+
+    @property
+    def face_cascade(self):
+        return self._cascade('face')
+
+    @property
+    def eye_cascade(self):
+        return self._cascade('eye')
+
+    def _cascade(self, name: str):
+        cascade = getattr(self._local, name, None)
+        if cascade is None:
+            cascade = cv2.CascadeClassifier(cv2.data.haarcascades + self.CASCADE_FILES[name])
+            setattr(self._local, name, cascade)
+        return cascade
+
+    @property
+    def analysis_graph(self):
+        """The /api/analyze graph over already decoded images."""
+        if self._analysis_graph is None:
+            # Imported here: analysis_graph imports this module.
+            from .analysis_graph import build_analysis_graph
+            from .health_index import HealthIndexCalculator
+            self._analysis_graph = build_analysis_graph(self, HealthIndexCalculator(), lambda image: image)
+        return self._analysis_graph
+
+    def analyze_complete(
+        self,
+        face_image: np.ndarray,
+        skin_image: Optional[np.ndarray] = None,
+        include_landmarks: bool = False,
+        report_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Every analyzer of /api/analyze on decoded images, run on the same graph.
+
+        The health index and recommendations are left to the caller.
+        """
+        graph = self.analysis_graph
+        fields = [field for field in graph.fields if field not in ("health_index", "recommendations")]
+        result, _ = graph.run(
+            {"face_data": face_image, "skin_data": skin_image, "include_landmarks": include_landmarks,
+             "deadline": None, "report_id": report_id},
+            fields
+        )
+        return result
 
-        fatigue = self.analyze_fatigue(face_image)
-        result.update(fatigue)
+    def analyze_batch(self, face_images: List[np.ndarray]) -> List[Dict[str, Any]]:
+        """analyze_complete for many face images with one predict call per model.
+
+        Skin results come from the face patches (there is no close-up). Used for
+        offline bulk analysis, where batching model calls matters more than the
+        latency of a single image.
+        """
+        crops = [self._detect_face_crop(image) for image in face_images]
+        grays = [cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) for image in face_images]
+        landmarks = [self.detect_landmarks(image) for image in face_images]
+        patches = [self.extract_skin_patches(image, lm) for image, lm in zip(face_images, landmarks)]
+
+        face_rows = {i: row for row, i in enumerate(i for i, crop in enumerate(crops) if crop is not None)}
+        face_crops = [crop for crop in crops if crop is not None]
+        age_preds = self._predict_many("age", face_crops)
+        gender_preds = self._predict_many("gender", face_crops)
+        fatigue_preds = self._predict_many("fatigue", grays)
+        skin_preds = self._predict_many("skin", [p for image_patches in patches for p in image_patches])
+
+        results = []
+        skin_offset = 0
+        for i, image in enumerate(face_images):
+            h, w = image.shape[:2]
+            face_row = face_rows.get(i)
+            partials = [
+                self._age_gender_result(
+                    face_row is not None,
+                    self._row(age_preds, face_row) if face_row is not None else None,
+                    self._row(gender_preds, face_row) if face_row is not None else None
+                ),
+                self._fatigue_result(grays[i], self._row(fatigue_preds, i)),
+                self.analyze_emotion(image),
+                {"symmetry": self.symmetry_from_landmarks(landmarks[i], w, h)}
+            ]
+
+            count = len(patches[i])
+            if count:
+                image_skin = skin_preds
+                if skin_preds is not None and skin_preds is not PREDICT_FAILED:
+                    image_skin = skin_preds[skin_offset:skin_offset + count]
+                partials.append(self._skin_patches_result(patches[i], image_skin))
+            else:
+                partials.append({"skin_condition": None})
+            skin_offset += count
 
-        emotion = self.analyze_emotion(face_image)
-        result.update(emotion)
+            result = {"confidence_scores": {}}
+            for partial in partials:
+                self._merge(result, partial)
+            results.append(result)
 
-        symmetry = self.analyze_symmetry(face_image)
-        result["symmetry"] = symmetry
+        return results
 
-        if skin_image is not None:
-            skin_result = self.analyze_skin(skin_image)
-            result.update(skin_result)
-        else:
-            result["skin_condition"] = None
-            result["confidence_scores"] = result.get("confidence_scores", {})
+    @staticmethod
+    def _merge(result: Dict[str, Any], partial: Dict[str, Any]):
+        for key, value in partial.items():
+            if key == "confidence_scores":
+                result["confidence_scores"].update(value)
+            else:
+                result[key] = value
 
-        return result
+    def skin_from_face(self, face_image: np.ndarray, landmarks) -> Dict[str, Any]:
+        try:
+            patches = self.extract_skin_patches(face_image, landmarks)
+        except Exception as e:
+            logger.error(f"Skin patch extraction error: {e}")
+            patches = []
+        if patches:
+            return self.analyze_skin_patches(patches)
+        return {"skin_condition": None}
+
+    def _predict_many(self, name: str, images: List[np.ndarray]):
+        """One batched predict over ``images``.
+
+        Returns None when the model is not loaded (or there is nothing to
+        predict) and PREDICT_FAILED when the call raised.
+        """
+        if not images or not self.model_loader.is_loaded(name):
+            return None
+        try:
+            batch = np.stack([self.model_loader.preprocess(name, img) for img in images])
+            return self.model_loader.predict(name, batch)
+        except Exception as e:
+            logger.error(f"{name.capitalize()} model prediction error: {e}")
+            return PREDICT_FAILED
+
+    @staticmethod
+    def _row(predictions, index: int):
+        if predictions is None or predictions is PREDICT_FAILED:
+            return predictions
+        return predictions[index]
+
+    def _detect_face_box(self, gray: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+        faces = self.face_cascade.detectMultiScale(gray, 1.1, 4)
+        if len(faces) == 0:
+            return None
+        x, y, w, h = faces[0]
+        return int(x), int(y), int(w), int(h)
+
+    def detect_face_box(self, gray: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+        """The first face found in a grey image, or None if there is none or detection fails."""
+        try:
+            return self._detect_face_box(gray)
+        except Exception as e:
+            logger.error(f"Face detection error: {e}")
+            return None
+
+    def _detect_face_crop(self, image: np.ndarray) -> Optional[np.ndarray]:
+        box = self._detect_face_box(cv2.cvtColor(image, cv2.COLOR_RGB2GRAY))
+        if box is None:
+            return None
+        x, y, w, h = box
+        return image[y:y+h, x:x+w]
+
+    def _age_gender_result(self, has_face: bool, age_pred, gender_pred) -> Dict[str, Any]:
+        age = 30
+        gender = "Unknown"
+        age_confidence = 0.0
+        gender_confidence = 0.0
+
+        if has_face:
+            if age_pred is PREDICT_FAILED:
+                age = 25 + int(np.random.randint(0, 20))
+                age_confidence = 0.5
+            elif age_pred is not None:
+                age = int(age_pred[0])
+                age_confidence = 0.85
+
+            if gender_pred is PREDICT_FAILED:
+                gender = "Male" if np.random.random() > 0.5 else "Female"
+                gender_confidence = 0.5
+            elif gender_pred is not None:
+                gender = self.model_loader.labels("gender")[int(gender_pred[0] > 0.5)]
+                gender_confidence = float(abs(gender_pred[0] - 0.5) * 2)
+
+        return {
+            "age": age,
+            "gender": gender,
+            "confidence_scores": {
+                "age": round(age_confidence, 2),
+                "gender": round(gender_confidence, 2)
+            }
+        }
 
     def analyze_age_gender(self, image: np.ndarray) -> Dict[str, Any]:
         try:
-            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-            faces = self.face_cascade.detectMultiScale(gray, 1.1, 4)
-
-            age = 30
-            gender = "Unknown"
-            age_confidence = 0.0
-            gender_confidence = 0.0
-
-            if len(faces) > 0:
-                x, y, w, h = faces[0]
-                face_roi = cv2.resize(image[y:y+h, x:x+w], (224, 224))
-                face_roi = face_roi.astype('float32') / 255.0
-                face_roi = np.expand_dims(face_roi, axis=0)
-
-                if self.model_loader.age_model:
-                    try:
-                        age_pred = self.model_loader.age_model.predict(face_roi, verbose=0)
-                        age = int(age_pred[0][0])
-                        age_confidence = 0.85
-                    except:
-                        age = 25 + np.random.randint(0, 20)
-                        age_confidence = 0.5
-
-                if self.model_loader.gender_model:
-                    try:
-                        gender_pred = self.model_loader.gender_model.predict(face_roi, verbose=0)
-                        gender = "Male" if gender_pred[0][0] > 0.5 else "Female"
-                        gender_confidence = float(abs(gender_pred[0][0] - 0.5) * 2)
-                    except:
-                        gender = "Male" if np.random.random() > 0.5 else "Female"
-                        gender_confidence = 0.5
-            else:
-                age = 30
-                gender = "Unknown"
-
-            return {
-                "age": age,
-                "gender": gender,
-                "confidence_scores": {
-                    "age": round(age_confidence, 2),
-                    "gender": round(gender_confidence, 2)
-                }
-            }
+            face_crop = self._detect_face_crop(image)
+            crops = [face_crop] if face_crop is not None else []
+            age_pred = self._row(self._predict_many("age", crops), 0)
+            gender_pred = self._row(self._predict_many("gender", crops), 0)
+            return self._age_gender_result(face_crop is not None, age_pred, gender_pred)
 
         except Exception as e:
             logger.error(f"Age/Gender analysis error: {e}")
@@ -120,44 +307,115 @@ class FaceAnalysisService:
                 "confidence_scores": {"age": 0.0, "gender": 0.0}
             }
 
-    def analyze_fatigue(self, image: np.ndarray) -> Dict[str, Any]:
+    def age_gender_from_crop(self, face_crop: Optional[np.ndarray]) -> Dict[str, Any]:
+        """Age and gender of a detected face (None if there is none), using the embedding index when enabled."""
+        if face_crop is None:
+            return self._age_gender_result(False, None, None)
+
+        if self.embedding_index_path and self.model_loader.is_loaded("age"):
+            try:
+                return self._age_gender_indexed(face_crop)
+            except Exception as e:
+                logger.error(f"Embedding index error: {e}")
+
         try:
-            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            age_pred = self._row(self._predict_many("age", [face_crop]), 0)
+            gender_pred = self._row(self._predict_many("gender", [face_crop]), 0)
+            return self._age_gender_result(True, age_pred, gender_pred)
+        except Exception as e:
+            logger.error(f"Age/Gender analysis error: {e}")
+            return self._age_gender_result(False, None, None)
+
+    def _age_gender_indexed(self, face_crop: np.ndarray) -> Dict[str, Any]:
+        embedding = self.model_loader.embed(
+            np.expand_dims(self.model_loader.preprocess("age", face_crop), axis=0)
+        )[0]
+        index = self._embedding_index(len(embedding))
+        match = index.query(embedding)
+        if match is not None:
+            return {
+                "age": match["age"],
+                "gender": match["gender"],
+                "confidence_scores": {
+                    "age": round(match["age_confidence"], 2),
+                    "gender": round(match["gender_confidence"], 2)
+                },
+                "embedding_match": {
+                    "similarity": round(match["similarity"], 4),
+                    "analyzed_at": match["analyzed_at"],
+                    "reused": ["age", "gender"]
+                }
+            }
 
-            if self.model_loader.fatigue_model:
-                try:
-                    face_gray = cv2.resize(gray, (100, 100))
-                    face_gray = face_gray.astype('float32') / 255.0
-                    face_gray = np.expand_dims(face_gray, axis=-1)
-                    face_gray = np.expand_dims(face_gray, axis=0)
-
-                    fatigue_pred = self.model_loader.fatigue_model.predict(face_gray, verbose=0)
-                    fatigue_status = "Fatigued" if fatigue_pred[0][0] > 0.5 else "Not Fatigued"
-                    confidence = float(abs(fatigue_pred[0][0] - 0.5) * 2)
-
-                    return {
-                        "fatigue": fatigue_status,
-                        "confidence_scores": {
-                            **{"fatigue": round(confidence, 2)}
-                        }
-                    }
-                except Exception as e:
-                    logger.error(f"Fatigue model prediction error: {e}")
-
-            eyes = self.eye_cascade.detectMultiScale(gray, 1.1, 4)
-
-            if len(eyes) >= 2:
-                fatigue_status = "Not Fatigued"
-            elif len(eyes) == 1:
-                fatigue_status = "Slightly Fatigued"
-            else:
-                fatigue_status = "Fatigued"
+        age_pred = self._row(self._predict_many("age", [face_crop]), 0)
+        gender_pred = self._row(self._predict_many("gender", [face_crop]), 0)
+        result = self._age_gender_result(True, age_pred, gender_pred)
+        # Only real predictions are remembered, not the random fallbacks.
+        if all(p is not None and p is not PREDICT_FAILED for p in (age_pred, gender_pred)):
+            index.add(
+                embedding, result["age"], result["gender"],
+                result["confidence_scores"]["age"], result["confidence_scores"]["gender"]
+            )
+        return result
 
+    def _embedding_index(self, dim: int) -> EmbeddingIndex:
+        version = self.model_loader.version
+        with self._embedding_lock:
+            index = self._embedding_indexes.get(version)
+            if index is None:
+                index = EmbeddingIndex(
+                    os.path.join(self.embedding_index_path, version),
+                    dim,
+                    threshold=self.embedding_threshold,
+                    window_seconds=self.embedding_window,
+                    max_faces=self.embedding_max_faces
+                )
+                self._embedding_indexes[version] = index
+            return index
+
+    def get_embedding_index_stats(self) -> Optional[Dict[str, Any]]:
+        if not self.embedding_index_path:
+            return None
+        return {version: index.get_stats() for version, index in self._embedding_indexes.items()}
+
+    def _fatigue_result(self, gray: np.ndarray, fatigue_pred) -> Dict[str, Any]:
+        if fatigue_pred is not None and fatigue_pred is not PREDICT_FAILED:
+            fatigue_status = self.model_loader.labels("fatigue")[int(fatigue_pred[0] > 0.5)]
+            confidence = float(abs(fatigue_pred[0] - 0.5) * 2)
             return {
                 "fatigue": fatigue_status,
-                "confidence_scores": {"fatigue": 0.7}
+                "confidence_scores": {"fatigue": round(confidence, 2)}
             }
 
+        eyes = self.eye_cascade.detectMultiScale(gray, 1.1, 4)
+
+        if len(eyes) >= 2:
+            fatigue_status = "Not Fatigued"
+        elif len(eyes) == 1:
+            fatigue_status = "Slightly Fatigued"
+        else:
+            fatigue_status = "Fatigued"
+
+        return {
+            "fatigue": fatigue_status,
+            "confidence_scores": {"fatigue": 0.7}
+        }
+
+    def analyze_fatigue(self, image: np.ndarray) -> Dict[str, Any]:
+        try:
+            return self.fatigue_from_gray(cv2.cvtColor(image, cv2.COLOR_RGB2GRAY))
+        except Exception as e:
+            logger.error(f"Fatigue analysis error: {e}")
+            return {
+                "fatigue": "Unknown",
+                "confidence_scores": {"fatigue": 0.0}
+            }
+
+    def fatigue_from_gray(self, gray: np.ndarray) -> Dict[str, Any]:
+        try:
+            fatigue_pred = self._row(self._predict_many("fatigue", [gray]), 0)
+            return self._fatigue_result(gray, fatigue_pred)
+
         except Exception as e:
             logger.error(f"Fatigue analysis error: {e}")
             return {
@@ -168,10 +426,18 @@ class FaceAnalysisService:
     def analyze_emotion(self, image: np.ndarray) -> Dict[str, Any]:
         try:
             gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-            faces = self.face_cascade.detectMultiScale(gray, 1.1, 4)
+            return self.emotion_from_face(gray, self._detect_face_box(gray))
+        except Exception as e:
+            logger.error(f"Emotion analysis error: {e}")
+            return {
+                "emotion": "Neutral",
+                "confidence_scores": {"emotion": 0.0}
+            }
 
-            if len(faces) > 0:
-                x, y, w, h = faces[0]
+    def emotion_from_face(self, gray: np.ndarray, box: Optional[Tuple[int, int, int, int]]) -> Dict[str, Any]:
+        try:
+            if box is not None:
+                x, y, w, h = box
                 face_roi = gray[y:y+h, x:x+w]
 
                 avg_intensity = np.mean(face_roi)
@@ -201,42 +467,62 @@ class FaceAnalysisService:
                 "confidence_scores": {"emotion": 0.0}
             }
 
-    def analyze_symmetry(self, image: np.ndarray) -> Dict[str, Any]:
+    def _detect_landmarks(self, image: np.ndarray):
+        rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        face_mesh = self.face_mesh
+        with self._mesh_lock:
+            results = face_mesh.process(rgb)
+        if not results.multi_face_landmarks:
+            return None
+        return results.multi_face_landmarks[0].landmark
+
+    def detect_landmarks(self, image: np.ndarray):
+        """FaceMesh landmarks of the face, or None if there is none or FaceMesh fails."""
         try:
-            results = self.face_mesh.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+            return self._detect_landmarks(image)
+        except Exception as e:
+            logger.error(f"Landmark detection error: {e}")
+            return None
+
+    def analyze_symmetry(self, image: np.ndarray, include_landmarks: bool = False) -> Dict[str, Any]:
+        try:
+            landmarks = self._detect_landmarks(image)
+        except Exception as e:
+            logger.error(f"Symmetry analysis error: {e}")
+            return {
+                "error": str(e),
+                "asymmetry_score": 0.0,
+                "predicted_condition": "Unknown"
+            }
 
-            if not results.multi_face_landmarks:
+        h, w = image.shape[:2]
+        return self.symmetry_from_landmarks(landmarks, w, h, include_landmarks)
+
+    def symmetry_from_landmarks(self, landmarks, w: int, h: int, include_landmarks: bool = False) -> Dict[str, Any]:
+        try:
+            if landmarks is None:
                 return {
                     "error": "No face detected",
                     "asymmetry_score": 0.0,
                     "predicted_condition": "Unknown"
                 }
 
-            landmarks = results.multi_face_landmarks[0].landmark
-            h, w = image.shape[:2]
-
-            distances = []
-            for lp, rp in zip(self.LEFT_POINTS, self.RIGHT_POINTS):
-                lx, ly = int(landmarks[lp].x * w), int(landmarks[lp].y * h)
-                rx, ry = int(landmarks[rp].x * w), int(landmarks[rp].y * h)
-                mirrored_rx = w - rx
-                d = np.linalg.norm(np.array([lx, ly]) - np.array([mirrored_rx, ry]))
-                distances.append(d / w)
+            points = self.landmark_array(landmarks)[np.newaxis]
+            score = float(self.symmetry_scores(points, [w], [h])[0])
+            condition = str(self.symmetry_conditions(points, [score], [h])[0])
 
-            score = np.mean(distances)
-
-            if score < 0.02:
-                condition = "Very Symmetrical"
-            elif score < self.ASYMMETRY_THRESHOLD:
-                condition = "Slight Asymmetry (likely normal)"
-            else:
-                condition = self._predict_condition(landmarks, w, h)
-
-            return {
+            result = {
                 "asymmetry_score": round(float(score), 4),
                 "predicted_condition": condition,
                 "confidence": round(1.0 - min(score * 10, 1.0), 2)
             }
+            if include_landmarks:
+                # Normalized (x, y, z) per FaceMesh point so clients can draw the
+                # mesh without running FaceMesh again.
+                result["landmarks"] = [
+                    [round(lm.x, 5), round(lm.y, 5), round(lm.z, 5)] for lm in landmarks
+                ]
+            return result
 
         except Exception as e:
             logger.error(f"Symmetry analysis error: {e}")
@@ -246,67 +532,244 @@ class FaceAnalysisService:
                 "predicted_condition": "Unknown"
             }
 
-    def _predict_condition(self, landmarks, w, h) -> str:
-        left_mouth = landmarks[61]
-        right_mouth = landmarks[291]
-        mouth_diff = abs((left_mouth.y - right_mouth.y) * h)
-
-        left_brow = landmarks[159]
-        right_brow = landmarks[386]
-        brow_diff = abs((left_brow.y - right_brow.y) * h)
-
-        if mouth_diff > 10 and brow_diff > 8:
-            return "Probable Signs of Bell's Palsy"
-        elif mouth_diff > 10 and brow_diff < 5:
-            return "Probable signs of Stroke"
-        elif brow_diff > 12:
-            return "Possible Congenital Jaw Defect"
+    @staticmethod
+    def landmark_array(landmarks) -> np.ndarray:
+        """FaceMesh landmarks as an (n_points, 3) array of normalized coordinates."""
+        return np.array([[lm.x, lm.y, lm.z] for lm in landmarks])
+
+    def symmetry_scores(self, points: np.ndarray, widths, heights) -> np.ndarray:
+        """Asymmetry score of each face in ``points``, an (n, n_points, 3) landmark array.
+
+        Works on whole batches so the landmark archive can be rescored
+        without looping in Python; a single face is a batch of one.
+        """
+        w = np.asarray(widths, dtype=np.float64)[:, np.newaxis]
+        h = np.asarray(heights, dtype=np.float64)[:, np.newaxis]
+        left = points[:, self.LEFT_POINTS].astype(np.float64)
+        right = points[:, self.RIGHT_POINTS].astype(np.float64)
+
+        # Pixel coordinates truncated like int(); right points mirrored.
+        lx, ly = np.trunc(left[..., 0] * w), np.trunc(left[..., 1] * h)
+        rx, ry = np.trunc(right[..., 0] * w), np.trunc(right[..., 1] * h)
+        distances = np.hypot(lx - (w - rx), ly - ry) / w
+        return distances.mean(axis=1)
+
+    def symmetry_conditions(self, points: np.ndarray, scores, heights) -> np.ndarray:
+        scores = np.asarray(scores, dtype=np.float64)
+        return np.select(
+            [scores < 0.02, scores < self.ASYMMETRY_THRESHOLD],
+            ["Very Symmetrical", "Slight Asymmetry (likely normal)"],
+            default=self._predict_condition(points, heights)
+        )
+
+    def _predict_condition(self, points: np.ndarray, heights) -> np.ndarray:
+        h = np.asarray(heights, dtype=np.float64)
+        mouth_diff = np.abs((points[:, 61, 1].astype(np.float64) - points[:, 291, 1]) * h)
+        brow_diff = np.abs((points[:, 159, 1].astype(np.float64) - points[:, 386, 1]) * h)
+
+        return np.select(
+            [(mouth_diff > 10) & (brow_diff > 8), (mouth_diff > 10) & (brow_diff < 5), brow_diff > 12],
+            ["Probable Signs of Bell's Palsy", "Probable signs of Stroke", "Possible Congenital Jaw Defect"],
+            default="Facial Asymmetry Detected"
+        )
+
+    def extract_skin_patches(self, image: np.ndarray, landmarks) -> List[np.ndarray]:
+        if landmarks is None:
+            return []
+
+        h, w = image.shape[:2]
+        left_edge, right_edge = (landmarks[i] for i in self.FACE_EDGE_POINTS)
+        face_width = abs(right_edge.x - left_edge.x) * w
+        half = int(face_width * self.SKIN_PATCH_SCALE / 2)
+        if half < 4:
+            return []
+
+        patches = []
+        for point in self.SKIN_PATCH_POINTS.values():
+            cx, cy = int(landmarks[point].x * w), int(landmarks[point].y * h)
+            patch = image[max(0, cy - half):min(h, cy + half), max(0, cx - half):min(w, cx + half)]
+            if patch.shape[0] >= half and patch.shape[1] >= half:
+                patches.append(patch)
+
+        return patches
+
+    def _skin_result(self, probabilities: np.ndarray) -> Dict[str, Any]:
+        predicted_idx = int(np.argmax(probabilities))
+        confidence = float(probabilities[predicted_idx])
+        return {
+            "skin_condition": self.model_loader.labels("skin")[predicted_idx],
+            "confidence_scores": {
+                "skin": round(confidence, 2)
+            }
+        }
+
+    def _skin_heuristic(self, image: np.ndarray) -> Dict[str, Any]:
+        avg_color = np.mean(image, axis=(0, 1))
+        if avg_color[0] > 150:
+            condition = "Acne" if np.random.random() > 0.7 else "Normal"
         else:
-            return "Facial Asymmetry Detected"
+            condition = "Normal"
+
+        return {
+            "skin_condition": condition,
+            "confidence_scores": {"skin": 0.6}
+        }
+
+    def analyze_skin(self, image: np.ndarray, tiled: Optional[bool] = None) -> Dict[str, Any]:
+        """Skin condition of a close-up; ``tiled`` forces tiling on or off (default: by image size)."""
+        if tiled is None:
+            tiled = 0 < self.skin_tile_min_side <= min(image.shape[:2])
+        if tiled and min(image.shape[:2]) >= self.SKIN_TILE_SIZE:
+            return self.analyze_skin_tiled(image)
 
-    def analyze_skin(self, image: np.ndarray) -> Dict[str, Any]:
         try:
-            if self.model_loader.skin_model:
-                skin_resized = cv2.resize(image, (224, 224))
-                skin_resized = skin_resized.astype('float32') / 255.0
-                skin_expanded = np.expand_dims(skin_resized, axis=0)
-
-                try:
-                    predictions = self.model_loader.skin_model.predict(skin_expanded, verbose=0)
-                except:
-                    try:
-                        predictions = self.model_loader.skin_model.predict(
-                            [skin_expanded, skin_expanded], verbose=0
-                        )
-                    except:
-                        predictions = np.zeros((1, 10))
-                        predictions[0, -1] = 1.0
-
-                predicted_idx = np.argmax(predictions[0])
-                confidence = float(predictions[0][predicted_idx])
-                condition = self.SKIN_CONDITIONS[predicted_idx]
+            if self.model_loader.is_loaded("skin"):
+                skin_expanded = np.expand_dims(self.model_loader.preprocess("skin", image), axis=0)
+                predictions = self.model_loader.predict("skin", skin_expanded)
+                return self._skin_result(predictions[0])
+            else:
+                return self._skin_heuristic(image)
 
-                return {
-                    "skin_condition": condition,
-                    "confidence_scores": {
-                        "skin": round(confidence, 2)
-                    }
-                }
+        except Exception as e:
+            logger.error(f"Skin analysis error: {e}")
+            return {
+                "skin_condition": "Normal",
+                "confidence_scores": {"skin": 0.5}
+            }
+
+    def _skin_patches_result(self, patches: List[np.ndarray], predictions) -> Dict[str, Any]:
+        if predictions is PREDICT_FAILED:
+            return {
+                "skin_condition": "Normal",
+                "confidence_scores": {"skin": 0.5}
+            }
+        if predictions is None:
+            pixels = np.concatenate([p.reshape(-1, p.shape[-1]) for p in patches])
+            return self._skin_heuristic(pixels[np.newaxis])
+        return self._skin_result(np.mean(predictions, axis=0))
+
+    def _tile_grid(self, length: int) -> List[int]:
+        """Tile offsets along one side; the last tile is aligned with the edge."""
+        size = self.SKIN_TILE_SIZE
+        stride = max(1, int(size * (1 - self.SKIN_TILE_OVERLAP)))
+        offsets = list(range(0, length - size + 1, stride))
+        if offsets[-1] != length - size:
+            offsets.append(length - size)
+        return offsets
+
+    def _iter_skin_tiles(self, image: np.ndarray) -> Iterator[Tuple[List[Tuple[int, int]], List[np.ndarray]]]:
+        """Batches of (grid cells, tiles) with background tiles left out.
+
+        Tiles are views into ``image`` and only one batch is preprocessed at a
+        time, so memory does not grow with the image size.
+        """
+        size = self.SKIN_TILE_SIZE
+        cells, tiles = [], []
+        for row, y in enumerate(self._tile_grid(image.shape[0])):
+            for col, x in enumerate(self._tile_grid(image.shape[1])):
+                tile = image[y:y + size, x:x + size]
+                # Subsampled grey-level spread: cheap, and enough to tell skin
+                # texture from a plain background.
+                if tile[::4, ::4].mean(axis=-1).std() < self.skin_tile_min_std:
+                    continue
+                cells.append((row, col))
+                tiles.append(tile)
+                if len(tiles) == self.skin_tile_batch:
+                    yield cells, tiles
+                    cells, tiles = [], []
+        if tiles:
+            yield cells, tiles
+
+    def analyze_skin_tiled(self, image: np.ndarray) -> Dict[str, Any]:
+        """Skin condition of a high-resolution close-up from overlapping full-resolution tiles.
+
+        Tiles go through the skin model in batches of ``SKIN_TILE_BATCH``. The
+        result adds ``skin_regions``: the grid of tiles with the top condition
+        and confidence per tile (None for background), for drawing a heatmap.
+        The final condition is the top class of the mean tile probabilities.
+        """
+        if not self.model_loader.is_loaded("skin"):
+            return self.analyze_skin(image, tiled=False)
+
+        try:
+            rows, cols = len(self._tile_grid(image.shape[0])), len(self._tile_grid(image.shape[1]))
+            labels = self.model_loader.labels("skin")
+            conditions: List[List[Optional[str]]] = [[None] * cols for _ in range(rows)]
+            confidence: List[List[Optional[float]]] = [[None] * cols for _ in range(rows)]
+            total, analyzed = None, 0
+
+            for cells, tiles in self._iter_skin_tiles(image):
+                predictions = self._predict_many("skin", tiles)
+                if predictions is PREDICT_FAILED:
+                    raise RuntimeError("Skin model prediction failed")
+                batch_total = np.sum(predictions, axis=0)
+                total = batch_total if total is None else total + batch_total
+                analyzed += len(tiles)
+                for (row, col), probabilities in zip(cells, predictions):
+                    best = int(np.argmax(probabilities))
+                    conditions[row][col] = labels[best]
+                    confidence[row][col] = round(float(probabilities[best]), 3)
+
+            if not analyzed:
+                # Nothing but background; judge the whole image as before.
+                result = self.analyze_skin(image, tiled=False)
             else:
-                avg_color = np.mean(image, axis=(0, 1))
-                if avg_color[0] > 150:
-                    condition = "Acne" if np.random.random() > 0.7 else "Normal"
-                else:
-                    condition = "Normal"
+                result = self._skin_result(total / analyzed)
+            result["skin_regions"] = {
+                "tile_size": self.SKIN_TILE_SIZE,
+                "rows": rows,
+                "cols": cols,
+                "analyzed": analyzed,
+                "skipped": rows * cols - analyzed,
+                "conditions": conditions,
+                "confidence": confidence
+            }
+            return result
 
-                return {
-                    "skin_condition": condition,
-                    "confidence_scores": {"skin": 0.6}
-                }
+        except Exception as e:
+            logger.error(f"Tiled skin analysis error: {e}")
+            return {
+                "skin_condition": "Normal",
+                "confidence_scores": {"skin": 0.5}
+            }
+
+    def analyze_skin_patches(self, patches: List[np.ndarray]) -> Dict[str, Any]:
+        try:
+            return self._skin_patches_result(patches, self._predict_many("skin", patches))
 
         except Exception as e:
-            logger.error(f"Skin analysis error: {e}")
+            logger.error(f"Skin patch analysis error: {e}")
             return {
                 "skin_condition": "Normal",
                 "confidence_scores": {"skin": 0.5}
             }
+
+    @property
+    def landmark_archive(self) -> LandmarkArchive:
+        with self._archive_lock:
+            if self._landmark_archive is None:
+                self._landmark_archive = LandmarkArchive(self.landmark_archive_path)
+            return self._landmark_archive
+
+    def archive_landmarks(self, landmarks, w: int, h: int, symmetry: Dict[str, Any],
+                          report_id: Optional[str] = None) -> Optional[str]:
+        """Archives the landmarks under ``report_id`` (a new UUID if None) and returns it.
+
+        Clients pass the id they will save the report under (analysis_reports.id)
+        or save the returned one, so rescored rows join back to the reports.
+        """
+        try:
+            report_id = report_id or str(uuid.uuid4())
+            self.landmark_archive.add(
+                report_id, self.landmark_array(landmarks), w, h,
+                symmetry["asymmetry_score"], symmetry["predicted_condition"]
+            )
+            return report_id
+        except Exception as e:
+            logger.error(f"Landmark archive error: {e}")
+            return None
+
+    def get_landmark_archive_stats(self) -> Optional[Dict[str, Any]]:
+        if not self.landmark_archive_path:
+            return None
+        return self.landmark_archive.get_stats()
@@ -134,7 +134,7 @@ class HealthIndexCalculator:
         elif 'Asymmetry Detected' in condition:
             recommendations.append("Monitor facial symmetry changes and consult a doctor if symptoms persist")
 
-        skin_condition = analysis_result.get('skin_condition', '')
+        skin_condition = analysis_result.get('skin_condition') or ''
         dangerous_conditions = ['Melanoma', 'Basal Cell Carcinoma', 'Squamous Cell Carcinoma']
         if any(dc in skin_condition for dc in dangerous_conditions):
             recommendations.append("Seek immediate dermatological consultation for skin examination")
@@ -0,0 +1,344 @@
+import json
+import time
+import uuid
+import hashlib
+import logging
+import sqlite3
+import threading
+import urllib.request
+from typing import Callable, Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    image_hash TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    face_image BLOB,
+    skin_image BLOB,
+    include_landmarks INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs(status, available_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_image_hash ON jobs(image_hash);
+CREATE TABLE IF NOT EXISTS job_callbacks (
+    job_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    status TEXT,
+    PRIMARY KEY (job_id, url)
+);
+"""
+
+
+class JobQueueFull(RuntimeError):
+    """Raised by submit when too many jobs are already waiting."""
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Callbacks go only to the URL that was checked at submit time."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_callback_opener = urllib.request.build_opener(_NoRedirect)
+
+
+def _json_default(value):
+    # NumPy scalars and arrays left in analyzer results.
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def to_json(value: Any) -> str:
+    return json.dumps(value, default=_json_default)
+
+
+def image_hash(face_image: bytes, skin_image: Optional[bytes], include_landmarks: bool) -> str:
+    digest = hashlib.sha256()
+    for part in (face_image, skin_image or b"", b"1" if include_landmarks else b"0"):
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
+
+
+class JobQueue:
+    """Persistent queue of full-analysis jobs in a SQLite file.
+
+    ``submit`` stores the uploaded images and returns at once; worker threads
+    claim queued jobs, run ``handler`` on them and store the result, which is
+    kept for ``result_ttl`` seconds. A job whose images (and options) match a
+    queued, running or unexpired finished job is not queued again; the
+    existing job is returned instead, and its callback URL is added to that
+    job (a finished job is only reused when no callback is asked for, since
+    its callbacks have already been sent). Failed attempts are retried with
+    exponential backoff up to ``max_attempts``, and jobs left running by a
+    worker that died are re-queued after ``lease_seconds``. Several API
+    worker processes can share one database file.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        handler: Callable[[bytes, Optional[bytes], bool], Dict[str, Any]],
+        workers: int = 1,
+        max_attempts: int = 3,
+        result_ttl: float = 3600.0,
+        max_queued: int = 100,
+        lease_seconds: float = 600.0,
+        poll_interval: float = 1.0
+    ):
+        self.db_path = db_path
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.result_ttl = result_ttl
+        self.max_queued = max_queued
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._wakeup = threading.Condition()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+        with self._connection() as db:
+            db.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    # --- clients ---
+
+    def submit(self, face_image: bytes, skin_image: Optional[bytes] = None, include_landmarks: bool = False,
+               callback_url: Optional[str] = None) -> Dict[str, Any]:
+        key = image_hash(face_image, skin_image, include_landmarks)
+        now = time.time()
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            # A job whose callbacks have been sent cannot take another one.
+            statuses = "('queued', 'running')" if callback_url else "('queued', 'running', 'done')"
+            existing = db.execute(
+                "SELECT id, status FROM jobs WHERE image_hash = ? "
+                f"AND status IN {statuses} AND (expires_at IS NULL OR expires_at > ?) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (key, now)
+            ).fetchone()
+            if existing is not None:
+                if callback_url:
+                    db.execute(
+                        "INSERT OR IGNORE INTO job_callbacks (job_id, url) VALUES (?, ?)",
+                        (existing["id"], callback_url)
+                    )
+                db.execute("COMMIT")
+                return {"job_id": existing["id"], "status": existing["status"], "deduplicated": True}
+
+            queued = db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= self.max_queued:
+                raise JobQueueFull(f"{queued} jobs are already queued")
+
+            job_id = uuid.uuid4().hex
+            db.execute(
+                "INSERT INTO jobs (id, image_hash, status, face_image, skin_image, include_landmarks, "
+                "created_at, available_at) VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, key, face_image, skin_image, int(include_landmarks), now, now)
+            )
+            if callback_url:
+                db.execute("INSERT INTO job_callbacks (job_id, url) VALUES (?, ?)", (job_id, callback_url))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+        with self._wakeup:
+            self._wakeup.notify()
+        return {"job_id": job_id, "status": "queued", "deduplicated": False}
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        db = self._connection()
+        row = db.execute(
+            "SELECT id, status, attempts, result, error, created_at, started_at, "
+            "finished_at, expires_at FROM jobs WHERE id = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (job_id, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+
+        job = {
+            "job_id": row["id"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "expires_at": row["expires_at"],
+        }
+        if row["result"] is not None:
+            job["result"] = json.loads(row["result"])
+        if row["error"] is not None:
+            job["error"] = row["error"]
+        callbacks = db.execute("SELECT url, status FROM job_callbacks WHERE job_id = ?", (job_id,)).fetchall()
+        if callbacks:
+            job["callbacks"] = [{"url": callback["url"], "status": callback["status"]} for callback in callbacks]
+        return job
+
+    def get_stats(self) -> Dict[str, int]:
+        rows = self._connection().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    # --- workers ---
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        now = time.time()
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            # Jobs whose worker died mid-run go back on the queue, unless
+            # they have used up their attempts.
+            stale = now - self.lease_seconds
+            db.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Worker stopped while running the job', "
+                "finished_at = ?, expires_at = ?, face_image = NULL, skin_image = NULL "
+                "WHERE status = 'running' AND started_at < ? AND attempts >= ?",
+                (now, now + self.result_ttl, stale, self.max_attempts)
+            )
+            db.execute(
+                "UPDATE jobs SET status = 'queued' WHERE status = 'running' AND started_at < ?", (stale,)
+            )
+            db.execute(
+                "DELETE FROM jobs WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+            )
+            db.execute("DELETE FROM job_callbacks WHERE job_id NOT IN (SELECT id FROM jobs)")
+            row = db.execute(
+                "SELECT id, attempts, face_image, skin_image, include_landmarks FROM jobs "
+                "WHERE status = 'queued' AND available_at <= ? ORDER BY available_at LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is not None:
+                db.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ? WHERE id = ?",
+                    (now, row["id"])
+                )
+            db.execute("COMMIT")
+            return row
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                logger.error(f"Could not claim a job: {e}")
+                job = None
+
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+
+            # Anything escaping _run (the database being locked, say) must
+            # not end the worker thread, or the queue stops.
+            try:
+                self._run(job)
+            except Exception as e:
+                logger.error(f"Job {job['id']} could not be completed: {e}")
+                try:
+                    self._fail(job, job["attempts"] + 1, f"Internal error: {e}")
+                except Exception as error:
+                    # The lease expiring puts the job back on the queue.
+                    logger.error(f"Could not record the failure of job {job['id']}: {error}")
+
+    def _run(self, job: sqlite3.Row):
+        attempt = job["attempts"] + 1
+        try:
+            result = self.handler(job["face_image"], job["skin_image"], bool(job["include_landmarks"]))
+            result_json = to_json(result)
+        except Exception as e:
+            self._fail(job, attempt, str(e))
+            return
+
+        now = time.time()
+        self._connection().execute(
+            "UPDATE jobs SET status = 'done', result = ?, error = NULL, finished_at = ?, expires_at = ?, "
+            "face_image = NULL, skin_image = NULL WHERE id = ?",
+            (result_json, now, now + self.result_ttl, job["id"])
+        )
+        self._callback(job, {"job_id": job["id"], "status": "done", "result": result})
+
+    def _fail(self, job: sqlite3.Row, attempt: int, error: str):
+        """Re-queues the job with backoff, or marks it failed after the last attempt.
+
+        Only a job that is still running is changed, so a job that was
+        stored as done before a later step raised is left alone.
+        """
+        now = time.time()
+        db = self._connection()
+        if attempt < self.max_attempts:
+            backoff = 2 ** attempt
+            logger.warning(f"Job {job['id']} attempt {attempt} failed ({error}), retrying in {backoff}s")
+            db.execute(
+                "UPDATE jobs SET status = 'queued', error = ?, available_at = ? WHERE id = ? AND status = 'running'",
+                (error, now + backoff, job["id"])
+            )
+            return
+
+        logger.error(f"Job {job['id']} failed after {attempt} attempts: {error}")
+        updated = db.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, expires_at = ?, "
+            "face_image = NULL, skin_image = NULL WHERE id = ? AND status = 'running'",
+            (error, now, now + self.result_ttl, job["id"])
+        ).rowcount
+        if updated:
+            self._callback(job, {"job_id": job["id"], "status": "failed", "error": error})
+
+    def _callback(self, job: sqlite3.Row, payload: Dict[str, Any], attempts: int = 3):
+        db = self._connection()
+        urls = [row["url"] for row in db.execute("SELECT url FROM job_callbacks WHERE job_id = ?", (job["id"],))]
+        if not urls:
+            return
+
+        data = to_json(payload).encode()
+        for url in urls:
+            status = "failed"
+            for attempt in range(attempts):
+                try:
+                    request = urllib.request.Request(
+                        url, data=data, method="POST",
+                        headers={"Content-Type": "application/json"}
+                    )
+                    with _callback_opener.open(request, timeout=10) as response:
+                        status = f"delivered ({response.status})"
+                    break
+                except Exception as e:
+                    logger.warning(f"Callback for job {job['id']} to {url} failed: {e}")
+                    if attempt < attempts - 1:
+                        time.sleep(2 ** attempt)
+
+            db.execute("UPDATE job_callbacks SET status = ? WHERE job_id = ? AND url = ?", (status, job["id"], url))
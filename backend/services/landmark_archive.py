@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import fcntl
+import logging
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# FaceMesh with refine_landmarks=True.
+FACE_MESH_POINTS = 478
+
+RECORD_DTYPE = np.dtype([
+    ("report_id", "U36"),
+    ("timestamp", "f8"),
+    ("width", "i4"),
+    ("height", "i4"),
+    ("asymmetry_score", "f4"),
+    ("predicted_condition", "U48"),
+])
+
+
+class LandmarkArchive:
+    """Append-only archive of FaceMesh landmarks, keyed by report ID.
+
+    Each face is stored as a float16 ``(points, 3)`` array of normalized
+    coordinates (about 2.8 KB) together with the image size and the symmetry
+    result given at the time, so symmetry can be recomputed without the
+    image. Rows go into fixed-size chunks of ``chunk_size`` faces, each a
+    pair of memory-mapped ``.npy`` files (``chunk-NNNNN.landmarks.npy`` and
+    ``chunk-NNNNN.records.npy``); the row count is kept in ``index.json``.
+    Full chunks are never rewritten, so the archive grows without copying.
+    Several worker processes can append to one directory; appends are
+    serialized with a file lock.
+    """
+
+    def __init__(self, path: str, points: int = FACE_MESH_POINTS, chunk_size: int = 4096):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._lock_path = self.path / "index.lock"
+
+        with self._file_lock():
+            meta = self._read_meta()
+            if meta is None:
+                meta = {"points": points, "chunk_size": chunk_size, "count": 0}
+                self._write_meta(meta)
+            elif meta["points"] != points:
+                raise ValueError(f"Landmark archive at {self.path} has {meta['points']} points, expected {points}")
+
+        self.points = meta["points"]
+        self.chunk_size = meta["chunk_size"]
+        self.count = meta["count"]
+        self._chunks: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        # report_id -> row, built on the first lookup.
+        self._rows: Optional[Dict[str, int]] = None
+        logger.info(f"Landmark archive at {self.path} opened with {self.count} faces")
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_meta(self) -> Optional[Dict[str, Any]]:
+        meta_path = self.path / "index.json"
+        if not meta_path.exists():
+            return None
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def _write_meta(self, meta: Dict[str, Any]):
+        tmp_path = self.path / "index.json.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.path / "index.json")
+
+    def _chunk_paths(self, chunk: int) -> Tuple[Path, Path]:
+        return (self.path / f"chunk-{chunk:05d}.landmarks.npy", self.path / f"chunk-{chunk:05d}.records.npy")
+
+    def _chunk(self, chunk: int, create: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """Memory-mapped (landmarks, records) of one chunk."""
+        if chunk not in self._chunks:
+            landmarks_path, records_path = self._chunk_paths(chunk)
+            if create and not landmarks_path.exists():
+                np.lib.format.open_memmap(landmarks_path, mode="w+", dtype="float16",
+                                          shape=(self.chunk_size, self.points, 3)).flush()
+                np.lib.format.open_memmap(records_path, mode="w+", dtype=RECORD_DTYPE,
+                                          shape=(self.chunk_size,)).flush()
+            self._chunks[chunk] = (
+                np.load(landmarks_path, mmap_mode="r+"),
+                np.load(records_path, mmap_mode="r+")
+            )
+        return self._chunks[chunk]
+
+    def _sync(self, meta: Dict[str, Any]):
+        """Picks up rows appended since the last sync, possibly by another process."""
+        if meta["count"] > self.count and self._rows is not None:
+            self._index_rows(self.count, meta["count"])
+        self.count = meta["count"]
+
+    def _index_rows(self, first: int, last: int):
+        for chunk, start, stop in self._spans(first, last):
+            _, records = self._chunk(chunk)
+            for offset, report_id in enumerate(records["report_id"][start:stop]):
+                self._rows[str(report_id)] = chunk * self.chunk_size + start + offset
+
+    def _spans(self, first: int, last: int) -> Iterator[Tuple[int, int, int]]:
+        """(chunk, start, stop) slices covering rows first..last-1."""
+        row = first
+        while row < last:
+            chunk, start = divmod(row, self.chunk_size)
+            stop = min(self.chunk_size, start + last - row)
+            yield chunk, start, stop
+            row += stop - start
+
+    def add(self, report_id: str, landmarks: np.ndarray, width: int, height: int,
+            asymmetry_score: float, predicted_condition: str, now: Optional[float] = None):
+        """Appends one face; ``landmarks`` is a ``(points, 3)`` array of normalized coordinates."""
+        landmarks = np.asarray(landmarks)
+        if landmarks.shape != (self.points, 3):
+            raise ValueError(f"Expected landmarks of shape ({self.points}, 3), got {landmarks.shape}")
+
+        with self._lock, self._file_lock():
+            meta = self._read_meta()
+            self._sync(meta)
+
+            row = meta["count"]
+            chunk, offset = divmod(row, self.chunk_size)
+            chunk_landmarks, chunk_records = self._chunk(chunk, create=True)
+            chunk_landmarks[offset] = landmarks.astype("float16")
+            chunk_records[offset] = (report_id, now or time.time(), width, height,
+                                     asymmetry_score, predicted_condition)
+            chunk_landmarks.flush()
+            chunk_records.flush()
+
+            meta["count"] += 1
+            self._write_meta(meta)
+            self._sync(meta)
+
+    def get(self, report_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._sync(self._read_meta())
+            if self._rows is None:
+                self._rows = {}
+                self._index_rows(0, self.count)
+
+            row = self._rows.get(report_id)
+            if row is None:
+                return None
+            chunk, offset = divmod(row, self.chunk_size)
+            landmarks, records = self._chunk(chunk)
+            record = records[offset]
+            return {
+                "report_id": report_id,
+                "analyzed_at": float(record["timestamp"]),
+                "width": int(record["width"]),
+                "height": int(record["height"]),
+                "asymmetry_score": float(record["asymmetry_score"]),
+                "predicted_condition": str(record["predicted_condition"]),
+                "landmarks": np.array(landmarks[offset], dtype="float32")
+            }
+
+    def iter_chunks(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """(landmarks, records) of every chunk in order, trimmed to the rows written so far.
+
+        The arrays are memory-mapped views, so only the chunk being processed
+        needs to be in memory.
+        """
+        with self._lock:
+            self._sync(self._read_meta())
+            spans: List[Tuple[int, int, int]] = list(self._spans(0, self.count))
+        for chunk, start, stop in spans:
+            landmarks, records = self._chunk(chunk)
+            yield landmarks[start:stop], records[start:stop]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "faces": self.count,
+            "chunks": -(-self.count // self.chunk_size),
+            "chunk_size": self.chunk_size,
+            "points": self.points
+        }
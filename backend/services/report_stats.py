@@ -0,0 +1,115 @@
+import os
+import json
+import urllib.parse
+import urllib.request
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Tuple
+
+
+class ReportStatsError(RuntimeError):
+    """Raised when the rollup tables cannot be read."""
+
+
+class ReportStatsStore:
+    """Dashboard statistics served from the ``analysis_*_rollups`` tables.
+
+    The rollups hold one row per day (and per user and day) and are kept up
+    to date by a trigger on ``analysis_reports``, so every query reads at most
+    one row per day in the requested range however many reports there are.
+    Reads go through the Supabase REST API with the service role key, since
+    the rollup tables have no public policies.
+    """
+
+    MAX_DAYS = 366
+
+    def __init__(self, url: str, service_key: str, timeout: float = 10.0):
+        self.url = url.rstrip("/")
+        self.service_key = service_key
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls) -> Optional["ReportStatsStore"]:
+        url = os.getenv("SUPABASE_URL")
+        service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+        if not url or not service_key:
+            return None
+        return cls(url, service_key)
+
+    def _request(self, path: str, params: List[Tuple[str, str]] = (), body: Optional[dict] = None,
+                 timeout: Optional[float] = None):
+        url = f"{self.url}/rest/v1/{path}"
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        request = urllib.request.Request(
+            url,
+            data=json.dumps(body).encode() if body is not None else None,
+            method="POST" if body is not None else "GET",
+            headers={
+                "apikey": self.service_key,
+                "Authorization": f"Bearer {self.service_key}",
+                "Content-Type": "application/json"
+            }
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout or self.timeout) as response:
+                return json.loads(response.read() or "null")
+        except (OSError, ValueError) as e:
+            raise ReportStatsError(f"Could not read {path}: {e}") from e
+
+    def date_range(self, start: Optional[date], end: Optional[date]) -> Tuple[date, date]:
+        """Defaults to the last 30 (UTC) days; ranges longer than MAX_DAYS are rejected."""
+        end = end or datetime.now(timezone.utc).date()
+        start = start or end - timedelta(days=29)
+        if start > end:
+            raise ValueError("start must not be after end")
+        if (end - start).days >= self.MAX_DAYS:
+            raise ValueError(f"Date range is limited to {self.MAX_DAYS} days")
+        return start, end
+
+    def _rollups(self, start: date, end: date, user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        table = "analysis_user_rollups" if user_id else "analysis_daily_rollups"
+        params = [
+            ("select", "day,report_count,health_index_sum,rating_counts,skin_condition_counts"),
+            ("day", f"gte.{start.isoformat()}"),
+            ("day", f"lte.{end.isoformat()}"),
+            ("order", "day.asc")
+        ]
+        if user_id:
+            params.append(("user_id", f"eq.{user_id}"))
+        return [row for row in self._request(table, params) if row["report_count"] > 0]
+
+    @staticmethod
+    def _average(total: float, count: int) -> Optional[float]:
+        return round(total / count, 2) if count else None
+
+    def trend(self, start: date, end: date, user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Reports and average health index per day, for everyone or one user."""
+        return [
+            {
+                "day": row["day"],
+                "reports": row["report_count"],
+                "average_health_index": self._average(row["health_index_sum"], row["report_count"])
+            }
+            for row in self._rollups(start, end, user_id)
+        ]
+
+    def distribution(self, start: date, end: date, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """Health index ratings and skin conditions over the range."""
+        rows = self._rollups(start, end, user_id)
+        ratings, skin_conditions = Counter(), Counter()
+        for row in rows:
+            ratings.update(row["rating_counts"])
+            skin_conditions.update(row["skin_condition_counts"])
+
+        reports = sum(row["report_count"] for row in rows)
+        return {
+            "reports": reports,
+            "average_health_index": self._average(sum(row["health_index_sum"] for row in rows), reports),
+            "health_index_rating": {k: v for k, v in ratings.items() if v > 0},
+            "skin_condition": {k: v for k, v in skin_conditions.items() if v > 0}
+        }
+
+    def rebuild(self, timeout: float = 600.0) -> int:
+        """Recomputes the rollups from analysis_reports; returns the number of reports."""
+        return self._request("rpc/rebuild_analysis_rollups", body={}, timeout=timeout)
@@ -0,0 +1,43 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Wall-clock time of each startup phase, reported by /health and logged once done."""
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = started or time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.finished: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            self.phases[name] = round(seconds, 3)
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def finish(self):
+        self.finished = time.perf_counter()
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+        logger.info(f"Startup finished in {self.finished - self.started:.2f}s ({phases})")
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            phases = dict(self.phases)
+        return {
+            "complete": self.finished is not None,
+            "total_seconds": round(self.finished - self.started, 3) if self.finished else None,
+            "phases": phases
+        }
@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import pytest
+
+from services.admission import AdmissionController, AdmissionRejected, EndpointPolicy
+
+
+def _controller(**kwargs):
+    return AdmissionController(
+        capacity=4,
+        policies={
+            "/light": EndpointPolicy(weight=1, max_concurrent=4, max_queue=8),
+            "/heavy": EndpointPolicy(weight=4, max_concurrent=1, max_queue=2),
+        },
+        **kwargs
+    )
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_light_requests_do_not_overtake_a_queued_heavy_request():
+    async def scenario():
+        controller = _controller()
+        deadline = time.time() + 5
+        await controller.acquire("/light", deadline)
+        await controller.acquire("/light", deadline)
+
+        heavy = asyncio.create_task(controller.acquire("/heavy", deadline))
+        await _settle()
+        # Capacity is free for another light request, but the heavy one
+        # queued first.
+        light = asyncio.create_task(controller.acquire("/light", deadline))
+        await _settle()
+        assert not heavy.done() and not light.done()
+
+        await controller.release("/light")
+        await controller.release("/light")
+        await _settle()
+        assert heavy.done() and not light.done()
+
+        await controller.release("/heavy")
+        await _settle()
+        assert light.done()
+        assert controller.get_stats()["in_use"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_requests_overtake_one_held_back_by_its_own_endpoint_limit():
+    async def scenario():
+        controller = _controller()
+        controller.capacity = 8
+        deadline = time.time() + 5
+        await controller.acquire("/heavy", deadline)
+
+        # Waits for /heavy's max_concurrent, although capacity is free.
+        second_heavy = asyncio.create_task(controller.acquire("/heavy", deadline))
+        await _settle()
+        assert not second_heavy.done()
+
+        await asyncio.wait_for(controller.acquire("/light", deadline), 1)
+        assert controller.get_stats()["in_use"] == 5
+
+        await controller.release("/heavy")
+        await _settle()
+        assert second_heavy.done()
+
+    asyncio.run(scenario())
+
+
+def test_expired_waiter_leaves_the_queue_and_wakes_the_rest():
+    async def scenario():
+        controller = _controller()
+        await controller.acquire("/light", time.time() + 5)
+
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire("/heavy", time.time() + 0.05)
+        assert controller._queue == []
+        assert controller.get_stats()["endpoints"]["/heavy"]["expired"] == 1
+
+        # Nothing is left ahead of new requests.
+        await controller.acquire("/light", time.time() + 5)
+        assert controller.get_stats()["in_use"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_full_endpoint_queue_is_rejected_immediately():
+    async def scenario():
+        controller = _controller()
+        deadline = time.time() + 5
+        await controller.acquire("/heavy", deadline)
+        waiters = [asyncio.create_task(controller.acquire("/heavy", deadline)) for _ in range(2)]
+        await _settle()
+
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire("/heavy", deadline)
+        assert controller.get_stats()["endpoints"]["/heavy"]["rejected"] == 1
+        for waiter in waiters:
+            waiter.cancel()
+
+    asyncio.run(scenario())
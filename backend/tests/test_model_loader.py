@@ -0,0 +1,75 @@
+import json
+import time
+
+import pytest
+
+from models.model_loader import DEFAULT_SPECS, ModelLoader, ModelSignatureError, ModelsUnavailable
+
+
+def _mismatched_spec(directory):
+    # A metadata file describing another model fails the signature check
+    # before TensorFlow is needed.
+    (directory / "age_model.keras").touch()
+    (directory / "age_model.json").write_text(json.dumps(DEFAULT_SPECS["gender"].to_dict()))
+
+
+def _wait_for_reload(loader, timeout=5.0):
+    deadline = time.time() + timeout
+    while loader.reload_status.get("state") == "loading" and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_signature_mismatch_is_reraised_and_reported(tmp_path):
+    _mismatched_spec(tmp_path)
+    loader = ModelLoader(tmp_path, load=False)
+
+    with pytest.raises(ModelSignatureError):
+        loader.ensure_loaded()
+
+    assert not loader.ready
+    assert "describes model 'gender'" in loader.load_error
+    assert loader.reload_status["state"] == "failed"
+
+
+def test_requests_fail_instead_of_waiting_after_a_failed_load(tmp_path):
+    _mismatched_spec(tmp_path)
+    loader = ModelLoader(tmp_path, load=False)
+    with pytest.raises(ModelSignatureError):
+        loader.ensure_loaded()
+
+    with pytest.raises(ModelsUnavailable):
+        loader.current()
+    with pytest.raises(ModelsUnavailable):
+        with loader.acquire():
+            pass
+
+
+def test_missing_model_files_degrade_to_heuristics(tmp_path):
+    loader = ModelLoader(tmp_path, load=False)
+    loader.ensure_loaded()
+
+    assert loader.ready
+    assert loader.load_error is None
+    assert set(loader.get_model_status().values()) == {"not_loaded"}
+
+
+def test_successful_reload_clears_a_failed_load(tmp_path):
+    _mismatched_spec(tmp_path)
+    loader = ModelLoader(tmp_path, load=False)
+    with pytest.raises(ModelSignatureError):
+        loader.ensure_loaded()
+
+    (tmp_path / "age_model.json").unlink()
+    (tmp_path / "age_model.keras").unlink()
+    assert loader.reload()
+    _wait_for_reload(loader)
+
+    assert loader.ready
+    assert loader.load_error is None
+    assert loader.version == "default"
+
+
+def test_constructor_load_raises_on_signature_mismatch(tmp_path):
+    _mismatched_spec(tmp_path)
+    with pytest.raises(ModelSignatureError):
+        ModelLoader(tmp_path)
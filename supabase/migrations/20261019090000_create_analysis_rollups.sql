@@ -0,0 +1,203 @@
+/*
+  # Create Analysis Rollup Tables
+
+  1. New Tables
+    - `analysis_daily_rollups` - one row per UTC day
+      - `day` (date, primary key)
+      - `report_count` (integer) - Reports created that day
+      - `health_index_sum` (double precision) - Sum of `health_index_score`, for averages
+      - `rating_counts` (jsonb) - Reports per `health_index_rating`
+      - `skin_condition_counts` (jsonb) - Reports per `skin_condition` ('None' when null)
+      - `updated_at` (timestamptz)
+    - `analysis_user_rollups` - one row per user and UTC day, same columns plus `user_id`
+
+  2. Maintenance
+    - Trigger on `analysis_reports` keeps both tables up to date on insert, update and delete
+    - `rebuild_analysis_rollups()` recomputes both tables from `analysis_reports`
+
+  3. Security
+    - Enable RLS on both tables with no policies; they are read by the backend with the service role key
+*/
+
+CREATE TABLE IF NOT EXISTS analysis_daily_rollups (
+  day date PRIMARY KEY,
+  report_count integer NOT NULL DEFAULT 0,
+  health_index_sum double precision NOT NULL DEFAULT 0,
+  rating_counts jsonb NOT NULL DEFAULT '{}'::jsonb,
+  skin_condition_counts jsonb NOT NULL DEFAULT '{}'::jsonb,
+  updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS analysis_user_rollups (
+  user_id uuid NOT NULL,
+  day date NOT NULL,
+  report_count integer NOT NULL DEFAULT 0,
+  health_index_sum double precision NOT NULL DEFAULT 0,
+  rating_counts jsonb NOT NULL DEFAULT '{}'::jsonb,
+  skin_condition_counts jsonb NOT NULL DEFAULT '{}'::jsonb,
+  updated_at timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (user_id, day)
+);
+
+ALTER TABLE analysis_daily_rollups ENABLE ROW LEVEL SECURITY;
+ALTER TABLE analysis_user_rollups ENABLE ROW LEVEL SECURITY;
+
+-- Adds delta to counts->>key.
+CREATE OR REPLACE FUNCTION analysis_rollup_count(counts jsonb, key text, delta integer)
+RETURNS jsonb
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT counts || jsonb_build_object(key, COALESCE((counts->>key)::integer, 0) + delta);
+$$;
+
+-- Applies one report to the rollups; direction is 1 to add it and -1 to remove it.
+CREATE OR REPLACE FUNCTION apply_analysis_rollup(report analysis_reports, direction integer)
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  report_day date := (report.created_at AT TIME ZONE 'UTC')::date;
+  skin text := COALESCE(report.skin_condition, 'None');
+BEGIN
+  IF report.created_at IS NULL THEN
+    RETURN;
+  END IF;
+
+  INSERT INTO analysis_daily_rollups AS r
+    (day, report_count, health_index_sum, rating_counts, skin_condition_counts)
+  VALUES (
+    report_day, direction, direction * report.health_index_score,
+    jsonb_build_object(report.health_index_rating, direction),
+    jsonb_build_object(skin, direction)
+  )
+  ON CONFLICT (day) DO UPDATE SET
+    report_count = r.report_count + direction,
+    health_index_sum = r.health_index_sum + direction * report.health_index_score,
+    rating_counts = analysis_rollup_count(r.rating_counts, report.health_index_rating, direction),
+    skin_condition_counts = analysis_rollup_count(r.skin_condition_counts, skin, direction),
+    updated_at = now();
+
+  IF report.user_id IS NOT NULL THEN
+    INSERT INTO analysis_user_rollups AS r
+      (user_id, day, report_count, health_index_sum, rating_counts, skin_condition_counts)
+    VALUES (
+      report.user_id, report_day, direction, direction * report.health_index_score,
+      jsonb_build_object(report.health_index_rating, direction),
+      jsonb_build_object(skin, direction)
+    )
+    ON CONFLICT (user_id, day) DO UPDATE SET
+      report_count = r.report_count + direction,
+      health_index_sum = r.health_index_sum + direction * report.health_index_score,
+      rating_counts = analysis_rollup_count(r.rating_counts, report.health_index_rating, direction),
+      skin_condition_counts = analysis_rollup_count(r.skin_condition_counts, skin, direction),
+      updated_at = now();
+  END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION update_analysis_rollups()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM apply_analysis_rollup(OLD, -1);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM apply_analysis_rollup(NEW, 1);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS analysis_reports_rollups ON analysis_reports;
+CREATE TRIGGER analysis_reports_rollups
+  AFTER INSERT OR UPDATE OR DELETE ON analysis_reports
+  FOR EACH ROW EXECUTE FUNCTION update_analysis_rollups();
+
+-- Recomputes both rollup tables from analysis_reports. Locks the reports
+-- table against writes while it runs so no trigger update is lost.
+CREATE OR REPLACE FUNCTION rebuild_analysis_rollups()
+RETURNS integer
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  rebuilt integer;
+BEGIN
+  LOCK TABLE analysis_reports IN SHARE MODE;
+  -- WHERE true: pg-safeupdate, which Supabase may enable for PostgREST
+  -- (rebuild_rollups.py calls this over RPC), rejects a DELETE without a
+  -- WHERE clause. DELETE rather than TRUNCATE keeps the old rows readable
+  -- by dashboard queries until the rebuild commits.
+  DELETE FROM analysis_daily_rollups WHERE true;
+  DELETE FROM analysis_user_rollups WHERE true;
+
+  WITH reports AS (
+    SELECT user_id,
+           (created_at AT TIME ZONE 'UTC')::date AS day,
+           health_index_score,
+           health_index_rating,
+           COALESCE(skin_condition, 'None') AS skin
+    FROM analysis_reports
+    WHERE created_at IS NOT NULL
+  ),
+  ratings AS (
+    SELECT day, jsonb_object_agg(health_index_rating, n) AS counts
+    FROM (SELECT day, health_index_rating, count(*) AS n FROM reports GROUP BY 1, 2) t
+    GROUP BY day
+  ),
+  skins AS (
+    SELECT day, jsonb_object_agg(skin, n) AS counts
+    FROM (SELECT day, skin, count(*) AS n FROM reports GROUP BY 1, 2) t
+    GROUP BY day
+  )
+  INSERT INTO analysis_daily_rollups (day, report_count, health_index_sum, rating_counts, skin_condition_counts)
+  SELECT totals.day, totals.n, totals.score_sum, ratings.counts, skins.counts
+  FROM (SELECT day, count(*) AS n, sum(health_index_score) AS score_sum FROM reports GROUP BY day) totals
+  JOIN ratings USING (day)
+  JOIN skins USING (day);
+
+  WITH reports AS (
+    SELECT user_id,
+           (created_at AT TIME ZONE 'UTC')::date AS day,
+           health_index_score,
+           health_index_rating,
+           COALESCE(skin_condition, 'None') AS skin
+    FROM analysis_reports
+    WHERE user_id IS NOT NULL AND created_at IS NOT NULL
+  ),
+  ratings AS (
+    SELECT user_id, day, jsonb_object_agg(health_index_rating, n) AS counts
+    FROM (SELECT user_id, day, health_index_rating, count(*) AS n FROM reports GROUP BY 1, 2, 3) t
+    GROUP BY user_id, day
+  ),
+  skins AS (
+    SELECT user_id, day, jsonb_object_agg(skin, n) AS counts
+    FROM (SELECT user_id, day, skin, count(*) AS n FROM reports GROUP BY 1, 2, 3) t
+    GROUP BY user_id, day
+  )
+  INSERT INTO analysis_user_rollups (user_id, day, report_count, health_index_sum, rating_counts, skin_condition_counts)
+  SELECT totals.user_id, totals.day, totals.n, totals.score_sum, ratings.counts, skins.counts
+  FROM (
+    SELECT user_id, day, count(*) AS n, sum(health_index_score) AS score_sum
+    FROM reports GROUP BY user_id, day
+  ) totals
+  JOIN ratings USING (user_id, day)
+  JOIN skins USING (user_id, day);
+
+  SELECT count(*) INTO rebuilt FROM analysis_reports;
+  RETURN rebuilt;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION apply_analysis_rollup(analysis_reports, integer) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION rebuild_analysis_rollups() FROM PUBLIC, anon, authenticated;
+
+SELECT rebuild_analysis_rollups();